@@ -1,6 +1,7 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import uuid
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -92,7 +93,10 @@ async def add_new_categories():
                 "images": [sample_images['restaurants'][0]],
                 "stock": 100,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -104,7 +108,10 @@ async def add_new_categories():
                 "images": [sample_images['restaurants'][1]],
                 "stock": 50,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -116,7 +123,10 @@ async def add_new_categories():
                 "images": [sample_images['restaurants'][2]],
                 "stock": 80,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             }
         ])
     
@@ -132,7 +142,10 @@ async def add_new_categories():
                 "images": [sample_images['electronics'][0]],
                 "stock": 30,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -144,7 +157,10 @@ async def add_new_categories():
                 "images": [sample_images['electronics'][1]],
                 "stock": 25,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -156,7 +172,10 @@ async def add_new_categories():
                 "images": [sample_images['electronics'][2]],
                 "stock": 15,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             }
         ])
     
@@ -172,7 +191,10 @@ async def add_new_categories():
                 "images": [sample_images['brands'][0]],
                 "stock": 10,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -184,7 +206,10 @@ async def add_new_categories():
                 "images": [sample_images['brands'][1]],
                 "stock": 20,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -196,7 +221,10 @@ async def add_new_categories():
                 "images": [sample_images['brands'][2]],
                 "stock": 35,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             }
         ])
     
@@ -2,6 +2,7 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import bcrypt
 import uuid
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -52,7 +53,7 @@ async def add_supermarket_and_lenovo():
             "phone": "0944444444",
             "role": "store_owner",
             "password_hash": password_hash,
-            "created_at": "2025-01-20T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
         }
         await db.users.insert_one(lenovo_user)
         print("✓ تم إنشاء حساب لينوفو")
@@ -67,7 +68,7 @@ async def add_supermarket_and_lenovo():
             "description": "متجر لينوفو الرسمي في سوريا - أجهزة كمبيوتر وإكسسوارات",
             "status": "approved",
             "logo": "https://images.unsplash.com/photo-1496181133206-80ce9b88a853?w=200",
-            "created_at": "2025-01-20T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
         }
         await db.stores.insert_one(lenovo_store)
         print("✓ تم إنشاء متجر لينوفو (معتمد)")
@@ -86,7 +87,10 @@ async def add_supermarket_and_lenovo():
                     "images": ["https://images.unsplash.com/photo-1588872657578-7efd1f1555ed?w=500"],
                     "stock": 15,
                     "status": "active",
-                    "created_at": "2025-01-20T00:00:00+00:00"
+                    "avg_rating": 0,
+                    "review_count": 0,
+                    "wishlist_count": 0,
+                    "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
                 },
                 {
                     "id": str(uuid.uuid4()),
@@ -98,7 +102,10 @@ async def add_supermarket_and_lenovo():
                     "images": ["https://images.unsplash.com/photo-1496181133206-80ce9b88a853?w=500"],
                     "stock": 25,
                     "status": "active",
-                    "created_at": "2025-01-20T00:00:00+00:00"
+                    "avg_rating": 0,
+                    "review_count": 0,
+                    "wishlist_count": 0,
+                    "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
                 },
                 {
                     "id": str(uuid.uuid4()),
@@ -110,7 +117,10 @@ async def add_supermarket_and_lenovo():
                     "images": ["https://images.unsplash.com/photo-1603302576837-37561b2e2302?w=500"],
                     "stock": 10,
                     "status": "active",
-                    "created_at": "2025-01-20T00:00:00+00:00"
+                    "avg_rating": 0,
+                    "review_count": 0,
+                    "wishlist_count": 0,
+                    "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
                 }
             ]
             await db.products.insert_many(lenovo_products)
@@ -139,7 +149,10 @@ async def add_supermarket_and_lenovo():
                 "images": ["https://images.unsplash.com/photo-1586201375761-83865001e31c?w=500"],
                 "stock": 100,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -151,7 +164,10 @@ async def add_supermarket_and_lenovo():
                 "images": ["https://images.unsplash.com/photo-1474979266404-7eaacbcd87c5?w=500"],
                 "stock": 60,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -163,7 +179,10 @@ async def add_supermarket_and_lenovo():
                 "images": ["https://images.unsplash.com/photo-1621996346565-e3dbc646d9a9?w=500"],
                 "stock": 150,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -175,7 +194,10 @@ async def add_supermarket_and_lenovo():
                 "images": ["https://images.unsplash.com/photo-1582169296194-e4d644c48063?w=500"],
                 "stock": 80,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -187,7 +209,10 @@ async def add_supermarket_and_lenovo():
                 "images": ["https://images.unsplash.com/photo-1563636619-e9143da7973b?w=500"],
                 "stock": 120,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ]
         await db.products.insert_many(supermarket_products)
@@ -1,6 +1,7 @@
 import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import uuid
+from datetime import datetime, timezone
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -111,7 +112,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1518831959646-742c3a14ebf7?w=500"],
                 "stock": 50,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -123,7 +127,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1503944583220-79d8926ad5e2?w=500"],
                 "stock": 80,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -141,7 +148,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1556228578-0d85b1a4d571?w=500"],
                 "stock": 40,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -153,7 +163,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1512496015851-a90fb38ba796?w=500"],
                 "stock": 25,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -171,7 +184,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1550572017-4733e072ea5a?w=500"],
                 "stock": 60,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -189,7 +205,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1515488042361-ee00e0ddd4e4?w=500"],
                 "stock": 100,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -201,7 +220,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1586015555751-63bb77f4322a?w=500"],
                 "stock": 70,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -219,7 +241,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1517836357463-d25dfeac3438?w=500"],
                 "stock": 30,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -231,7 +256,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1601925260368-ae2f83cf8b7f?w=500"],
                 "stock": 45,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -249,7 +277,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1589883661923-6476cb0ae9f2?w=500"],
                 "stock": 50,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -267,7 +298,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1544716278-ca5e3f4abd8c?w=500"],
                 "stock": 90,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
@@ -285,7 +319,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1580480055273-228ff5388ef8?w=500"],
                 "stock": 15,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -297,7 +334,10 @@ async def add_missing_categories():
                 "images": ["https://images.unsplash.com/photo-1507473885765-e6ed057f782c?w=500"],
                 "stock": 40,
                 "status": "active",
-                "created_at": "2025-01-20T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
             }
         ])
     
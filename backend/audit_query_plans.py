@@ -0,0 +1,196 @@
+"""Explain every query shape server.py runs and fail on collection scans.
+
+Usage: python audit_query_plans.py [--no-create]
+
+Indexes from db_indexes.py are created first (unless --no-create), then each
+shape below is explained with the query planner. The script exits non-zero
+if any shape's winning plan contains a COLLSCAN stage. Paged and filtered
+queries are built with server.py's own query builders, sort orders and
+keyset_filter, so the audited shapes match what is run; keep QUERY_SHAPES
+in sync when adding queries to server.py.
+"""
+import argparse
+import asyncio
+import os
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+import chat_archive  # noqa: E402
+import server  # noqa: E402  (reads the environment loaded above)
+from db_indexes import PRODUCT_FILTER_PREFIXES, PRODUCT_SORTS, ensure_indexes  # noqa: E402
+
+X = "audit-placeholder"
+T = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+def paged(name: str, collection: str, query: dict, sort_spec: list) -> list:
+    """A listing's first page and, as the server builds it, a later page"""
+    values = [T if field.endswith('_at') else X for field, _ in sort_spec]
+    after = {"$and": [query, server.keyset_filter(sort_spec, values)]}
+    return [(name, collection, query, sort_spec), (f"{name}, next page", collection, after, sort_spec)]
+
+
+def chat_shapes() -> list:
+    """History pages, catch-up after a cursor and the archiver's batches"""
+    shapes = []
+    for name, query in (("chat with store", server.customer_chat_query(X, X)),
+                        ("store chat messages", {"store_id": X})):
+        shapes += paged(name, "chat_messages", query, server.CHAT_HISTORY_SORT)
+        since = {"$and": [query, server.keyset_filter(server.CHAT_SORT, [T, X])]}
+        shapes.append((f"{name} since cursor", "chat_messages", since, server.CHAT_SORT))
+    shapes.append(("chat messages to archive", "chat_messages", chat_archive.pending_query(X, T),
+                   chat_archive.PENDING_SORT))
+    return shapes
+
+
+def order_shapes() -> list:
+    """Store order pages and the admin export, with each filter they take"""
+    shapes = []
+    filters = {
+        "": server.order_filter(),
+        " by status": server.order_filter(status=X),
+        " in date range": server.order_filter(date_from=T, date_to=T),
+    }
+    for suffix, query in filters.items():
+        shapes += paged(f"orders of store{suffix}", "orders", {"items.store_id": X, **query}, server.ORDER_SORT)
+        shapes += paged(f"order export{suffix}", "orders", query, server.EXPORT_SORT)
+        shapes += paged(f"order export of store{suffix}", "orders", {**query, "items.store_id": X},
+                        server.EXPORT_SORT)
+    return shapes
+
+# (name, collection, filter, sort)
+QUERY_SHAPES = [
+    ("user by id", "users", {"id": X}, None),
+    ("user by email", "users", {"email": X}, None),
+    ("reset code lookup", "password_resets", {"email": X, "code": X, "used": False}, None),
+    ("reset codes by email", "password_resets", {"email": X}, None),
+    ("stores by status", "stores", {"status": X}, None),
+    ("stores by owner", "stores", {"owner_id": X}, None),
+    ("approved store of owner", "stores", {"owner_id": X, "status": "approved"}, None),
+    ("store by id", "stores", {"id": X}, None),
+    ("product by id", "products", {"id": X}, None),
+    ("products by ids", "products", {"id": {"$in": [X]}}, None),
+    ("products of store", "products", {"store_id": X}, None),
+    ("similar products", "products", {"category_id": X, "id": {"$ne": X}, "status": "active"}, None),
+    ("cart of user", "carts", {"user_id": X}, None),
+    ("wishlist of user", "wishlists", {"user_id": X}, None),
+    ("orders of customer", "orders", {"customer_id": X}, None),
+    ("order by id", "orders", {"id": X}, None),
+    ("review by id", "reviews", {"id": X}, None),
+    ("review of user for product", "reviews", {"product_id": X, "user_id": X}, None),
+    ("coupon by code", "coupons", {"code": X}, None),
+    ("active coupon by code", "coupons", {"code": X, "active": True}, None),
+    ("coupon counter shard", "coupon_counters", {"code": X, "shard": X}, None),
+    ("coupon counter with uses left", "coupon_counters", {"code": X, "remaining": {"$gt": X}}, None),
+    ("counters of coupons", "coupon_counters", {"code": {"$in": [X]}}, None),
+    ("payment by session", "payment_transactions", {"session_id": X}, None),
+    ("archived chat messages by ids", "chat_messages",
+     {"store_id": X, "created_at": {"$lte": X}, "id": {"$in": [X]}}, None),
+    ("archived chat of store and customer", "chat_archive",
+     {"store_id": X, "customer_id": X, "first_at": {"$lte": X}}, [("first_at", -1)]),
+    ("newest archive bucket of conversation", "chat_archive", {"store_id": X, "customer_id": X}, [("first_at", -1)]),
+    ("job lease by id", "job_leases", {"id": X}, None),
+    ("conversation of store and customer", "conversations", {"store_id": X, "customer_id": X}, None),
+    *paged("store chat inbox", "conversations", {"store_id": X}, server.CONVERSATION_SORT),
+    *paged("customer chat inbox", "conversations", {"customer_id": X}, server.CONVERSATION_SORT),
+    ("due outbox emails", "email_outbox", {"status": "pending", "next_attempt_at": {"$lte": X}}, [("next_attempt_at", 1)]),
+    ("lapsed outbox leases", "email_outbox", {"status": "sending", "locked_until": {"$lte": X}}, None),
+    ("outbox email by id", "email_outbox", {"id": X}, None),
+    ("all complaints", "complaints", {}, [("created_at", -1)]),
+    ("complaints of customer", "complaints", {"customer_id": X}, [("created_at", -1)]),
+    ("complaint by id", "complaints", {"id": X}, None),
+    *[shape for sort_by, sort_spec in server.REVIEW_SORTS.items()
+      for shape in paged(f"reviews of product, {sort_by}", "reviews", {"product_id": X}, sort_spec)],
+    *chat_shapes(),
+    *order_shapes(),
+]
+
+# Whole-collection listings; scanning is the point of these queries
+FULL_SCANS = [
+    ("all categories", "categories", {}, None),
+    ("all stores", "stores", {}, None),
+    ("all products (search index build)", "products", {}, None),
+    ("all orders", "orders", {}, None),
+    ("all coupons", "coupons", {}, None),
+    ("all users", "users", {}, None),
+]
+
+
+def product_list_shapes() -> list:
+    """Every filter/sort combination GET /api/products can issue"""
+    shapes = []
+    for prefix in PRODUCT_FILTER_PREFIXES:
+        filters = {field: X for field, _ in prefix}
+        for sort_by, sort_spec in PRODUCT_SORTS.items():
+            name = f"product list {list(filters)} sort={sort_by}"
+            shapes += paged(name, "products", server.build_product_query(**filters), sort_spec)
+            priced = server.build_product_query(**filters, min_price=0, max_price=100)
+            shapes += paged(f"{name} +price", "products", priced, sort_spec)
+    return shapes
+
+
+def plan_stages(plan) -> list:
+    stages = []
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            stages.append(plan['stage'])
+        for value in plan.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(plan, list):
+        for item in plan:
+            stages.extend(plan_stages(item))
+    return stages
+
+
+async def explain(db, collection: str, query: dict, sort) -> list:
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    result = await db.command({"explain": command, "verbosity": "queryPlanner"})
+    return plan_stages(result['queryPlanner']['winningPlan'])
+
+
+async def audit(create: bool) -> int:
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    if create:
+        failures = await ensure_indexes(db)
+        for collection, keys, error in failures:
+            print(f"⚠️  index {keys} on {collection} not created: {error}")
+
+    scans = []
+    for name, collection, query, sort in QUERY_SHAPES + product_list_shapes():
+        stages = await explain(db, collection, query, sort)
+        if 'COLLSCAN' in stages:
+            scans.append(name)
+            print(f"❌ {name}: {' <- '.join(stages)}")
+        else:
+            print(f"✓ {name}: {' <- '.join(stages)}")
+
+    for name, collection, query, sort in FULL_SCANS:
+        stages = await explain(db, collection, query, sort)
+        print(f"-  {name} (full listing): {' <- '.join(stages)}")
+
+    client.close()
+
+    if scans:
+        print(f"\n❌ {len(scans)} query shapes still scan their collection")
+        return 1
+    print("\n✅ No collection scans")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--no-create', action='store_true', help="audit existing indexes only")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(audit(create=not args.no_create)))
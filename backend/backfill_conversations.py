@@ -0,0 +1,95 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+import uuid
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def tag_message_customers(db) -> int:
+    """Set customer_id on chat messages stored before it was recorded. The
+    customer is whoever wrote to the store: the receiver of the store
+    owner's own messages and the sender of everyone else's."""
+    owners = {s['id']: s.get('owner_id') async for s in db.stores.find({}, {"_id": 0, "id": 1, "owner_id": 1})}
+    tagged = 0
+    for store_id in await db.chat_messages.distinct("store_id", {"customer_id": {"$exists": False}}):
+        owner_id = owners.get(store_id)
+        if owner_id is None:
+            # Store is gone; its owner's messages can no longer be told apart
+            customer = {"$cond": [{"$eq": ["$sender_type", "customer"]}, "$sender_id", "$receiver_id"]}
+        else:
+            customer = {"$cond": [{"$eq": ["$sender_id", owner_id]}, "$receiver_id", "$sender_id"]}
+        result = await db.chat_messages.update_many(
+            {"store_id": store_id, "customer_id": {"$exists": False}},
+            [{"$set": {"customer_id": customer}}]
+        )
+        tagged += result.modified_count
+    return tagged
+
+async def backfill_conversations():
+    """Build the conversations collection from chat messages sent before it
+    existed. Unread counts start at zero; conversations that already have a
+    newer last message keep it."""
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=== Backfilling chat conversations ===\n")
+
+    print(f"✓ Recorded the customer of {await tag_message_customers(db)} chat messages")
+
+    stores = {s['id']: s.get('store_name') async for s in db.stores.find({}, {"_id": 0, "id": 1, "store_name": 1})}
+    pipeline = [
+        {"$sort": {"created_at": 1, "id": 1}},
+        # customer_id is the one update_conversation() files the message under
+        {"$group": {
+            "_id": {"store_id": "$store_id", "customer_id": "$customer_id"},
+            "first_at": {"$first": "$created_at"},
+            "last": {"$last": {
+                "created_at": "$created_at", "id": "$id", "sender_type": "$sender_type", "message": "$message"
+            }},
+            # Name the customer used on their latest message, if any
+            "customer_names": {"$push": {"$cond": [
+                {"$eq": ["$sender_id", "$customer_id"]}, "$sender_name", "$$REMOVE"
+            ]}},
+        }},
+    ]
+
+    upserted = 0
+    batch = []
+    async for row in db.chat_messages.aggregate(pipeline, allowDiskUse=True):
+        store_id, customer_id = row['_id']['store_id'], row['_id']['customer_id']
+        names = row['customer_names']
+        batch.append(UpdateOne(
+            {"store_id": store_id, "customer_id": customer_id},
+            {
+                "$max": {"last_message_at": row['last']['created_at'], "last_message": row['last']},
+                "$setOnInsert": {
+                    "id": str(uuid.uuid4()),
+                    "store_name": stores.get(store_id),
+                    "customer_name": names[-1] if names else None,
+                    "created_at": row['first_at'],
+                    "unread_store": 0,
+                    "unread_customer": 0,
+                },
+            },
+            upsert=True
+        ))
+        if len(batch) >= BATCH_SIZE:
+            upserted += (await db.conversations.bulk_write(batch, ordered=False)).upserted_count
+            batch = []
+    if batch:
+        upserted += (await db.conversations.bulk_write(batch, ordered=False)).upserted_count
+
+    print(f"✓ Created {upserted} conversations")
+
+    client.close()
+    print("\n✅ Backfill complete")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_conversations())
@@ -0,0 +1,53 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def backfill_order_stores():
+    """Stamp store_id on items of orders placed before checkout recorded it"""
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=== Backfilling store_id on order items ===\n")
+
+    query = {"items": {"$elemMatch": {"store_id": {"$exists": False}}}}
+    updated = 0
+    unknown = 0
+    while True:
+        orders = await db.orders.find(query, {"_id": 1, "items": 1}).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+        if not orders:
+            break
+
+        product_ids = {item.get('product_id') for order in orders for item in order['items']}
+        stores = {
+            p['id']: p.get('store_id')
+            async for p in db.products.find({"id": {"$in": list(product_ids)}}, {"_id": 0, "id": 1, "store_id": 1})
+        }
+
+        batch = []
+        for order in orders:
+            items = []
+            for item in order['items']:
+                if 'store_id' not in item:
+                    # Deleted products keep a null store_id so the order is not selected again
+                    item = dict(item, store_id=stores.get(item.get('product_id')))
+                    unknown += item['store_id'] is None
+                items.append(item)
+            batch.append(UpdateOne({"_id": order['_id']}, {"$set": {"items": items}}))
+        updated += (await db.orders.bulk_write(batch, ordered=False)).modified_count
+
+    print(f"✓ Updated {updated} orders ({unknown} items of deleted products left without a store)")
+
+    client.close()
+    print("\n✅ Backfill complete")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_order_stores())
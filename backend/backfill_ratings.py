@@ -0,0 +1,67 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def backfill_ratings():
+    """Recompute avg_rating/review_count/rating_sum and the star histogram on
+    every product from its reviews, and give older reviews a helpful_count so
+    they page correctly"""
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+    
+    print("=== Backfilling product rating aggregates ===\n")
+    
+    result = await db.reviews.update_many({"helpful_count": {"$exists": False}}, {"$set": {"helpful_count": 0}})
+    print(f"✓ Set helpful_count on {result.modified_count} reviews")
+    
+    empty_histogram = {str(star): 0 for star in range(1, 6)}
+    pipeline = [
+        {"$group": {"_id": {"product_id": "$product_id", "rating": "$rating"}, "count": {"$sum": 1}}},
+        {"$group": {
+            "_id": "$_id.product_id",
+            "stars": {"$push": {"rating": "$_id.rating", "count": "$count"}},
+            "rating_sum": {"$sum": {"$multiply": ["$_id.rating", "$count"]}},
+            "review_count": {"$sum": "$count"}
+        }}
+    ]
+    aggregates = {}
+    async for row in db.reviews.aggregate(pipeline, allowDiskUse=True):
+        histogram = dict(empty_histogram)
+        for star in row['stars']:
+            histogram[str(star['rating'])] = star['count']
+        aggregates[row['_id']] = {
+            "rating_sum": row['rating_sum'],
+            "review_count": row['review_count'],
+            "avg_rating": row['rating_sum'] / row['review_count'],
+            "rating_histogram": histogram
+        }
+    
+    # One $set per product, no reset first, so reviews posted while this
+    # runs are not wiped out in between. Products without reviews get zeros.
+    no_reviews = {"avg_rating": 0, "review_count": 0, "rating_sum": 0, "rating_histogram": empty_histogram}
+    updated = 0
+    batch = []
+    async for product in db.products.find({}, {"_id": 0, "id": 1}):
+        batch.append(UpdateOne({"id": product['id']}, {"$set": aggregates.get(product['id'], no_reviews)}))
+        if len(batch) >= BATCH_SIZE:
+            updated += (await db.products.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.products.bulk_write(batch, ordered=False)).modified_count
+    
+    print(f"✓ Updated {updated} products ({len(aggregates)} with reviews)")
+    
+    client.close()
+    print("\n✅ Backfill complete")
+
+if __name__ == "__main__":
+    asyncio.run(backfill_ratings())
@@ -0,0 +1,109 @@
+"""Concurrent add-to-cart benchmark: read-modify-write vs atomic updates.
+
+Usage: python bench_cart.py --db <scratch db> [--concurrency 50] [--ops 20] [--products 5]
+
+Runs `concurrency` tasks that each add one unit of a product to the same
+user's cart `ops` times, first with the old find/modify/$set approach, then
+with cart_ops.add_item. Every add should show up in the final quantities;
+the report lists lost updates and per-operation latency percentiles.
+Needs a real MongoDB (MONGO_URL) and runs only against a scratch database
+(--db or LOADTEST_DB_NAME, never DB_NAME); the benchmark carts are deleted
+afterwards, even if a run fails.
+"""
+import argparse
+import asyncio
+import os
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import bench_db
+import cart_ops
+from metrics import LatencyStat
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def legacy_add_item(db, user_id: str, product_id: str, quantity: int):
+    """add_to_cart as it was: read the cart, edit items in Python, write it back"""
+    cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0})
+    if not cart:
+        cart = {"id": str(uuid.uuid4()), "user_id": user_id, "items": [],
+                "updated_at": datetime.now(timezone.utc)}
+        await db.carts.insert_one(dict(cart))
+    items = cart.get('items', [])
+    existing_item = next((i for i in items if i['product_id'] == product_id), None)
+    if existing_item:
+        existing_item['quantity'] += quantity
+    else:
+        items.append({"product_id": product_id, "quantity": quantity})
+    await db.carts.update_one(
+        {"user_id": user_id},
+        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc)}}
+    )
+
+
+async def run(db, name: str, add, concurrency: int, ops: int, products: int):
+    user_id = f"bench-{uuid.uuid4()}"
+    latency = LatencyStat(window=concurrency * ops)
+    errors = 0
+
+    async def worker(worker_id: int):
+        nonlocal errors
+        for i in range(ops):
+            product_id = f"bench-product-{(worker_id + i) % products}"
+            start = time.perf_counter()
+            try:
+                await add(db, user_id, product_id, 1)
+            except Exception:
+                # e.g. the legacy insert racing on the unique user_id index
+                errors += 1
+            latency.observe(time.perf_counter() - start)
+
+    try:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(w) for w in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+        cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0}) or {}
+        stored = sum(item['quantity'] for item in cart.get('items', []))
+    finally:
+        await db.carts.delete_many({"user_id": user_id})
+
+    expected = concurrency * ops
+    stats = latency.snapshot()
+    print(f"{name}:")
+    print(f"  adds: {expected}, stored: {stored}, lost: {expected - stored}, errors: {errors}")
+    print(f"  p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, max {stats['max_ms']} ms, "
+          f"{expected / elapsed:.0f} adds/s")
+    return expected - stored
+
+
+async def bench(db_name: str, concurrency: int, ops: int, products: int):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
+    try:
+        db = await bench_db.open_scratch_db(client, db_name)
+        print(f"=== {concurrency} concurrent clients x {ops} adds over {products} products ===\n")
+        await run(db, "read-modify-write", legacy_add_item, concurrency, ops, products)
+        lost = await run(db, "atomic (cart_ops)", cart_ops.add_item, concurrency, ops, products)
+    finally:
+        client.close()
+
+    print("\n✅ No lost updates" if lost == 0 else f"\n❌ {lost} lost updates with atomic adds")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_db.add_argument(parser)
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--ops', type=int, default=20, help="adds per client")
+    parser.add_argument('--products', type=int, default=5, help="distinct products added")
+    args = parser.parse_args()
+    db_name = bench_db.scratch_db_name(args.db)
+    asyncio.run(bench(db_name, args.concurrency, args.ops, args.products))
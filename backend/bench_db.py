@@ -0,0 +1,34 @@
+"""Scratch database for the benchmark and load-test scripts.
+
+Those scripts insert and modify documents, so they never touch the app's
+DB_NAME: the database comes from --db or LOADTEST_DB_NAME and must be a
+different one. The app's indexes are created in it first, so the scripts
+see the same constraints and query plans as the server.
+"""
+import argparse
+import os
+from typing import Optional
+
+from db_indexes import ensure_indexes
+
+
+def add_argument(parser: argparse.ArgumentParser):
+    parser.add_argument('--db', help="scratch database to write to (default: $LOADTEST_DB_NAME); "
+                                     "must not be DB_NAME")
+
+
+def scratch_db_name(requested: Optional[str]) -> str:
+    """The database named by --db or LOADTEST_DB_NAME; exits if there is
+    none or it is the app's own"""
+    name = requested or os.environ.get('LOADTEST_DB_NAME')
+    if not name:
+        raise SystemExit("❌ Pass --db or set LOADTEST_DB_NAME to a scratch database")
+    if name == os.environ.get('DB_NAME'):
+        raise SystemExit(f"❌ Refusing to write benchmark data to the app database {name!r}")
+    return name
+
+
+async def open_scratch_db(client, name: str):
+    db = client[name]
+    await ensure_indexes(db)
+    return db
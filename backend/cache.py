@@ -0,0 +1,109 @@
+"""Small in-process caches for read-heavy endpoints."""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Tuple
+
+
+class TTLCache:
+    """LRU cache whose entries also expire `ttl` seconds after being set."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+
+class ResponseCache:
+    """TTL/LRU cache of rendered responses, invalidated by tag.
+
+    Each entry is stored with the tags it was built from (e.g. "products",
+    "product:<id>") and the generation of each tag at load time. Writers call
+    invalidate() with the tags they touched, which bumps those generations so
+    dependent entries read as misses - including entries whose load was
+    still in flight when the write happened.
+
+    Generations come from one counter, and only the `max_tags` most recently
+    invalidated tags keep their own. The others read as the highest
+    generation dropped so far, so dropping a tag can only turn entries into
+    misses, never bring back a stale one.
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0, max_tags: int = 4096):
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.max_tags = max_tags
+        self._generations: "OrderedDict[str, int]" = OrderedDict()
+        self._counter = 0
+        self._floor = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hits(self) -> int:
+        return self._entries.hits
+
+    @property
+    def misses(self) -> int:
+        return self._entries.misses
+
+    def generation(self, tags: Iterable[str]) -> Tuple[int, ...]:
+        return tuple(self._generations.get(tag, self._floor) for tag in tags)
+
+    def get(self, key: Hashable) -> Any:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        tags, generation, value = entry
+        if self.generation(tags) != generation:
+            # An invalidated entry is a miss, not the hit TTLCache counted
+            self._entries.pop(key)
+            self._entries.hits -= 1
+            self._entries.misses += 1
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, tags: Tuple[str, ...], generation: Tuple[int, ...]):
+        """Store `value` unless one of `tags` was invalidated since `generation`"""
+        if self.generation(tags) == generation:
+            self._entries.set(key, (tags, generation, value))
+
+    def invalidate(self, *tags: str):
+        for tag in tags:
+            self._counter += 1
+            self._generations[tag] = self._counter
+            self._generations.move_to_end(tag)
+        while len(self._generations) > self.max_tags:
+            _, generation = self._generations.popitem(last=False)
+            self._floor = max(self._floor, generation)
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,81 @@
+"""Cart mutations as single atomic updates.
+
+Each operation is one update_one against the user's cart document (upserting
+it when missing), so concurrent requests from the same user cannot overwrite
+each other's changes the way a read-modify-write of the items array can.
+"""
+import uuid
+from datetime import datetime, timezone
+from typing import Iterable, List
+
+from pymongo.errors import DuplicateKeyError
+
+
+def _merge_item(product_id: str, updated_quantity, new_quantity: int) -> list:
+    """Update pipeline setting the line of `product_id` to `updated_quantity`
+    (an expression over the existing line, $$this), or appending a line of
+    `new_quantity` if the cart has none"""
+    product = {"$literal": product_id}
+    items = {"$ifNull": ["$items", []]}
+    return [{"$set": {
+        "id": {"$ifNull": ["$id", str(uuid.uuid4())]},
+        "items": {"$cond": [
+            {"$in": [product, {"$ifNull": ["$items.product_id", []]}]},
+            {"$map": {"input": items, "in": {"$cond": [
+                {"$eq": ["$$this.product_id", product]},
+                {"$mergeObjects": ["$$this", {"quantity": updated_quantity}]},
+                "$$this",
+            ]}}},
+            {"$concatArrays": [items, [{"product_id": product, "quantity": {"$literal": new_quantity}}]]},
+        ]},
+        "updated_at": datetime.now(timezone.utc),
+    }}]
+
+
+async def _upsert(db, user_id: str, update) -> None:
+    try:
+        await db.carts.update_one({"user_id": user_id}, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent request created the cart first; now it matches
+        await db.carts.update_one({"user_id": user_id}, update, upsert=True)
+
+
+async def add_item(db, user_id: str, product_id: str, quantity: int) -> None:
+    """Add `quantity` of a product, creating the cart or the line as needed"""
+    await _upsert(db, user_id, _merge_item(product_id, {"$add": ["$$this.quantity", quantity]}, quantity))
+
+
+async def set_quantity(db, user_id: str, product_id: str, quantity: int) -> None:
+    """Set a line's quantity; zero or less removes it"""
+    if quantity <= 0:
+        await remove_item(db, user_id, product_id)
+        return
+    await _upsert(db, user_id, _merge_item(product_id, {"$literal": quantity}, quantity))
+
+
+async def remove_item(db, user_id: str, product_id: str) -> bool:
+    """Pull a product from the cart. False if the user has no cart."""
+    result = await db.carts.update_one(
+        {"user_id": user_id},
+        {"$pull": {"items": {"product_id": product_id}},
+         "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+    return result.matched_count > 0
+
+
+def normalize_items(items: Iterable[dict]) -> List[dict]:
+    """Sum duplicate lines and drop non-positive quantities, keeping order"""
+    quantities = {}
+    for item in items:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    return [{"product_id": pid, "quantity": qty} for pid, qty in quantities.items() if qty > 0]
+
+
+async def replace_items(db, user_id: str, items: Iterable[dict]) -> List[dict]:
+    """Replace the whole cart with `items`; returns the stored lines"""
+    lines = normalize_items(items)
+    await _upsert(db, user_id, {
+        "$set": {"items": lines, "updated_at": datetime.now(timezone.utc)},
+        "$setOnInsert": {"id": str(uuid.uuid4())},
+    })
+    return lines
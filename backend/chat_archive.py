@@ -0,0 +1,260 @@
+"""Moves old chat messages out of chat_messages into compressed buckets.
+
+Every message stays in chat_messages, and in its (store_id, created_at, id)
+index, forever unless something moves it; most of them are never read
+again. ChatArchiver runs in the background and, every ARCHIVE_INTERVAL
+seconds, takes messages older than CHAT_ARCHIVE_AFTER_DAYS out of
+chat_messages. They are stored in chat_archive as buckets, one per
+conversation per batch:
+
+    {id, store_id, customer_id, first_at, last_at, last_id, count, data}
+
+where data is the bucket's messages, oldest first, BSON-encoded and zlib
+compressed. The hot collection and its index then only hold recent
+messages, and history pages older than them come from read_before().
+
+Messages are archived oldest first, and a bucket is written before its
+messages are deleted. If a run dies in between, the next one finds those
+messages at or before the conversation's newest bucket, checks that the
+buckets hold them and only deletes them; until then read_before() skips
+messages still in chat_messages. Any the buckets turn out not to hold are
+flagged archive_skipped and left in chat_messages, so later runs move on
+past them. Only the worker holding the lease in job_leases archives, so
+concurrent servers do not race each other.
+
+Messages are grouped by their stored customer_id. Messages written before
+that field existed are left alone until backfill_conversations.py sets it.
+
+Set CHAT_ARCHIVE_AFTER_DAYS=0 to turn archiving off.
+"""
+import asyncio
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Optional, Set, Tuple
+
+import bson
+from bson.codec_options import CodecOptions
+from pymongo.errors import DuplicateKeyError
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_AFTER_DAYS = float(os.environ.get('CHAT_ARCHIVE_AFTER_DAYS', 90))
+ARCHIVE_INTERVAL = float(os.environ.get('CHAT_ARCHIVE_INTERVAL', 3600))
+BATCH_SIZE = 500
+LEASE_ID = "chat_archive"
+LEASE_SECONDS = 600
+
+_CODEC_OPTIONS = CodecOptions(tz_aware=True, tzinfo=timezone.utc)
+# Oldest first, the order messages are archived in
+PENDING_SORT = [("created_at", 1), ("id", 1)]
+
+
+def customer_of(message: dict) -> str:
+    return message['customer_id']
+
+
+def build_bucket(store_id: str, customer_id: str, messages: List[dict]) -> dict:
+    """Archive document for `messages` of one conversation, oldest first"""
+    payload = bson.encode({"messages": [{k: v for k, v in m.items() if k != '_id'} for m in messages]})
+    return {
+        "id": f"{store_id}:{customer_id}:{messages[0]['id']}",
+        "store_id": store_id,
+        "customer_id": customer_id,
+        "first_at": messages[0]['created_at'],
+        "last_at": messages[-1]['created_at'],
+        "last_id": messages[-1]['id'],
+        "count": len(messages),
+        "data": zlib.compress(payload, 6),
+    }
+
+
+def bucket_messages(bucket: dict) -> List[dict]:
+    return bson.decode(zlib.decompress(bucket['data']), codec_options=_CODEC_OPTIONS)['messages']
+
+
+async def read_before(db, store_id: str, customer_id: str, before: Optional[Tuple[datetime, str]],
+                      limit: int, skip_ids: Iterable[str] = ()) -> List[dict]:
+    """Up to `limit` archived messages of a conversation from before the
+    (created_at, id) pair `before` (or the newest ones), newest first"""
+    query = {"store_id": store_id, "customer_id": customer_id}
+    if before is not None:
+        query["first_at"] = {"$lte": before[0]}
+    skip_ids = set(skip_ids)
+    messages = []
+    async for bucket in db.chat_archive.find(query, {"_id": 0}).sort("first_at", -1).batch_size(4):
+        for message in reversed(bucket_messages(bucket)):
+            if before is not None and (message['created_at'], message['id']) >= before:
+                continue
+            if message['id'] in skip_ids:
+                continue
+            messages.append(message)
+            if len(messages) >= limit:
+                return messages
+    return messages
+
+
+async def archived_until(db, store_id: str, customer_id: str) -> Optional[Tuple[datetime, str]]:
+    """(created_at, id) of the conversation's newest archived message"""
+    bucket = await db.chat_archive.find_one(
+        {"store_id": store_id, "customer_id": customer_id}, {"_id": 0, "last_at": 1, "last_id": 1},
+        sort=[("first_at", -1)]
+    )
+    return (bucket['last_at'], bucket['last_id']) if bucket else None
+
+
+async def archived_ids(db, store_id: str, customer_id: str, since: datetime) -> Set[str]:
+    """Ids of the conversation's archived messages from `since` on"""
+    ids = set()
+    async for bucket in db.chat_archive.find(
+        {"store_id": store_id, "customer_id": customer_id}, {"_id": 0}
+    ).sort("first_at", -1).batch_size(4):
+        if bucket['last_at'] < since:
+            break
+        ids.update(m['id'] for m in bucket_messages(bucket))
+    return ids
+
+
+def pending_query(store_id: str, cutoff: datetime) -> dict:
+    """The store's messages that are due for archiving"""
+    return {"store_id": store_id, "created_at": {"$lt": cutoff},
+            "customer_id": {"$exists": True}, "archive_skipped": {"$ne": True}}
+
+
+async def archive_store(db, store_id: str, cutoff: datetime) -> Tuple[int, int]:
+    """Archive one batch of the store's messages older than `cutoff`;
+    returns how many were looked at and how many of those were moved"""
+    messages = await db.chat_messages.find(
+        pending_query(store_id, cutoff), {"_id": 0}
+    ).sort(PENDING_SORT).limit(BATCH_SIZE).to_list(BATCH_SIZE)
+    if not messages:
+        return 0, 0
+
+    conversations = {}
+    for message in messages:
+        conversations.setdefault(customer_of(message), []).append(message)
+    buckets = []
+    moved = []
+    skipped = []
+    for customer_id, group in conversations.items():
+        # Messages at or before the newest archived one were archived by a
+        # run that stopped before deleting them; they only need deleting,
+        # once the buckets are confirmed to hold them
+        until = await archived_until(db, store_id, customer_id)
+        done = [m for m in group if until is not None and (m['created_at'], m['id']) <= until]
+        fresh = group[len(done):]
+        if done:
+            stored = await archived_ids(db, store_id, customer_id, done[0]['created_at'])
+            missing = [m['id'] for m in done if m['id'] not in stored]
+            if missing:
+                # Should not happen; keep them rather than lose them
+                logger.warning(f"{len(missing)} chat messages of {store_id}/{customer_id} predate "
+                               f"the archive but are not in it; leaving them in chat_messages")
+                skipped += missing
+            moved += [m for m in done if m['id'] in stored]
+        if fresh:
+            buckets.append(build_bucket(store_id, customer_id, fresh))
+            moved += fresh
+    if skipped:
+        await db.chat_messages.update_many(
+            {"store_id": store_id, "id": {"$in": skipped}}, {"$set": {"archive_skipped": True}}
+        )
+    if buckets:
+        await db.chat_archive.insert_many(buckets, ordered=False)
+    if moved:
+        await db.chat_messages.delete_many({
+            "store_id": store_id,
+            "created_at": {"$lte": messages[-1]['created_at']},
+            "id": {"$in": [m['id'] for m in moved]},
+        })
+    return len(messages), len(moved)
+
+
+async def acquire_lease(db, owner: str) -> bool:
+    """Take or renew the archiver lease; False while another worker holds it"""
+    now = datetime.now(timezone.utc)
+    try:
+        await db.job_leases.update_one(
+            {"id": LEASE_ID, "$or": [{"owner": owner}, {"locked_until": {"$lte": now}}]},
+            {"$set": {"owner": owner, "locked_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+class ChatArchiver:
+    def __init__(self, db, after_days: float = ARCHIVE_AFTER_DAYS, interval: float = ARCHIVE_INTERVAL):
+        self.db = db
+        self.after_days = after_days
+        self.interval = interval
+        self.owner = f"{os.getpid()}-{id(self):x}"
+
+        self.runs = 0
+        self.archived = 0
+        self.last_run_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def enabled(self) -> bool:
+        return self.after_days > 0
+
+    def start(self):
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def run_once(self) -> int:
+        """Archive everything currently past the cutoff; returns how many
+        messages were moved, or 0 if another worker holds the lease"""
+        if not await acquire_lease(self.db, self.owner):
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=self.after_days)
+        moved = await self._archive(cutoff)
+        self.runs += 1
+        self.archived += moved
+        self.last_run_at = datetime.now(timezone.utc)
+        if moved:
+            logger.info(f"Archived {moved} chat messages older than {cutoff.isoformat()}")
+        return moved
+
+    async def _archive(self, cutoff: datetime) -> int:
+        moved = 0
+        for store_id in await self.db.chat_messages.distinct("store_id"):
+            while True:
+                scanned, count = await archive_store(self.db, store_id, cutoff)
+                moved += count
+                if scanned < BATCH_SIZE:
+                    break
+                if not await acquire_lease(self.db, self.owner):
+                    # The run outlasted the lease and another worker took over
+                    logger.warning("Chat archive lease lost mid-run")
+                    return moved
+        return moved
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Chat archive run failed")
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "after_days": self.after_days,
+            "runs": self.runs,
+            "archived": self.archived,
+            "last_run_at": self.last_run_at.isoformat() if self.last_run_at else None,
+        }
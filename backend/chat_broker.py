@@ -0,0 +1,100 @@
+"""In-process publish/subscribe for pushing chat messages to open streams.
+
+Each subscriber gets a bounded queue. publish() never waits: a subscriber
+whose queue is full is overflowed and dropped, its stream ends, and the
+client reconnects with its last cursor and catches up from MongoDB. One
+slow reader therefore cannot hold up senders or grow memory without bound.
+
+Subscriptions only see messages published by this process. The streams in
+server.py also poll MongoDB while idle, so messages sent through another
+worker still arrive, just later.
+"""
+import asyncio
+from typing import Dict, Iterable, Optional, Set
+
+
+class Subscription:
+    def __init__(self, broker: "ChatBroker", topics: Iterable[str], maxsize: int):
+        self.broker = broker
+        self.topics = tuple(topics)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+        self.closed = False
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        """Next message, or None if none arrived within `timeout` seconds
+        or the subscription was closed"""
+        if self.closed:
+            return None
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broker._remove(self)
+            # Wake a reader blocked in get()
+            try:
+                self.queue.put_nowait(None)
+            except asyncio.QueueFull:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChatBroker:
+    def __init__(self, queue_size: int = 100):
+        self.queue_size = queue_size
+        self._topics: Dict[str, Set[Subscription]] = {}
+        self.published = 0
+        self.delivered = 0
+        self.overflows = 0
+
+    def subscribe(self, *topics: str) -> Subscription:
+        subscription = Subscription(self, topics, self.queue_size)
+        for topic in subscription.topics:
+            self._topics.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def publish(self, topics: Iterable[str], message: dict):
+        """Queue `message` for every subscriber of any of `topics`, once each"""
+        self.published += 1
+        subscribers = set()
+        for topic in topics:
+            subscribers.update(self._topics.get(topic, ()))
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+                self.delivered += 1
+            except asyncio.QueueFull:
+                self.overflows += 1
+                subscription.overflowed = True
+                subscription.close()
+
+    def close(self):
+        """End every subscription, e.g. at shutdown so open streams finish"""
+        for subscription in {s for subs in self._topics.values() for s in subs}:
+            subscription.close()
+
+    def _remove(self, subscription: Subscription):
+        for topic in subscription.topics:
+            subscribers = self._topics.get(topic)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._topics[topic]
+
+    def stats(self) -> dict:
+        return {
+            "topics": len(self._topics),
+            "subscribers": len({s for subs in self._topics.values() for s in subs}),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflows": self.overflows,
+        }
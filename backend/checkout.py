@@ -0,0 +1,140 @@
+"""Turning a cart into an order without overselling.
+
+place_order() prices the cart with one $in query, then reserves stock with
+conditional decrements ({"stock": {"$gte": quantity}}), redeems the coupon
+on one of its sharded counters (see coupons.py), inserts the order and
+empties the cart.
+
+On a replica set (a single-node one is enough for development) all of that
+runs in one multi-document transaction: a checkout that cannot get every
+line's stock aborts as a whole, and concurrent checkouts that touch the same
+product are retried by with_transaction. On a standalone server the same
+guarded writes run without a session, and stock and coupon reservations are
+handed back if a later step fails.
+"""
+import asyncio
+from typing import Callable, List, Optional
+
+from pymongo import UpdateOne
+
+import coupons
+
+PRODUCT_FIELDS = {"_id": 0, "id": 1, "name": 1, "price": 1, "stock": 1, "store_id": 1}
+
+
+class EmptyCart(Exception):
+    pass
+
+
+class OutOfStock(Exception):
+    def __init__(self, products: List[str]):
+        super().__init__(", ".join(products))
+        self.products = products
+
+
+async def supports_transactions(db) -> bool:
+    hello = await db.command("hello")
+    return bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+
+
+async def _short_products(db, lines: list) -> List[str]:
+    """Names of the lines whose product does not have enough stock left"""
+    stock = {p['id']: p.get('stock', 0) async for p in db.products.find(
+        {"id": {"$in": [product['id'] for product, _ in lines]}}, {"_id": 0, "id": 1, "stock": 1}
+    )}
+    return [product['name'] for product, quantity in lines if stock.get(product['id'], 0) < quantity]
+
+
+async def _reserve_stock(db, lines: list, session, rollback: list):
+    if session is not None:
+        result = await db.products.bulk_write([
+            UpdateOne({"id": product['id'], "stock": {"$gte": quantity}}, {"$inc": {"stock": -quantity}})
+            for product, quantity in lines
+        ], ordered=False, session=session)
+        if result.modified_count < len(lines):
+            # Raising aborts the transaction, which undoes the other lines
+            raise OutOfStock(await _short_products(db, lines) or [product['name'] for product, _ in lines])
+        return
+
+    # No transaction: decrement line by line so the ones that succeeded can be returned
+    results = await asyncio.gather(*(
+        db.products.update_one({"id": product['id'], "stock": {"$gte": quantity}}, {"$inc": {"stock": -quantity}})
+        for product, quantity in lines
+    ))
+    for (product, quantity), result in zip(lines, results):
+        if result.modified_count:
+            rollback.append(lambda pid=product['id'], q=quantity: db.products.update_one(
+                {"id": pid}, {"$inc": {"stock": q}}
+            ))
+    short = [product['name'] for (product, _), result in zip(lines, results) if not result.modified_count]
+    if short:
+        raise OutOfStock(short)
+
+
+async def _place(db, user_id: str, coupon: Optional[dict], build_order: Callable, session, rollback: list) -> dict:
+    cart = await db.carts.find_one({"user_id": user_id}, {"_id": 0, "items": 1}, session=session)
+    if not cart or not cart.get('items'):
+        raise EmptyCart()
+
+    quantities = {}
+    for item in cart['items']:
+        quantities[item['product_id']] = quantities.get(item['product_id'], 0) + item['quantity']
+    products = {
+        p['id']: p async for p in db.products.find(
+            {"id": {"$in": list(quantities)}}, PRODUCT_FIELDS, session=session
+        )
+    }
+    lines = [(products[pid], quantity) for pid, quantity in quantities.items() if pid in products]
+    if not lines:
+        raise EmptyCart()
+
+    total = sum(product['price'] * quantity for product, quantity in lines)
+    await _reserve_stock(db, lines, session, rollback)
+
+    discount = 0
+    redeemed_code = None
+    if coupon and coupons.applies(coupon, total):
+        shard = await coupons.reserve(db, coupon, session)
+        if shard is not None:
+            discount = coupons.discount(coupon, total)
+            redeemed_code = coupon['code']
+            if session is None:
+                rollback.append(lambda: coupons.release(db, coupon, shard))
+
+    items = [{
+        "product_id": product['id'],
+        "product_name": product['name'],
+        "store_id": product.get('store_id'),
+        "price": product['price'],
+        "quantity": quantity,
+    } for product, quantity in lines]
+    order = build_order(items, total, discount, redeemed_code)
+    # Cancelling hands stock back only to orders that took it
+    order['stock_reserved'] = True
+    await db.orders.insert_one(order, session=session)
+    await db.carts.update_one({"user_id": user_id}, {"$set": {"items": []}}, session=session)
+    return order
+
+
+async def place_order(db, user_id: str, coupon: Optional[dict], build_order: Callable,
+                      transactions: bool = True) -> dict:
+    """Check out the user's cart.
+
+    `coupon` is the coupon document the customer entered, as returned by
+    coupons.ensure_counters(), or None. `build_order(items, total, discount,
+    coupon_code)` returns the order document to insert. Raises EmptyCart or
+    OutOfStock.
+    """
+    if transactions:
+        async with await db.client.start_session() as session:
+            return await session.with_transaction(
+                lambda s: _place(db, user_id, coupon, build_order, s, [])
+            )
+
+    rollback = []
+    try:
+        return await _place(db, user_id, coupon, build_order, None, rollback)
+    except BaseException:
+        for undo in reversed(rollback):
+            await undo()
+        raise
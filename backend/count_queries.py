@@ -0,0 +1,132 @@
+"""Counts MongoDB commands per endpoint to catch N+1 lookups.
+
+Usage: python count_queries.py --db <scratch db> [--references 25]
+
+Seeds a cart, a wishlist and a product's reviews that reference one and then
+`references` products/users, calls the cart, wishlist and review handlers
+for both and records every command the driver sends (via a pymongo
+CommandListener). A handler that batches its lookups issues the same number
+of commands no matter how many documents it references; the script fails if
+any endpoint's count grows with the reference count. Needs a real MongoDB
+(MONGO_URL) and runs only against a scratch database (--db or
+LOADTEST_DB_NAME, never DB_NAME); everything it creates is removed
+afterwards, even if a run fails.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from fastapi import Response
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import monitoring
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+import bench_db  # noqa: E402
+import server  # noqa: E402  (reads the environment loaded above)
+
+
+class CommandCounter(monitoring.CommandListener):
+    def __init__(self):
+        self.commands = Counter()
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        self.commands[f"{event.command_name} {collection}"] += 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+async def seed(db, run_id: str, references: int) -> dict:
+    now = datetime.now(timezone.utc)
+    product_ids = [f"{run_id}-product-{i}" for i in range(references)]
+    user_ids = [f"{run_id}-user-{i}" for i in range(references)]
+    await db.products.insert_many([
+        {"id": pid, "name": pid, "price": 1.0, "stock": 10, "images": [], "status": "active", "created_at": now}
+        for pid in product_ids
+    ])
+    await db.users.insert_many([
+        {"id": uid, "email": f"{uid}@example.com", "name": uid, "role": "customer", "created_at": now}
+        for uid in user_ids
+    ])
+    await db.carts.insert_one({"id": run_id, "user_id": user_ids[0],
+                               "items": [{"product_id": pid, "quantity": 1} for pid in product_ids]})
+    await db.wishlists.insert_one({"id": run_id, "user_id": user_ids[0], "product_ids": product_ids})
+    await db.reviews.insert_many([
+        {"id": f"{run_id}-review-{i}", "product_id": product_ids[0], "user_id": uid, "user_name": uid,
+         "rating": 5, "comment": "", "helpful_count": 0, "created_at": now}
+        for i, uid in enumerate(user_ids)
+    ])
+    return {"id": user_ids[0], "role": "customer", "product_id": product_ids[0]}
+
+
+async def cleanup(db, run_id: str):
+    pattern = {"$regex": f"^{run_id}"}
+    for collection in ("products", "users", "carts", "wishlists", "reviews"):
+        await db[collection].delete_many({"id": pattern})
+
+
+async def measure(counter: CommandCounter, references: int) -> dict:
+    run_id = f"queries-{uuid.uuid4().hex[:8]}"
+    counts = {}
+    try:
+        user = await seed(server.db, run_id, references)
+        endpoints = {
+            "GET /cart": lambda: server.get_cart(fields=None, current_user=user, loaders=server.get_loaders()),
+            "GET /wishlist": lambda: server.get_wishlist(fields=None, current_user=user,
+                                                         loaders=server.get_loaders()),
+            "GET /products/{id}/reviews": lambda: server.get_product_reviews(
+                user['product_id'], Response(), sort_by='newest', limit=references, cursor=None
+            ),
+        }
+        for name, call in endpoints.items():
+            counter.commands.clear()
+            await call()
+            counts[name] = dict(counter.commands)
+    finally:
+        await cleanup(server.db, run_id)
+    return counts
+
+
+async def main(db_name: str, references: int) -> int:
+    counter = CommandCounter()
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'], tz_aware=True, tzinfo=timezone.utc,
+                                event_listeners=[counter])
+    server.client = client
+    try:
+        server.db = await bench_db.open_scratch_db(client, db_name)
+        print(f"=== MongoDB commands per request: 1 vs {references} references ===\n")
+        one = await measure(counter, 1)
+        many = await measure(counter, references)
+    finally:
+        client.close()
+
+    failed = False
+    for name in one:
+        few, lots = sum(one[name].values()), sum(many[name].values())
+        ok = few == lots
+        failed |= not ok
+        print(f"{'✓' if ok else '❌'} {name}: {few} -> {lots} commands {many[name]}")
+
+    print("\n✅ No N+1 lookups" if not failed else "\n❌ Command count grows with references")
+    return int(failed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_db.add_argument(parser)
+    parser.add_argument('--references', type=int, default=25)
+    args = parser.parse_args()
+    db_name = bench_db.scratch_db_name(args.db)
+    sys.exit(asyncio.run(main(db_name, args.references)))
@@ -0,0 +1,124 @@
+"""Coupon rules and redemption through sharded counters.
+
+A redemption used to $inc used_count on the coupon document itself, so every
+checkout with a popular code queued on that one document. Each coupon now
+has up to SHARDS documents in coupon_counters ({code, shard, remaining,
+used}), and a redemption decrements one of them, picked at random, guarded by
+remaining > 0. Concurrent checkouts therefore mostly write different
+documents. max_uses is split across the shards when the coupon is created;
+since every decrement is guarded, redemptions can never exceed it. When the
+picked shard is empty any shard with uses left is taken, and only when none
+has any is the coupon used up. Unlimited coupons (max_uses 0) have
+remaining None and only count.
+
+Coupons created before the counters existed get theirs from
+ensure_counters(), from max_uses - used_count, the first time they are
+looked up.
+"""
+import random
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+from pymongo.errors import BulkWriteError
+
+from timestamps import as_datetime
+
+SHARDS = 8
+
+_REDEEM = {"$inc": {"remaining": -1, "used": 1}}
+
+
+def applies(coupon: dict, total: float) -> bool:
+    """Whether the coupon's terms allow using it on an order of `total`"""
+    expires_at = coupon.get('expires_at')
+    return (
+        coupon.get('active', True)
+        and total >= coupon.get('min_purchase', 0)
+        and (not expires_at or as_datetime(expires_at) >= datetime.now(timezone.utc))
+    )
+
+
+def discount(coupon: dict, total: float) -> float:
+    if coupon['discount_type'] == 'percentage':
+        return total * (coupon['discount_value'] / 100)
+    return coupon['discount_value']
+
+
+def counter_docs(code: str, max_uses: int, used: int = 0) -> List[dict]:
+    """Counter documents for a coupon with `used` of its `max_uses` taken"""
+    if max_uses <= 0:
+        return [{"code": code, "shard": i, "remaining": None, "used": 0} for i in range(SHARDS)]
+    left = max(0, max_uses - used)
+    shards = max(1, min(SHARDS, left))
+    return [
+        {"code": code, "shard": i, "remaining": left // shards + (i < left % shards), "used": 0}
+        for i in range(shards)
+    ]
+
+
+async def ensure_counters(db, coupon: dict) -> dict:
+    """Create the coupon's counters unless it already has them. Returns the
+    coupon with `counter_shards` set."""
+    if coupon.get('counter_shards'):
+        return coupon
+    docs = counter_docs(coupon['code'], coupon.get('max_uses', 0), coupon.get('used_count', 0))
+    try:
+        await db.coupon_counters.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        # A concurrent lookup created them first; the unique index kept one set
+        if any(error['code'] != 11000 for error in e.details['writeErrors']):
+            raise
+    await db.coupons.update_one({"code": coupon['code']}, {"$set": {"counter_shards": len(docs)}})
+    return dict(coupon, counter_shards=len(docs))
+
+
+async def reserve(db, coupon: dict, session=None) -> Optional[int]:
+    """Take one use of a coupon returned by ensure_counters(). Returns the
+    shard it was counted on, or None if the coupon is used up."""
+    code = coupon['code']
+    shard = random.randrange(coupon['counter_shards'])
+
+    if coupon.get('max_uses', 0) <= 0:
+        await db.coupon_counters.update_one({"code": code, "shard": shard}, {"$inc": {"used": 1}}, session=session)
+        return shard
+
+    result = await db.coupon_counters.update_one(
+        {"code": code, "shard": shard, "remaining": {"$gt": 0}}, _REDEEM, session=session
+    )
+    if result.modified_count:
+        return shard
+    # That shard ran dry; take a use from any other one
+    counter = await db.coupon_counters.find_one_and_update(
+        {"code": code, "remaining": {"$gt": 0}}, _REDEEM, projection={"_id": 0, "shard": 1}, session=session
+    )
+    return counter['shard'] if counter else None
+
+
+async def release(db, coupon: dict, shard: int, session=None):
+    """Give back a use taken by reserve()"""
+    inc = {"used": -1} if coupon.get('max_uses', 0) <= 0 else {"used": -1, "remaining": 1}
+    await db.coupon_counters.update_one({"code": coupon['code'], "shard": shard}, {"$inc": inc}, session=session)
+
+
+async def usage(db, coupons: Iterable[dict]) -> Dict[str, dict]:
+    """{code: {"used_count", "remaining"}} for the given coupons, in one
+    query over their counters. remaining is None for unlimited coupons."""
+    coupons = list(coupons)
+    counted = {
+        row['_id']: row async for row in db.coupon_counters.aggregate([
+            {"$match": {"code": {"$in": [c['code'] for c in coupons]}}},
+            {"$group": {"_id": "$code", "used": {"$sum": "$used"}, "remaining": {"$sum": "$remaining"}}},
+        ])
+    }
+    result = {}
+    for coupon in coupons:
+        used = coupon.get('used_count', 0)
+        max_uses = coupon.get('max_uses', 0)
+        row = counted.get(coupon['code'])
+        if row:
+            used += row['used']
+            remaining = row['remaining'] if max_uses > 0 else None
+        else:
+            remaining = max(0, max_uses - used) if max_uses > 0 else None
+        result[coupon['code']] = {"used_count": used, "remaining": remaining}
+    return result
@@ -2,6 +2,7 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import bcrypt
 import uuid
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -36,7 +37,7 @@ async def create_info_account():
             "phone": "0933333333",
             "role": "store_owner",
             "password_hash": password_hash,
-            "created_at": "2025-01-20T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
         }
         await db.users.insert_one(info_user)
         print("✓ تم إنشاء حساب Info")
@@ -50,7 +51,7 @@ async def create_info_account():
             "store_name": "متجر Info للإلكترونيات",
             "description": "متجر Info الرسمي - أحدث الإلكترونيات والأجهزة الذكية",
             "status": "approved",
-            "created_at": "2025-01-20T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
         }
         await db.stores.insert_one(info_store)
         print("✓ تم إنشاء متجر Info (معتمد)")
@@ -69,7 +70,10 @@ async def create_info_account():
                     "images": ["https://images.unsplash.com/photo-1606841837239-c5a1a4a07af7?w=500"],
                     "stock": 50,
                     "status": "active",
-                    "created_at": "2025-01-20T00:00:00+00:00"
+                    "avg_rating": 0,
+                    "review_count": 0,
+                    "wishlist_count": 0,
+                    "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
                 },
                 {
                     "id": str(uuid.uuid4()),
@@ -81,7 +85,10 @@ async def create_info_account():
                     "images": ["https://images.unsplash.com/photo-1544244015-0df4b3ffc6b0?w=500"],
                     "stock": 20,
                     "status": "active",
-                    "created_at": "2025-01-20T00:00:00+00:00"
+                    "avg_rating": 0,
+                    "review_count": 0,
+                    "wishlist_count": 0,
+                    "created_at": datetime(2025, 1, 20, tzinfo=timezone.utc)
                 }
             ]
             await db.products.insert_many(info_products)
@@ -0,0 +1,146 @@
+"""Index declarations for every collection server.py queries.
+
+ensure_indexes() runs at server startup and is idempotent: MongoDB skips
+indexes that already exist with the same keys and options.
+"""
+import logging
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+logger = logging.getLogger(__name__)
+
+# Sort orders of GET /api/products. Every spec ends in a unique field so it is
+# a total order and can be paged with a keyset cursor.
+PRODUCT_SORTS = {
+    None: [("_id", 1)],
+    'newest': [("created_at", -1), ("id", -1)],
+    'price_low': [("price", 1), ("id", 1)],
+    'price_high': [("price", -1), ("id", -1)],
+    'rating': [("avg_rating", -1), ("review_count", -1), ("id", -1)],
+    'most_wished': [("wishlist_count", -1), ("id", -1)],
+}
+
+# Equality filters GET /api/products can combine with status
+PRODUCT_FILTER_PREFIXES = ([], [("category_id", ASCENDING)], [("store_id", ASCENDING)])
+
+
+def _catalog_indexes() -> list:
+    """(status, [category_id|store_id], sort keys) for every product list query"""
+    keys = []
+    for prefix in PRODUCT_FILTER_PREFIXES:
+        for sort_spec in PRODUCT_SORTS.values():
+            if sort_spec[0][1] == DESCENDING:
+                # Descending sorts walk the ascending index backwards
+                sort_spec = [(field, ASCENDING) for field, _ in sort_spec]
+            key = [("status", ASCENDING), *prefix, *sort_spec]
+            if key not in keys:
+                keys.append(key)
+    return [IndexModel(key) for key in keys]
+
+
+INDEXES = {
+    "users": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "stores": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("owner_id", ASCENDING), ("status", ASCENDING)]),
+        IndexModel([("status", ASCENDING)]),
+    ],
+    "categories": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "products": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("store_id", ASCENDING)]),
+        *_catalog_indexes(),
+    ],
+    "reviews": [
+        # One review per user per product
+        IndexModel([("product_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Review pages, newest and most helpful first
+        IndexModel([("product_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("product_id", ASCENDING), ("helpful_count", DESCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "review_votes": [
+        # One helpful vote per user per review
+        IndexModel([("review_id", ASCENDING), ("user_id", ASCENDING)], unique=True),
+    ],
+    "carts": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "wishlists": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "orders": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING)]),
+        # Export walks every order in (created_at, id) order
+        IndexModel([("created_at", ASCENDING), ("id", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+        # Multikey: one entry per store an order has items from
+        IndexModel([("items.store_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("items.store_id", ASCENDING), ("status", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "conversations": [
+        IndexModel([("store_id", ASCENDING), ("customer_id", ASCENDING)], unique=True),
+        # Inboxes, most recently active first
+        IndexModel([("store_id", ASCENDING), ("last_message_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("customer_id", ASCENDING), ("last_message_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "chat_messages": [
+        IndexModel([("store_id", ASCENDING), ("created_at", ASCENDING), ("id", ASCENDING)]),
+    ],
+    "chat_archive": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # History of one conversation, newest bucket first
+        IndexModel([("store_id", ASCENDING), ("customer_id", ASCENDING), ("first_at", DESCENDING)]),
+    ],
+    "job_leases": [
+        IndexModel([("id", ASCENDING)], unique=True),
+    ],
+    "coupons": [
+        IndexModel([("code", ASCENDING)], unique=True),
+    ],
+    "coupon_counters": [
+        IndexModel([("code", ASCENDING), ("shard", ASCENDING)], unique=True),
+    ],
+    "payment_transactions": [
+        IndexModel([("session_id", ASCENDING)], unique=True),
+    ],
+    "password_resets": [
+        IndexModel([("email", ASCENDING), ("code", ASCENDING)]),
+        # Expired reset codes are removed by MongoDB's TTL monitor
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "email_outbox": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Sender claims: due pending messages, and sending ones with a lapsed lease
+        IndexModel([("status", ASCENDING), ("next_attempt_at", ASCENDING)]),
+        IndexModel([("status", ASCENDING), ("locked_until", ASCENDING)]),
+    ],
+    "complaints": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("customer_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel([("created_at", DESCENDING)]),
+    ],
+}
+
+
+async def ensure_indexes(db) -> list:
+    """Create every declared index. Returns the (collection, keys, error) of
+    indexes that could not be built, e.g. a unique index over existing
+    duplicates, so one bad index does not keep the server from starting."""
+    failures = []
+    for collection, models in INDEXES.items():
+        for model in models:
+            try:
+                await db[collection].create_indexes([model])
+            except OperationFailure as e:
+                keys = list(model.document['key'].items())
+                logger.error(f"Could not create index {keys} on {collection}: {e}")
+                failures.append((collection, keys, str(e)))
+    return failures
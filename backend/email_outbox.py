@@ -0,0 +1,250 @@
+"""Outbound email through a MongoDB outbox and a background async sender.
+
+Request handlers only insert into the `email_outbox` collection (enqueue()).
+OutboxSender claims due messages in batches, sends them over one SMTP
+connection that stays open and authenticated between batches, and records
+the outcome on each message:
+
+    pending -> sending -> sent
+                      \\-> pending (retry with exponential backoff)
+                      \\-> failed  (permanent 5xx, or out of attempts)
+
+A message is claimed with a lease; if the process dies mid-batch the lease
+runs out and another sender picks it up again.
+
+SMTP settings come from SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASSWORD,
+SMTP_FROM and SMTP_STARTTLS. Login is skipped without SMTP_USER, so a local
+sink works for development and testing:
+
+    python -m aiosmtpd -n -l localhost:1025
+    SMTP_HOST=localhost SMTP_PORT=1025 SMTP_STARTTLS=false
+"""
+import asyncio
+import logging
+import os
+import random
+import uuid
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Optional
+
+import aiosmtplib
+from pymongo import ReturnDocument
+
+from metrics import LatencyStat
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.environ.get('EMAIL_BATCH_SIZE', 20))
+MAX_ATTEMPTS = int(os.environ.get('EMAIL_MAX_ATTEMPTS', 6))
+RETRY_BASE_SECONDS = 30
+RETRY_MAX_SECONDS = 3600
+LEASE_SECONDS = 120
+POLL_SECONDS = 5
+# Close the SMTP connection after this long without mail
+IDLE_DISCONNECT_SECONDS = 300
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    return default if value is None else value.lower() in ('1', 'true', 'yes')
+
+
+async def enqueue(db, to: str, subject: str, html: str, kind: Optional[str] = None) -> str:
+    """Queue an HTML email; returns the outbox message id"""
+    now = datetime.now(timezone.utc)
+    message_id = str(uuid.uuid4())
+    await db.email_outbox.insert_one({
+        "id": message_id,
+        "kind": kind,
+        "to": to,
+        "subject": subject,
+        "html": html,
+        "status": "pending",
+        "attempts": 0,
+        "next_attempt_at": now,
+        "locked_until": None,
+        "last_error": None,
+        "created_at": now,
+        "sent_at": None,
+    })
+    return message_id
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, capped at RETRY_MAX_SECONDS"""
+    delay = min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class OutboxSender:
+    def __init__(self, db, host: Optional[str] = None, port: Optional[int] = None):
+        self.db = db
+        self.host = host or os.environ.get('SMTP_HOST')
+        self.port = port or int(os.environ.get('SMTP_PORT', 587))
+        self.username = os.environ.get('SMTP_USER')
+        self.password = os.environ.get('SMTP_PASSWORD')
+        self.sender = os.environ.get('SMTP_FROM') or self.username or 'no-reply@localhost'
+        self.start_tls = _env_flag('SMTP_STARTTLS', self.port == 587)
+        self.use_tls = self.port == 465
+
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.connections = 0
+        self.send_time = LatencyStat()
+        self._smtp: Optional[aiosmtplib.SMTP] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def configured(self) -> bool:
+        return bool(self.host)
+
+    def start(self):
+        if self.configured and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        """Wake the sender after an enqueue instead of waiting for the poll"""
+        self._wakeup.set()
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._disconnect()
+
+    async def _connect(self) -> aiosmtplib.SMTP:
+        if self._smtp is not None and self._smtp.is_connected:
+            return self._smtp
+        smtp = aiosmtplib.SMTP(
+            hostname=self.host, port=self.port, use_tls=self.use_tls,
+            start_tls=self.start_tls, timeout=30
+        )
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password or '')
+        self._smtp = smtp
+        self.connections += 1
+        return smtp
+
+    async def _disconnect(self):
+        smtp, self._smtp = self._smtp, None
+        if smtp is None:
+            return
+        try:
+            await smtp.quit()
+        except aiosmtplib.SMTPException:
+            smtp.close()
+
+    async def _claim(self) -> Optional[dict]:
+        now = datetime.now(timezone.utc)
+        return await self.db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "next_attempt_at": {"$lte": now}},
+                # Claimed by a sender that died before finishing
+                {"status": "sending", "locked_until": {"$lte": now}},
+            ]},
+            {"$set": {"status": "sending", "locked_until": now + timedelta(seconds=LEASE_SECONDS)}},
+            sort=[("next_attempt_at", 1)],
+            projection={"_id": 0},
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _build(self, message: dict) -> EmailMessage:
+        email = EmailMessage()
+        email['Subject'] = message['subject']
+        email['From'] = self.sender
+        email['To'] = message['to']
+        email.set_content(message['html'], subtype='html')
+        return email
+
+    async def _record_failure(self, message: dict, error: Exception, permanent: bool):
+        attempts = message['attempts'] + 1
+        update = {"attempts": attempts, "last_error": str(error)[:500], "locked_until": None}
+        if permanent or attempts >= MAX_ATTEMPTS:
+            update["status"] = "failed"
+            self.failed += 1
+            logger.error(f"Email {message['id']} to {message['to']} failed: {error}")
+        else:
+            update["status"] = "pending"
+            update["next_attempt_at"] = datetime.now(timezone.utc) + timedelta(seconds=retry_delay(attempts))
+            self.retried += 1
+        await self.db.email_outbox.update_one({"id": message['id']}, {"$set": update})
+
+    async def send_batch(self) -> int:
+        """Claim and send up to BATCH_SIZE due messages; returns how many were claimed"""
+        batch = []
+        while len(batch) < BATCH_SIZE:
+            message = await self._claim()
+            if message is None:
+                break
+            batch.append(message)
+        if not batch:
+            return 0
+
+        for index, message in enumerate(batch):
+            try:
+                email = self._build(message)
+            except (ValueError, TypeError) as e:
+                await self._record_failure(message, e, permanent=True)
+                continue
+            try:
+                smtp = await self._connect()
+                with self.send_time.time():
+                    await smtp.send_message(email)
+            except aiosmtplib.SMTPResponseException as e:
+                await self._record_failure(message, e, permanent=e.code >= 500)
+            except aiosmtplib.SMTPRecipientsRefused as e:
+                await self._record_failure(message, e, permanent=True)
+            except (aiosmtplib.SMTPException, OSError) as e:
+                # Connection trouble: drop it and retry the rest of the batch later
+                await self._disconnect()
+                for pending in batch[index:]:
+                    await self._record_failure(pending, e, permanent=False)
+                break
+            else:
+                self.sent += 1
+                await self.db.email_outbox.update_one(
+                    {"id": message['id']},
+                    {"$set": {"status": "sent", "sent_at": datetime.now(timezone.utc), "locked_until": None},
+                     "$inc": {"attempts": 1}}
+                )
+        return len(batch)
+
+    async def _run(self):
+        idle = 0.0
+        while True:
+            try:
+                claimed = await self.send_batch()
+            except Exception:
+                logger.exception("Email outbox batch failed")
+                claimed = 0
+            if claimed:
+                idle = 0.0
+                continue
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=POLL_SECONDS)
+                idle = 0.0
+            except asyncio.TimeoutError:
+                idle += POLL_SECONDS
+                if idle >= IDLE_DISCONNECT_SECONDS and self._smtp is not None:
+                    await self._disconnect()
+
+    def stats(self) -> dict:
+        return {
+            "configured": self.configured,
+            "connected": self._smtp is not None and self._smtp.is_connected,
+            "connections_opened": self.connections,
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "send_time": self.send_time.snapshot(),
+        }
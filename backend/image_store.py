@@ -0,0 +1,226 @@
+"""Content-addressed image blobs on local disk.
+
+An image is stored once under the SHA-256 of its bytes, so re-uploading the
+same picture costs nothing. Resized WebP/JPEG variants live next to the
+original as `<hash>.<width>.<format>` and are rendered with Pillow in a
+process pool, off the event loop.
+
+Layout: <IMAGE_STORE_DIR>/<hash[:2]>/<hash>[.<width>.<format>]
+"""
+import asyncio
+import hashlib
+import os
+import re
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterator, Optional, Tuple
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+IMAGE_STORE_DIR = Path(os.environ.get('IMAGE_STORE_DIR', Path(__file__).parent / 'uploads'))
+MAX_IMAGE_BYTES = int(os.environ.get('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+CHUNK_SIZE = 256 * 1024
+
+THUMBNAIL_WIDTHS = (320, 800)
+THUMBNAIL_FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+CARD_VARIANT = '320.webp'
+VARIANTS = {f"{w}.{fmt}" for w in THUMBNAIL_WIDTHS for fmt in THUMBNAIL_FORMATS}
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def blob_path(image_hash: str, variant: Optional[str] = None) -> Path:
+    name = f"{image_hash}.{variant}" if variant else image_hash
+    return IMAGE_STORE_DIR / image_hash[:2] / name
+
+
+def sniff_mime(head: bytes) -> str:
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head.startswith(b'\x89PNG'):
+        return 'image/png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    if head.startswith((b'GIF87a', b'GIF89a')):
+        return 'image/gif'
+    return 'application/octet-stream'
+
+
+def _commit(tmp_path: str, image_hash: str) -> Tuple[str, bool]:
+    """Move a finished temp file into place, or drop it if already stored.
+    Returns the hash and whether the blob is new."""
+    final = blob_path(image_hash)
+    if final.exists():
+        os.unlink(tmp_path)
+        return image_hash, False
+    final.parent.mkdir(parents=True, exist_ok=True)
+    os.replace(tmp_path, final)
+    return image_hash, True
+
+
+def _temp_file():
+    IMAGE_STORE_DIR.mkdir(parents=True, exist_ok=True)
+    return tempfile.NamedTemporaryFile(dir=IMAGE_STORE_DIR, prefix='.upload-', delete=False)
+
+
+async def save_upload(upload) -> Tuple[str, bool]:
+    """Stream an UploadFile into the store chunk by chunk. Returns its hash
+    and whether this upload created the blob (False if already stored)."""
+    digest = hashlib.sha256()
+    size = 0
+    tmp = await asyncio.to_thread(_temp_file)
+    try:
+        while True:
+            chunk = await upload.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > MAX_IMAGE_BYTES:
+                raise ImageTooLarge()
+            digest.update(chunk)
+            await asyncio.to_thread(tmp.write, chunk)
+        await asyncio.to_thread(tmp.close)
+        return await asyncio.to_thread(_commit, tmp.name, digest.hexdigest())
+    except BaseException:
+        tmp.close()
+        if os.path.exists(tmp.name):
+            os.unlink(tmp.name)
+        raise
+
+
+def save_bytes(data: bytes) -> str:
+    """Store in-memory image bytes (used by the inline image migration)"""
+    tmp = _temp_file()
+    with tmp:
+        tmp.write(data)
+    return _commit(tmp.name, hashlib.sha256(data).hexdigest())[0]
+
+
+def _decode(source: Path) -> Image.Image:
+    try:
+        with Image.open(source) as image:
+            image.load()
+            return ImageOps.exif_transpose(image)
+    except (UnidentifiedImageError, Image.DecompressionBombError, SyntaxError) as e:
+        raise InvalidImage(str(e))
+    except OSError as e:
+        # Pillow reports truncated or corrupt data as a plain OSError; a
+        # missing source is not a decoding failure
+        if not source.exists():
+            raise
+        raise InvalidImage(str(e))
+
+
+def render_variants(image_hash: str) -> Tuple[int, int]:
+    """Write every missing thumbnail of an image. Runs in a worker process.
+
+    Raises InvalidImage if Pillow cannot decode it; errors writing the
+    thumbnails propagate. Never removes the source blob, see discard().
+    """
+    image = _decode(blob_path(image_hash))
+    width, height = image.size
+    for target in THUMBNAIL_WIDTHS:
+        resized = image.copy()
+        resized.thumbnail((target, target * 4))
+        for ext, fmt in THUMBNAIL_FORMATS.items():
+            path = blob_path(image_hash, f"{target}.{ext}")
+            if path.exists():
+                continue
+            frame = resized.convert('RGB') if fmt == 'JPEG' else resized.convert('RGBA')
+            fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix='.variant-')
+            try:
+                with os.fdopen(fd, 'wb') as out:
+                    frame.save(out, fmt, quality=80)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.unlink(tmp_path)
+                raise
+    return width, height
+
+
+def discard(image_hash: str):
+    """Remove a blob that failed to decode, with any variants written for it.
+    Only for a blob the current upload created; others may be referenced."""
+    for variant in (None, *VARIANTS):
+        path = blob_path(image_hash, variant)
+        if path.exists():
+            path.unlink()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_WORKERS)
+    return _pool
+
+
+async def ensure_variants(image_hash: str) -> Tuple[int, int]:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_pool(), render_variants, image_hash)
+
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """(start, end inclusive) of a single `bytes=` range, or None to send the
+    whole file. Raises ValueError for an unsatisfiable range."""
+    if not header or not header.startswith('bytes=') or ',' in header:
+        return None
+    start_s, _, end_s = header[6:].strip().partition('-')
+    try:
+        if start_s:
+            start = int(start_s)
+            end = min(int(end_s), size - 1) if end_s else size - 1
+        else:
+            start, end = max(0, size - int(end_s)), size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def iter_file(path: Path, start: int, length: int) -> Iterator[bytes]:
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def image_url(image_hash: str) -> str:
+    """Relative URL an image is stored under; clients resolve it against the API origin"""
+    return f"/api/images/{image_hash}"
+
+
+_URL_RE = re.compile(r'/api/images/([0-9a-f]{64})$')
+
+
+def card_thumbnail(url):
+    """Card-sized variant of a stored image URL; other URLs pass through"""
+    if isinstance(url, str):
+        match = _URL_RE.search(url)
+        if match:
+            return f"{url}/{CARD_VARIANT}"
+    return url
@@ -2,6 +2,7 @@ import asyncio
 from motor.motor_asyncio import AsyncIOMotorClient
 import bcrypt
 import uuid
+from datetime import datetime, timezone
 import os
 from dotenv import load_dotenv
 
@@ -24,7 +25,7 @@ async def init_database():
             "phone": "0999999999",
             "role": "admin",
             "password_hash": password_hash,
-            "created_at": "2025-01-01T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
         }
         await db.users.insert_one(admin)
         print("✓ تم إنشاء حساب الأدمن: admin@syriamarket.com / admin123")
@@ -116,7 +117,7 @@ async def init_database():
             "store_name": "متجر الموضة السوري",
             "description": "متجر رائد في الأزياء والإكسسوارات",
             "status": "approved",
-            "created_at": "2025-01-01T00:00:00+00:00"
+            "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
         }
         await db.stores.insert_one(store)
         print("✓ تم إنشاء متجر تجريبي")
@@ -134,7 +135,10 @@ async def init_database():
                 "images": [sample_images['mens-fashion'][0]],
                 "stock": 50,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -146,7 +150,10 @@ async def init_database():
                 "images": [sample_images['womens-fashion'][0]],
                 "stock": 30,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -158,7 +165,10 @@ async def init_database():
                 "images": [sample_images['home-kitchen'][0]],
                 "stock": 25,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -170,7 +180,10 @@ async def init_database():
                 "images": [sample_images['shoes'][0]],
                 "stock": 40,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -182,7 +195,10 @@ async def init_database():
                 "images": [sample_images['shoes'][1]],
                 "stock": 35,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             },
             {
                 "id": str(uuid.uuid4()),
@@ -194,7 +210,10 @@ async def init_database():
                 "images": [sample_images['bags'][0]],
                 "stock": 20,
                 "status": "active",
-                "created_at": "2025-01-01T00:00:00+00:00"
+                "avg_rating": 0,
+                "review_count": 0,
+                "wishlist_count": 0,
+                "created_at": datetime(2025, 1, 1, tzinfo=timezone.utc)
             }
         ]
         await db.products.insert_many(sample_products)
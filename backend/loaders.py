@@ -0,0 +1,89 @@
+"""Request-scoped batching of lookups by id, in the DataLoader style.
+
+Handlers that resolve references (cart lines to products, review authors to
+users, ...) call `loader.load(id)` or `loader.load_many(ids)` instead of
+issuing one find_one per reference. Every id requested before the event loop
+gets to run the loader's dispatch callback - i.e. within one tick - is
+fetched with a single `{"id": {"$in": [...]}}` query. Results, including
+misses, are cached for the lifetime of the RequestLoaders instance, which
+FastAPI creates once per request through the `get_loaders` dependency.
+"""
+import asyncio
+import json
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set
+
+BatchFn = Callable[[List[Any]], Awaitable[Dict[Any, Any]]]
+
+stats = {"loads": 0, "cache_hits": 0, "batches": 0, "keys_fetched": 0}
+
+
+class Loader:
+    """Coalesces load() calls made in the same tick into one batch_fn call.
+
+    `batch_fn(keys)` returns a dict of the documents it found, keyed by id;
+    missing keys resolve to None.
+    """
+
+    def __init__(self, batch_fn: BatchFn):
+        self._batch_fn = batch_fn
+        self._cache: Dict[Any, asyncio.Future] = {}
+        self._queue: List[Any] = []
+        # The event loop only keeps weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+    def load(self, key) -> asyncio.Future:
+        stats["loads"] += 1
+        future = self._cache.get(key)
+        if future is not None:
+            stats["cache_hits"] += 1
+            return future
+        loop = asyncio.get_running_loop()
+        future = self._cache[key] = loop.create_future()
+        if not self._queue:
+            loop.call_soon(self._dispatch)
+        self._queue.append(key)
+        return future
+
+    async def load_many(self, keys: Iterable) -> list:
+        return list(await asyncio.gather(*(self.load(key) for key in keys)))
+
+    def _dispatch(self):
+        keys, self._queue = self._queue, []
+        task = asyncio.ensure_future(self._resolve(keys))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, keys: list):
+        stats["batches"] += 1
+        stats["keys_fetched"] += len(keys)
+        try:
+            found = await self._batch_fn(keys)
+        except Exception as e:
+            for key in keys:
+                # Drop failed keys so a later load can retry them
+                self._cache.pop(key).set_exception(e)
+            return
+        for key in keys:
+            self._cache[key].set_result(found.get(key))
+
+
+class RequestLoaders:
+    """One Loader per (collection, projection), created on first use"""
+
+    def __init__(self, db):
+        self._db = db
+        self._loaders: Dict[str, Loader] = {}
+
+    def get(self, collection: str, projection: Optional[dict] = None) -> Loader:
+        projection = dict(projection or {"_id": 0})
+        if any(value == 1 for value in projection.values()):
+            # Inclusion projections must return the key the results are matched on
+            projection["id"] = 1
+        name = f"{collection}:{json.dumps(projection, sort_keys=True)}"
+        loader = self._loaders.get(name)
+        if loader is None:
+            async def batch(keys: list) -> dict:
+                cursor = self._db[collection].find({"id": {"$in": keys}}, projection)
+                return {doc["id"]: doc async for doc in cursor}
+            loader = self._loaders[name] = Loader(batch)
+        return loader
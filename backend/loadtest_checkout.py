@@ -0,0 +1,140 @@
+"""Flash-sale load test for the checkout engine.
+
+Usage: python loadtest_checkout.py --db <scratch db> [--buyers 500] [--stock 100] [--coupon-uses 50]
+
+Creates a product with `stock` units and a coupon limited to `coupon-uses`
+redemptions, gives `buyers` users a cart holding one unit each, and checks
+them all out at once through checkout.place_order. Passes when exactly
+min(stock, buyers) orders succeed, stock never goes negative and the coupon
+is redeemed exactly min(coupon-uses, orders) times. It only runs against a
+scratch database (--db or LOADTEST_DB_NAME, never DB_NAME), and everything
+it creates there is removed afterwards, even if the run fails.
+
+Run it against a replica set to exercise the transactional path, e.g. a
+single node started with `mongod --replSet rs0` and `rs.initiate()`.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+import bench_db
+import checkout
+import coupons
+from metrics import LatencyStat
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+
+async def load_test(db_name: str, buyers: int, stock: int, coupon_uses: int) -> int:
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
+    db = await bench_db.open_scratch_db(client, db_name)
+    try:
+        return await run_sale(db, buyers, stock, coupon_uses)
+    finally:
+        client.close()
+
+
+async def run_sale(db, buyers: int, stock: int, coupon_uses: int) -> int:
+    transactions = await checkout.supports_transactions(db)
+    run_id = f"loadtest-{uuid.uuid4().hex[:8]}"
+    product_id = f"{run_id}-product"
+    coupon_code = run_id.upper()
+    user_ids = [f"{run_id}-user-{i}" for i in range(buyers)]
+
+    print(f"=== Flash sale: {buyers} buyers, {stock} in stock, coupon limited to {coupon_uses} ===")
+    print(f"Transactions: {'yes' if transactions else 'no (standalone server)'}\n")
+
+    try:
+        await db.products.insert_one({
+            "id": product_id, "name": "Load test item", "price": 10.0, "stock": stock,
+            "status": "active", "created_at": datetime.now(timezone.utc),
+        })
+        coupon = {
+            "id": run_id, "code": coupon_code, "discount_type": "fixed", "discount_value": 1.0,
+            "min_purchase": 0, "max_uses": coupon_uses, "used_count": 0, "expires_at": None,
+            "active": True, "created_at": datetime.now(timezone.utc),
+        }
+        await db.coupons.insert_one(dict(coupon))
+        coupon = await coupons.ensure_counters(db, coupon)
+        await db.carts.insert_many([
+            {"id": str(uuid.uuid4()), "user_id": user_id, "items": [{"product_id": product_id, "quantity": 1}]}
+            for user_id in user_ids
+        ])
+
+        def build_order(user_id):
+            def build(items, total, discount, code):
+                return {"id": str(uuid.uuid4()), "customer_id": user_id, "items": items,
+                        "total_amount": max(0, total - discount), "original_total": total,
+                        "discount": discount, "coupon_code": code, "status": "pending",
+                        "created_at": datetime.now(timezone.utc)}
+            return build
+
+        latency = LatencyStat(window=buyers)
+        outcomes = {"ordered": 0, "out_of_stock": 0, "error": 0}
+
+        async def buy(user_id):
+            start = time.perf_counter()
+            try:
+                await checkout.place_order(db, user_id, coupon, build_order(user_id), transactions)
+                outcomes["ordered"] += 1
+            except checkout.OutOfStock:
+                outcomes["out_of_stock"] += 1
+            except Exception as e:
+                outcomes["error"] += 1
+                print(f"❌ {user_id}: {e}")
+            latency.observe(time.perf_counter() - start)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(buy(user_id) for user_id in user_ids))
+        elapsed = time.perf_counter() - started
+
+        product = await db.products.find_one({"id": product_id}, {"_id": 0, "stock": 1})
+        redeemed = (await coupons.usage(db, [coupon]))[coupon_code]['used_count']
+        orders = await db.orders.count_documents({"customer_id": {"$in": user_ids}})
+        discounted = await db.orders.count_documents({"customer_id": {"$in": user_ids}, "coupon_code": coupon_code})
+    finally:
+        await db.products.delete_one({"id": product_id})
+        await db.coupons.delete_one({"code": coupon_code})
+        await db.coupon_counters.delete_many({"code": coupon_code})
+        await db.carts.delete_many({"user_id": {"$in": user_ids}})
+        await db.orders.delete_many({"customer_id": {"$in": user_ids}})
+
+    stats = latency.snapshot()
+    print(f"orders: {outcomes['ordered']} (stored: {orders}), out of stock: {outcomes['out_of_stock']}, "
+          f"errors: {outcomes['error']}")
+    print(f"stock left: {product['stock']}, coupon used: {redeemed} (orders with it: {discounted})")
+    print(f"p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, {buyers / elapsed:.0f} checkouts/s")
+
+    expected_orders = min(stock, buyers)
+    checks = [
+        orders == outcomes["ordered"] == expected_orders,
+        product['stock'] == stock - expected_orders,
+        redeemed == discounted == min(coupon_uses, expected_orders),
+        outcomes["error"] == 0,
+    ]
+    if all(checks):
+        print("\n✅ No oversells")
+        return 0
+    print("\n❌ Checkout invariants violated")
+    return 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    bench_db.add_argument(parser)
+    parser.add_argument('--buyers', type=int, default=500)
+    parser.add_argument('--stock', type=int, default=100)
+    parser.add_argument('--coupon-uses', type=int, default=50)
+    args = parser.parse_args()
+    db_name = bench_db.scratch_db_name(args.db)
+    sys.exit(asyncio.run(load_test(db_name, args.buyers, args.stock, args.coupon_uses)))
@@ -0,0 +1,68 @@
+"""In-process counters and latency summaries, served by GET /api/metrics."""
+import time
+from collections import deque
+from typing import Callable, Dict
+
+
+class LatencyStat:
+    """Count, mean, max and percentiles of recent durations, in milliseconds"""
+
+    def __init__(self, window: int = 1024):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        self.max = max(self.max, ms)
+        self._recent.append(ms)
+
+    def time(self) -> "_Timer":
+        return _Timer(self)
+
+    def snapshot(self) -> dict:
+        recent = sorted(self._recent)
+
+        def percentile(p: float) -> float:
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 3) if recent else 0.0
+
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50_ms": percentile(0.5),
+            "p95_ms": percentile(0.95),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max, 3),
+        }
+
+
+class _Timer:
+    def __init__(self, stat: LatencyStat):
+        self.stat = stat
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stat.observe(time.perf_counter() - self.start)
+
+
+def hit_rate(hits: int, misses: int) -> float:
+    total = hits + misses
+    return round(hits / total, 4) if total else 0.0
+
+
+_sources: Dict[str, Callable[[], dict]] = {}
+
+
+def register(name: str, source: Callable[[], dict]):
+    """Publish the dict returned by `source` under `name` in snapshot()"""
+    _sources[name] = source
+
+
+def snapshot() -> dict:
+    return {name: source() for name, source in _sources.items()}
@@ -0,0 +1,129 @@
+"""Convert ISO-string timestamps to native BSON dates.
+
+Usage: python migrate_datetimes.py [--batch-size N] [--pause SECONDS] [--restart]
+
+Older versions of server.py stored created_at/updated_at as `.isoformat()`
+strings. This walks each collection in _id order, a batch at a time, and
+rewrites string-typed timestamp fields as dates with one bulk_write per
+batch. The server keeps running meanwhile: every update is conditional on
+the field still holding the string that was read, so a concurrent write is
+never overwritten. Progress is checkpointed in the `migrations` collection;
+an interrupted run resumes after the last finished batch (--restart scans
+from the beginning again).
+"""
+import argparse
+import asyncio
+import os
+from datetime import datetime, timezone
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+MIGRATION = "datetimes"
+
+# collection -> timestamp fields that used to be written as strings
+FIELDS = {
+    "users": ["created_at"],
+    "stores": ["created_at"],
+    "categories": ["created_at"],
+    "products": ["created_at"],
+    "reviews": ["created_at"],
+    "carts": ["updated_at"],
+    "wishlists": ["updated_at"],
+    "orders": ["created_at"],
+    "coupons": ["created_at", "expires_at"],
+    "chat_messages": ["created_at"],
+    "complaints": ["created_at", "updated_at"],
+}
+
+
+def parse_timestamp(value: str):
+    """Aware UTC datetime of an ISO string, or None if it does not parse"""
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        return parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+async def migrate_collection(db, collection: str, fields: list, batch_size: int, pause: float):
+    checkpoint_id = f"{MIGRATION}:{collection}"
+    checkpoint = await db.migrations.find_one({"_id": checkpoint_id}) or {}
+    if checkpoint.get('done'):
+        print(f"-  {collection}: already migrated")
+        return
+
+    stats = {'documents': 0, 'fields': 0, 'failed': 0}
+    last_id = checkpoint.get('last_id')
+    string_typed = {"$or": [{field: {"$type": "string"}} for field in fields]}
+    projection = {"_id": 1, **{field: 1 for field in fields}}
+
+    while True:
+        query = dict(string_typed)
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = await db[collection].find(query, projection).sort("_id", 1).limit(batch_size).to_list(batch_size)
+        if not batch:
+            break
+
+        requests = []
+        for doc in batch:
+            for field in fields:
+                value = doc.get(field)
+                if not isinstance(value, str):
+                    continue
+                parsed = parse_timestamp(value)
+                if parsed is None:
+                    stats['failed'] += 1
+                    continue
+                requests.append(UpdateOne({"_id": doc['_id'], field: value}, {"$set": {field: parsed}}))
+                stats['fields'] += 1
+        if requests:
+            await db[collection].bulk_write(requests, ordered=False)
+
+        stats['documents'] += len(batch)
+        last_id = batch[-1]['_id']
+        await db.migrations.update_one({"_id": checkpoint_id}, {"$set": {"last_id": last_id}}, upsert=True)
+        if pause:
+            await asyncio.sleep(pause)
+
+    await db.migrations.update_one(
+        {"_id": checkpoint_id},
+        {"$set": {"done": True, "finished_at": datetime.now(timezone.utc)}},
+        upsert=True
+    )
+    print(f"✓ {collection}: {stats['fields']} timestamps converted in {stats['documents']} documents, "
+          f"{stats['failed']} left as strings (unparseable)")
+
+
+async def migrate_datetimes(batch_size: int, pause: float, restart: bool):
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
+    db = client[os.environ['DB_NAME']]
+
+    print("=== Converting string timestamps to BSON dates ===\n")
+
+    if restart:
+        await db.migrations.delete_many({"_id": {"$regex": f"^{MIGRATION}:"}})
+
+    for collection, fields in FIELDS.items():
+        await migrate_collection(db, collection, fields, batch_size, pause)
+
+    client.close()
+    print("\n✅ Migration complete")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch-size', type=int, default=500, help="documents per bulk write")
+    parser.add_argument('--pause', type=float, default=0.0, help="seconds to sleep between batches")
+    parser.add_argument('--restart', action='store_true', help="ignore saved checkpoints")
+    args = parser.parse_args()
+    asyncio.run(migrate_datetimes(args.batch_size, args.pause, args.restart))
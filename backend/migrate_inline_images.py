@@ -0,0 +1,92 @@
+"""Move inline base64 `data:` image URLs out of documents into the image store.
+
+Usage: python migrate_inline_images.py
+
+Covers product images and color swatches, store logos and complaint images.
+Each document is rewritten with relative /api/images/<hash> URLs, which
+clients resolve against the API origin. Only documents that still hold a data URL are
+selected, so the script can be stopped and re-run at any point.
+"""
+import asyncio
+import base64
+import binascii
+import os
+from pathlib import Path
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+import image_store  # noqa: E402  (reads IMAGE_STORE_DIR from .env)
+
+DATA_URL = {"$regex": "^data:"}
+
+# collection -> (query selecting documents with inline images, fields to rewrite)
+TARGETS = {
+    "products": ({"$or": [{"images": DATA_URL}, {"colors.image": DATA_URL}]}, ["images", "colors"]),
+    "stores": ({"logo": DATA_URL}, ["logo"]),
+    "complaints": ({"images": DATA_URL}, ["images"]),
+}
+
+
+async def store_data_url(value, stats: dict):
+    """URL replacing `value` if it is a decodable data URL, else `value`"""
+    if not isinstance(value, str) or not value.startswith('data:'):
+        return value
+    _, _, payload = value.partition(',')
+    try:
+        data = base64.b64decode(payload, validate=False)
+    except (binascii.Error, ValueError):
+        stats['failed'] += 1
+        return value
+    image_hash = await asyncio.to_thread(image_store.save_bytes, data)
+    try:
+        await image_store.ensure_variants(image_hash)
+    except image_store.InvalidImage:
+        stats['failed'] += 1
+        return value
+    stats['images'] += 1
+    return image_store.image_url(image_hash)
+
+
+async def rewrite(value, stats: dict):
+    if isinstance(value, list):
+        return [await rewrite(item, stats) for item in value]
+    if isinstance(value, dict):
+        return {k: (await store_data_url(v, stats) if k == 'image' else v) for k, v in value.items()}
+    return await store_data_url(value, stats)
+
+
+async def migrate_inline_images():
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=== Moving inline images to the image store ===\n")
+
+    for collection, (query, fields) in TARGETS.items():
+        stats = {'documents': 0, 'images': 0, 'failed': 0}
+        projection = {"_id": 1, **{field: 1 for field in fields}}
+        # batch_size keeps only a handful of image-heavy documents in memory
+        async for doc in db[collection].find(query, projection, batch_size=20):
+            updates = {}
+            for field in fields:
+                if field in doc:
+                    new_value = await rewrite(doc[field], stats)
+                    if new_value != doc[field]:
+                        updates[field] = new_value
+            if updates:
+                await db[collection].update_one({"_id": doc['_id']}, {"$set": updates})
+                stats['documents'] += 1
+        print(f"✓ {collection}: {stats['documents']} documents, {stats['images']} images moved, "
+              f"{stats['failed']} left inline (undecodable)")
+
+    image_store.shutdown_pool()
+    client.close()
+    print("\n✅ Migration complete")
+
+
+if __name__ == "__main__":
+    asyncio.run(migrate_inline_images())
@@ -0,0 +1,96 @@
+"""bcrypt off the event loop, with admission control.
+
+Hashing and checking a password takes hundreds of milliseconds of CPU. bcrypt
+releases the GIL while it works, so a small thread pool runs it in parallel
+with the event loop. At most `max_pending` calls may be queued or running at
+once; beyond that callers get PoolSaturated immediately instead of waiting
+behind a login burst.
+
+BCRYPT_ROUNDS sets the cost factor of new hashes. Hashes made with another
+cost are reported by needs_rehash() so they can be upgraded on login.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+from metrics import LatencyStat
+
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+HASH_WORKERS = int(os.environ.get('HASH_WORKERS', min(4, os.cpu_count() or 1)))
+HASH_MAX_PENDING = int(os.environ.get('HASH_MAX_PENDING', 32))
+
+
+class PoolSaturated(Exception):
+    pass
+
+
+def _timed(submitted: float, fn, *args):
+    """Run `fn` in a worker; returns (result, seconds queued, seconds running)"""
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, started - submitted, time.perf_counter() - started
+
+
+class PasswordHasher:
+    def __init__(self, workers: int = HASH_WORKERS, max_pending: int = HASH_MAX_PENDING,
+                 rounds: int = BCRYPT_ROUNDS):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.rounds = rounds
+        self.pending = 0
+        self.rejected = 0
+        self.queue_wait = LatencyStat()
+        self.run_time = LatencyStat()
+        self._executor = None
+
+    async def _run(self, fn, *args):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise PoolSaturated()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result, waited, ran = await loop.run_in_executor(
+                self._executor, _timed, time.perf_counter(), fn, *args
+            )
+        finally:
+            self.pending -= 1
+        self.queue_wait.observe(waited)
+        self.run_time.observe(ran)
+        return result
+
+    async def hash(self, password: str) -> str:
+        hashed = await self._run(bcrypt.hashpw, password.encode('utf-8'), bcrypt.gensalt(self.rounds))
+        return hashed.decode('utf-8')
+
+    async def verify(self, password: str, hashed: str) -> bool:
+        return await self._run(bcrypt.checkpw, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def needs_rehash(self, hashed: str) -> bool:
+        """True if `hashed` was made with a cost factor other than `rounds`"""
+        try:
+            return int(hashed.split('$')[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "running": min(self.pending, self.workers),
+            "queued": max(0, self.pending - self.workers),
+            "rejected": self.rejected,
+            "rounds": self.rounds,
+            "queue_wait": self.queue_wait.snapshot(),
+            "run_time": self.run_time.snapshot(),
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
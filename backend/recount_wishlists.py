@@ -0,0 +1,52 @@
+import asyncio
+from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo import UpdateOne
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
+BATCH_SIZE = 500
+
+async def recount_wishlists():
+    """Rebuild products.wishlist_count from the wishlists.
+
+    Backfills the counter for products wished before it existed and repairs
+    drift. Wishlist changes made while it runs can be overwritten, so run it
+    when traffic is low.
+    """
+    mongo_url = os.environ['MONGO_URL']
+    client = AsyncIOMotorClient(mongo_url)
+    db = client[os.environ['DB_NAME']]
+
+    print("=== Recounting product wishlist counters ===\n")
+
+    counts = {
+        row['_id']: row['count'] async for row in db.wishlists.aggregate([
+            {"$unwind": "$product_ids"},
+            {"$group": {"_id": "$product_ids", "count": {"$sum": 1}}},
+        ], allowDiskUse=True)
+    }
+    print(f"✓ {len(counts)} products are on at least one wishlist")
+
+    updated = 0
+    batch = []
+    async for product in db.products.find({}, {"_id": 0, "id": 1, "wishlist_count": 1}):
+        count = counts.get(product['id'], 0)
+        if product.get('wishlist_count') != count:
+            batch.append(UpdateOne({"id": product['id']}, {"$set": {"wishlist_count": count}}))
+        if len(batch) >= BATCH_SIZE:
+            updated += (await db.products.bulk_write(batch, ordered=False)).modified_count
+            batch = []
+    if batch:
+        updated += (await db.products.bulk_write(batch, ordered=False)).modified_count
+
+    print(f"✓ Updated {updated} products")
+
+    client.close()
+    print("\n✅ Recount complete")
+
+if __name__ == "__main__":
+    asyncio.run(recount_wishlists())
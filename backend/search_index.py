@@ -0,0 +1,208 @@
+"""In-memory inverted index for product search.
+
+Arabic text is normalized (tashkeel/tatweel stripped, alef/hamza variants
+folded, taa marbuta -> haa, alef maqsura -> yaa) and light-stemmed, English
+text is lowercased and suffix-stemmed. Matching products are ranked with
+BM25 over the name and description fields, the name counting double.
+"""
+import math
+import re
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+# Harakat, tanween, shadda, sukun, superscript alef and tatweel
+_TASHKEEL_RE = re.compile('[\u0610-\u061a\u064b-\u065f\u0670\u06d6-\u06ed\u0640]')
+_TOKEN_RE = re.compile(r'\w+')
+
+_ARABIC_FOLD = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ؤ': 'و', 'ئ': 'ي',
+    'ة': 'ه',
+    'ى': 'ي',
+})
+
+# Light10-style affixes, longest first. Applied to normalized text.
+_ARABIC_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+_ARABIC_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+
+_VOWELS = set('aeiouy')
+
+NAME_WEIGHT = 2
+DESCRIPTION_WEIGHT = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+MAX_PREFIX_EXPANSION = 50
+
+
+def normalize_arabic(text: str) -> str:
+    return _TASHKEEL_RE.sub('', text).translate(_ARABIC_FOLD)
+
+
+def _is_arabic(token: str) -> bool:
+    return '\u0600' <= token[0] <= '\u06ff'
+
+
+def stem_arabic(token: str) -> str:
+    for prefix in _ARABIC_PREFIXES:
+        if token.startswith(prefix) and len(token) - len(prefix) >= 2:
+            token = token[len(prefix):]
+            break
+    for suffix in _ARABIC_SUFFIXES:
+        if token.endswith(suffix) and len(token) - len(suffix) >= 3:
+            token = token[:-len(suffix)]
+            break
+    return token
+
+
+def stem_english(token: str) -> str:
+    """Porter step 1 (plurals, -ed, -ing), which covers most catalog text."""
+    if len(token) <= 3 or not token.isalpha():
+        return token
+
+    if token.endswith('sses'):
+        token = token[:-2]
+    elif token.endswith('ies') and len(token) > 4:
+        token = token[:-3] + 'y'
+    elif token.endswith('s') and not token.endswith(('ss', 'us', 'is')):
+        token = token[:-1]
+
+    for suffix in ('ing', 'ed'):
+        stem = token[:-len(suffix)]
+        if token.endswith(suffix) and len(stem) >= 3 and _VOWELS & set(stem):
+            if stem.endswith(('at', 'bl', 'iz')):
+                stem += 'e'
+            elif stem[-1] == stem[-2] and stem[-1] not in 'lsz' and stem[-1] not in _VOWELS:
+                stem = stem[:-1]
+            elif len(stem) == 3 and stem[0] not in _VOWELS and stem[1] in _VOWELS and stem[2] not in 'aeiouwxy':
+                stem += 'e'
+            token = stem
+            break
+    return token
+
+
+def normalize_token(token: str) -> str:
+    return token if _is_arabic(token) else token.lower()
+
+
+def stem(token: str) -> str:
+    return stem_arabic(token) if _is_arabic(token) else stem_english(token)
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into normalized, unstemmed tokens."""
+    if not text:
+        return []
+    return [normalize_token(t) for t in _TOKEN_RE.findall(normalize_arabic(text))]
+
+
+def analyze(text: Optional[str]) -> List[str]:
+    return [stem(t) for t in tokenize(text)]
+
+
+class SearchIndex:
+    """Inverted index of term -> {doc_id: weighted term frequency}.
+
+    Queries only touch the postings of their own terms, so lookups cost
+    O(matching postings) rather than O(catalog size).
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Dict[str, int]] = {}
+        self.doc_lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self.vocabulary: List[str] = []
+        self.ready = False
+
+    def __len__(self):
+        return len(self.doc_lengths)
+
+    def add(self, doc: dict):
+        """Index (or re-index) a product document."""
+        doc_id = doc['id']
+        self.remove(doc_id)
+
+        terms: Dict[str, int] = {}
+        for term in analyze(doc.get('name')):
+            terms[term] = terms.get(term, 0) + NAME_WEIGHT
+        for term in analyze(doc.get('description')):
+            terms[term] = terms.get(term, 0) + DESCRIPTION_WEIGHT
+
+        for term, tf in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                insort(self.vocabulary, term)
+            postings[doc_id] = tf
+
+        length = sum(terms.values())
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(self, doc_id: str):
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+        for term in terms:
+            postings = self.postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self.vocabulary.pop(bisect_left(self.vocabulary, term))
+        self.total_length -= self.doc_lengths.pop(doc_id)
+
+    def clear(self):
+        self.__init__()
+
+    def _expand_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self.vocabulary, prefix)
+        matches = []
+        for term in self.vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def _idf(self, term: str) -> float:
+        df = len(self.postings.get(term, ()))
+        n = len(self.doc_lengths)
+        return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Return (doc_id, score) pairs, best first.
+
+        Every query token must match (as with the old substring filter). The
+        last token also matches as a prefix so partially typed words work.
+        """
+        tokens = tokenize(query)
+        if not tokens or not self.doc_lengths:
+            return []
+
+        groups = [[stem(t)] for t in tokens]
+        groups[-1] = list({stem(tokens[-1]), *self._expand_prefix(tokens[-1])})
+
+        avg_length = self.total_length / len(self.doc_lengths)
+        scores: Optional[Dict[str, float]] = None
+        for group in groups:
+            group_scores: Dict[str, float] = {}
+            for term in group:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                idf = self._idf(term)
+                for doc_id, tf in postings.items():
+                    if scores is not None and doc_id not in scores:
+                        continue
+                    norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[doc_id] / avg_length)
+                    score = idf * tf * (BM25_K1 + 1) / (tf + norm)
+                    group_scores[doc_id] = max(group_scores.get(doc_id, 0.0), score)
+            if scores is None:
+                scores = group_scores
+            else:
+                scores = {doc_id: scores[doc_id] + s for doc_id, s in group_scores.items()}
+            if not scores:
+                return []
+
+        ranked = sorted(scores.items(), key=lambda x: (-x[1], x[0]))
+        return ranked[:limit] if limit else ranked
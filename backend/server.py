@@ -1,37 +1,167 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request, Response, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from dotenv import load_dotenv
+from fastapi.responses import StreamingResponse
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
 import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict, EmailStr
-from typing import List, Optional
+from typing import Any, Awaitable, Callable, List, Optional
 import uuid
 from datetime import datetime, timezone, timedelta
-import bcrypt
 import jwt
 import base64
+import re
+import csv
+import io
+import json
+import hashlib
+import time
+from bson import json_util
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from fastapi.encoders import jsonable_encoder
+
+from cache import ResponseCache, TTLCache
+from db_indexes import PRODUCT_SORTS, ensure_indexes
+import cart_ops
+import chat_archive
+from chat_broker import ChatBroker
+import checkout
+import coupons
+import email_outbox
+import image_store
+import metrics
+from loaders import RequestLoaders, stats as loader_stats
+from metrics import LatencyStat, hit_rate
+from password_hashing import PasswordHasher, PoolSaturated
+from search_index import SearchIndex, tokenize
+from similarity import SimilarityEngine
+from timestamps import as_datetime
+import wishlist_ops
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
+# MongoDB connection. Timestamps are stored as native BSON dates and decoded
+# as timezone-aware UTC datetimes, so handlers never parse them by hand.
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, tz_aware=True, tzinfo=timezone.utc)
 db = client[os.environ['DB_NAME']]
 
 # JWT Settings
 SECRET_KEY = os.environ.get('JWT_SECRET', 'your-secret-key-change-in-production')
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_DAYS = 30
+# Stream tokens only open an event stream, which outlives them
+STREAM_TOKEN_SCOPE = "chat_stream"
+STREAM_TOKEN_EXPIRE_SECONDS = 60
 
 security = HTTPBearer()
 
+# ============= Principal Cache =============
+# users documents behind bearer tokens, keyed by user id and tagged
+# "user:<id>" so update_user_role, delete_user and reset_password can drop
+# them (including lookups still in flight when they ran).
+PRINCIPAL_CACHE_TTL = float(os.environ.get('PRINCIPAL_CACHE_TTL', 60))
+principal_cache = ResponseCache(maxsize=int(os.environ.get('PRINCIPAL_CACHE_SIZE', 10000)), ttl=PRINCIPAL_CACHE_TTL)
+# Opt-in: read-only routes take id/role/name/email from the signed token and
+# skip the users lookup entirely. Role changes then reach tokens issued
+# before them only through claims_revoked_at, which is per process, so the
+# claims are never trusted for PRIVILEGED_ROLES: those always go through the
+# cached users lookup, which expires after PRINCIPAL_CACHE_TTL.
+TRUST_TOKEN_CLAIMS = os.environ.get('TRUST_TOKEN_CLAIMS', '').lower() in ('1', 'true', 'yes')
+PRIVILEGED_ROLES = ('admin', 'viewer')
+# user id -> unix time of the last invalidation; older tokens fall back to a lookup
+claims_revoked_at = TTLCache(maxsize=100000, ttl=ACCESS_TOKEN_EXPIRE_DAYS * 86400)
+principal_latency = LatencyStat()
+principal_db_latency = LatencyStat()
+trusted_claims_served = 0
+
+# Whether checkout can use multi-document transactions (replica set);
+# detected at startup
+checkout_transactions = False
+
+# Outbound mail is queued in email_outbox and sent by this background task
+email_sender = email_outbox.OutboxSender(db)
+
+# Pushes new chat messages to open /chat/.../stream connections
+chat_broker = ChatBroker(queue_size=int(os.environ.get('CHAT_QUEUE_SIZE', 100)))
+
+# Moves old chat messages into compressed buckets; see chat_archive.py
+chat_archiver = chat_archive.ChatArchiver(db)
+
+# bcrypt runs in a bounded thread pool; see password_hashing.py
+password_hasher = PasswordHasher()
+
 app = FastAPI()
 api_router = APIRouter()
 
+# In-memory product indexes, built at startup and kept current by product writes
+product_search = SearchIndex()
+product_similarity = SimilarityEngine()
+# Fields the two indexes read
+PRODUCT_INDEX_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "description": 1, "category_id": 1, "price": 1,
+    "status": 1, "sizes": 1, "shoe_sizes": 1, "colors.name": 1
+}
+
+# ============= Response Cache =============
+# Rendered JSON of anonymous catalog reads, keyed by path + normalized query
+# string. Entries are tagged with what they were built from ("products",
+# "product:<id>", "stores", "categories") and writers invalidate those tags.
+response_cache = ResponseCache(maxsize=2048, ttl=300)
+
+def response_cache_key(request: Request) -> tuple:
+    params = []
+    for name, value in request.query_params.multi_items():
+        if name == 'search':
+            value = ' '.join(tokenize(value))
+        if value != '':
+            params.append((name, value))
+    return (request.url.path, tuple(sorted(params)))
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f"W/{etag}" in candidates
+
+async def cached_response(
+    request: Request,
+    tags: tuple,
+    load: Callable[[], Awaitable[Any]],
+    headers: Optional[dict] = None
+) -> Response:
+    """Serve `load()` through the response cache with a strong ETag.
+
+    `headers` may be filled in by `load` and is cached with the body.
+    """
+    key = response_cache_key(request)
+    entry = response_cache.get(key)
+    if entry is None:
+        generation = response_cache.generation(tags)
+        body = await load()
+        content = json.dumps(
+            jsonable_encoder(body), ensure_ascii=False, allow_nan=False, separators=(",", ":")
+        ).encode('utf-8')
+        etag = '"' + hashlib.sha256(content).hexdigest()[:32] + '"'
+        entry = (content, etag, dict(headers or {}))
+        response_cache.set(key, entry, tags, generation)
+    
+    content, etag, extra_headers = entry
+    response_headers = {"ETag": etag, "Cache-Control": "no-cache", **extra_headers}
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=response_headers)
+    return Response(content=content, media_type="application/json", headers=response_headers)
+
+def invalidate_products(*product_ids: str):
+    """Drop cached product lists and the detail entries of `product_ids`"""
+    response_cache.invalidate("products", *(f"product:{pid}" for pid in product_ids))
+
 # ============= Models =============
 class UserRegister(BaseModel):
     email: EmailStr
@@ -101,6 +231,12 @@ class Product(BaseModel):
     sizes: List[str] = []  # S, M, L, XL, XXL
     colors: List[dict] = []  # [{"name": "أحمر", "hex": "#FF0000", "image": "url"}]
     shoe_sizes: List[str] = []  # 38, 39, 40, 41, 42, 43, 44
+    # Review aggregates, maintained by create_review
+    avg_rating: float = 0
+    review_count: int = 0
+    wishlist_count: int = 0
+    rating_sum: int = 0
+    rating_histogram: dict = Field(default_factory=lambda: {str(star): 0 for star in range(1, 6)})
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ProductCreate(BaseModel):
@@ -114,10 +250,31 @@ class ProductCreate(BaseModel):
     colors: List[dict] = []
     shoe_sizes: List[str] = []
 
+class ProductUpdate(BaseModel):
+    """Fields a store owner may change. The store, review aggregates and
+    wishlist count are maintained by the server and cannot be set."""
+    model_config = ConfigDict(extra="ignore")
+    category_id: Optional[str] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[float] = None
+    images: Optional[List[str]] = None
+    stock: Optional[int] = None
+    status: Optional[str] = None
+    sizes: Optional[List[str]] = None
+    colors: Optional[List[dict]] = None
+    shoe_sizes: Optional[List[str]] = None
+
 class CartItem(BaseModel):
     product_id: str
     quantity: int
 
+class CartQuantity(BaseModel):
+    quantity: int
+
+class CartReplace(BaseModel):
+    items: List[CartItem]
+
 class Cart(BaseModel):
     model_config = ConfigDict(extra="ignore")
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
@@ -158,6 +315,7 @@ class Review(BaseModel):
     user_name: str
     rating: int  # 1-5
     comment: str
+    helpful_count: int = 0
     created_at: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
 
 class ReviewCreate(BaseModel):
@@ -214,34 +372,119 @@ class CouponCreate(BaseModel):
     expires_at: Optional[str] = None
 
 # ============= Auth Functions =============
-def hash_password(password: str) -> str:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+HASHING_BUSY = HTTPException(
+    status_code=503,
+    detail="Server is busy, please try again",
+    headers={"Retry-After": "1"}
+)
 
-def verify_password(password: str, hashed: str) -> bool:
-    return bcrypt.checkpw(password.encode('utf-8'), hashed.encode('utf-8'))
+async def hash_password(password: str) -> str:
+    try:
+        return await password_hasher.hash(password)
+    except PoolSaturated:
+        raise HASHING_BUSY
 
-def create_access_token(data: dict) -> str:
-    to_encode = data.copy()
-    expire = datetime.now(timezone.utc) + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS)
-    to_encode.update({"exp": expire})
+async def verify_password(password: str, hashed: str) -> bool:
+    try:
+        return await password_hasher.verify(password, hashed)
+    except PoolSaturated:
+        raise HASHING_BUSY
+
+def create_access_token(user: dict) -> str:
+    now = datetime.now(timezone.utc)
+    to_encode = {
+        "user_id": user['id'],
+        "role": user['role'],
+        "name": user.get('name'),
+        "email": user.get('email'),
+        "iat": now,
+        "exp": now + timedelta(days=ACCESS_TOKEN_EXPIRE_DAYS),
+    }
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+def create_stream_token(user: dict) -> str:
+    """Short-lived token that only opens chat event streams. EventSource
+    cannot send headers, so it goes in the URL, where it may be logged."""
+    now = datetime.now(timezone.utc)
+    to_encode = {
+        "user_id": user['id'],
+        "scope": STREAM_TOKEN_SCOPE,
+        "iat": now,
+        "exp": now + timedelta(seconds=STREAM_TOKEN_EXPIRE_SECONDS),
+    }
+    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+
+def decode_token(credentials: HTTPAuthorizationCredentials, scope: Optional[str] = None) -> dict:
+    """Payload of a valid token; access tokens have no scope, and a scoped
+    token is only accepted where that scope is asked for"""
     try:
-        token = credentials.credentials
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id = payload.get("user_id")
-        if not user_id:
-            raise HTTPException(status_code=401, detail="Invalid token")
-        
-        user = await db.users.find_one({"id": user_id}, {"_id": 0})
-        if not user:
-            raise HTTPException(status_code=401, detail="User not found")
-        return user
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
     except jwt.ExpiredSignatureError:
         raise HTTPException(status_code=401, detail="Token expired")
-    except Exception:
+    except jwt.InvalidTokenError:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    if not payload.get("user_id") or payload.get("scope") != scope:
         raise HTTPException(status_code=401, detail="Invalid token")
+    return payload
+
+async def load_principal(user_id: str) -> Optional[dict]:
+    """users document of `user_id` without its password hash, cached"""
+    user = principal_cache.get(user_id)
+    if user is None:
+        tags = (f"user:{user_id}",)
+        generation = principal_cache.generation(tags)
+        with principal_db_latency.time():
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+        if user is None:
+            return None
+        principal_cache.set(user_id, user, tags, generation)
+    return dict(user)
+
+def invalidate_principal(user_id: str):
+    principal_cache.invalidate(f"user:{user_id}")
+    claims_revoked_at.set(user_id, time.time())
+
+async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    with principal_latency.time():
+        payload = decode_token(credentials)
+        user = await load_principal(payload["user_id"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
+
+async def get_token_principal(credentials: HTTPAuthorizationCredentials = Depends(security)) -> dict:
+    """Principal for read-only routes. With TRUST_TOKEN_CLAIMS it is built from
+    the token's claims; tokens of privileged roles, tokens issued before the
+    claims were added, or before the user's last invalidation, still go
+    through get_current_user."""
+    global trusted_claims_served
+    if TRUST_TOKEN_CLAIMS:
+        payload = decode_token(credentials)
+        revoked_at = claims_revoked_at.get(payload["user_id"])
+        issued_at = payload.get("iat")
+        if (payload.get("role") and payload["role"] not in PRIVILEGED_ROLES
+                and payload.get("email") and issued_at
+                and (revoked_at is None or issued_at > revoked_at)):
+            trusted_claims_served += 1
+            return {
+                "id": payload["user_id"],
+                "role": payload["role"],
+                "name": payload.get("name"),
+                "email": payload["email"],
+            }
+    return await get_current_user(credentials)
+
+async def get_stream_principal(token: Optional[str] = None) -> dict:
+    """Principal for event streams, from a ?token= issued by
+    POST /chat/stream-token. Access tokens are not accepted here, so they
+    never end up in URLs."""
+    if not token:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    payload = decode_token(HTTPAuthorizationCredentials(scheme="Bearer", credentials=token), STREAM_TOKEN_SCOPE)
+    user = await load_principal(payload["user_id"])
+    if not user:
+        raise HTTPException(status_code=401, detail="Invalid token")
+    return user
 
 # ============= Auth Routes =============
 @api_router.post("/auth/register")
@@ -258,21 +501,35 @@ async def register(user_data: UserRegister):
     )
     
     doc = user.model_dump()
-    doc['password_hash'] = hash_password(user_data.password)
-    doc['created_at'] = doc['created_at'].isoformat()
+    doc['password_hash'] = await hash_password(user_data.password)
     
-    await db.users.insert_one(doc)
+    try:
+        await db.users.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Email already registered")
     
-    token = create_access_token({"user_id": user.id, "role": user.role})
+    token = create_access_token(doc)
     return {"token": token, "user": user.model_dump()}
 
 @api_router.post("/auth/login")
 async def login(credentials: UserLogin):
     user = await db.users.find_one({"email": credentials.email}, {"_id": 0})
-    if not user or not verify_password(credentials.password, user['password_hash']):
+    if not user or not await verify_password(credentials.password, user['password_hash']):
         raise HTTPException(status_code=401, detail="Invalid email or password")
     
-    token = create_access_token({"user_id": user['id'], "role": user['role']})
+    # Upgrade hashes made with an old cost factor while the password is at hand
+    if password_hasher.needs_rehash(user['password_hash']):
+        try:
+            new_hash = await password_hasher.hash(credentials.password)
+        except PoolSaturated:
+            pass  # the login itself succeeded; upgrade on a later one
+        else:
+            await db.users.update_one(
+                {"id": user['id'], "password_hash": user['password_hash']},
+                {"$set": {"password_hash": new_hash}}
+            )
+    
+    token = create_access_token(user)
     user_data = {k: v for k, v in user.items() if k != 'password_hash'}
     return {"token": token, "user": user_data}
 
@@ -280,6 +537,39 @@ async def login(credentials: UserLogin):
 async def get_me(current_user: dict = Depends(get_current_user)):
     return {k: v for k, v in current_user.items() if k != 'password_hash'}
 
+def password_reset_email(reset_code: str) -> str:
+    return f'''
+    <html dir="rtl">
+      <body style="font-family: Arial, sans-serif; direction: rtl; text-align: right;">
+        <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9fafb;">
+          <div style="background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+            <h2 style="color: #ea580c; margin-bottom: 20px;">رمز إعادة تعيين كلمة المرور</h2>
+            <p style="font-size: 16px; color: #374151; margin-bottom: 20px;">
+              مرحباً،
+            </p>
+            <p style="font-size: 16px; color: #374151; margin-bottom: 20px;">
+              تلقينا طلباً لإعادة تعيين كلمة المرور الخاصة بحسابك في سوق سوريا.
+            </p>
+            <div style="background-color: #fef3c7; padding: 20px; border-radius: 8px; margin: 30px 0; text-align: center;">
+              <p style="font-size: 14px; color: #92400e; margin-bottom: 10px;">رمز التحقق الخاص بك:</p>
+              <h1 style="font-size: 48px; color: #ea580c; margin: 10px 0; letter-spacing: 8px;">{reset_code}</h1>
+            </div>
+            <p style="font-size: 14px; color: #6b7280; margin-bottom: 20px;">
+              هذا الرمز صالح لمدة <strong>10 دقائق</strong> فقط.
+            </p>
+            <p style="font-size: 14px; color: #6b7280; margin-bottom: 20px;">
+              إذا لم تطلب إعادة تعيين كلمة المرور، يرجى تجاهل هذا البريد.
+            </p>
+            <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 30px 0;">
+            <p style="font-size: 12px; color: #9ca3af; text-align: center;">
+              © 2025 سوق سوريا. جميع الحقوق محفوظة.
+            </p>
+          </div>
+        </div>
+      </body>
+    </html>
+    '''
+
 @api_router.post("/auth/forgot-password")
 async def forgot_password(request: ForgotPasswordRequest):
     """Send password reset code to user's email"""
@@ -311,85 +601,24 @@ async def forgot_password(request: ForgotPasswordRequest):
     print(f"Reset Code: {reset_code} for {request.email}")
     print(f"{'='*50}\n")
     
-    # Check if SMTP is configured
-    smtp_host = os.environ.get('SMTP_HOST')
-    smtp_user = os.environ.get('SMTP_USER')
-    email_sent = False
-    
-    if smtp_host and smtp_user:
-        # Try to send email
-        try:
-            import smtplib
-            from email.mime.text import MIMEText
-            from email.mime.multipart import MIMEMultipart
-            
-            smtp_port = int(os.environ.get('SMTP_PORT', 587))
-            smtp_password = os.environ.get('SMTP_PASSWORD')
-            smtp_from = os.environ.get('SMTP_FROM', smtp_user)
-            
-            # Create email
-            msg = MIMEMultipart('alternative')
-            msg['Subject'] = 'رمز إعادة تعيين كلمة المرور - سوق سوريا'
-            msg['From'] = smtp_from
-            msg['To'] = request.email
-            
-            # Email body
-            html = f'''
-            <html dir="rtl">
-              <body style="font-family: Arial, sans-serif; direction: rtl; text-align: right;">
-                <div style="max-width: 600px; margin: 0 auto; padding: 20px; background-color: #f9fafb;">
-                  <div style="background-color: white; padding: 30px; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                    <h2 style="color: #ea580c; margin-bottom: 20px;">رمز إعادة تعيين كلمة المرور</h2>
-                    <p style="font-size: 16px; color: #374151; margin-bottom: 20px;">
-                      مرحباً،
-                    </p>
-                    <p style="font-size: 16px; color: #374151; margin-bottom: 20px;">
-                      تلقينا طلباً لإعادة تعيين كلمة المرور الخاصة بحسابك في سوق سوريا.
-                    </p>
-                    <div style="background-color: #fef3c7; padding: 20px; border-radius: 8px; margin: 30px 0; text-align: center;">
-                      <p style="font-size: 14px; color: #92400e; margin-bottom: 10px;">رمز التحقق الخاص بك:</p>
-                      <h1 style="font-size: 48px; color: #ea580c; margin: 10px 0; letter-spacing: 8px;">{reset_code}</h1>
-                    </div>
-                    <p style="font-size: 14px; color: #6b7280; margin-bottom: 20px;">
-                      هذا الرمز صالح لمدة <strong>10 دقائق</strong> فقط.
-                    </p>
-                    <p style="font-size: 14px; color: #6b7280; margin-bottom: 20px;">
-                      إذا لم تطلب إعادة تعيين كلمة المرور، يرجى تجاهل هذا البريد.
-                    </p>
-                    <hr style="border: none; border-top: 1px solid #e5e7eb; margin: 30px 0;">
-                    <p style="font-size: 12px; color: #9ca3af; text-align: center;">
-                      © 2025 سوق سوريا. جميع الحقوق محفوظة.
-                    </p>
-                  </div>
-                </div>
-              </body>
-            </html>
-            '''
-            
-            part = MIMEText(html, 'html')
-            msg.attach(part)
-            
-            # Send email
-            with smtplib.SMTP(smtp_host, smtp_port) as server:
-                server.starttls()
-                server.login(smtp_user, smtp_password)
-                server.send_message(msg)
-            
-            email_sent = True
-            print(f"✅ Email sent successfully to {request.email}")
-            
-        except Exception as e:
-            print(f"❌ Failed to send email: {str(e)}")
-            email_sent = False
+    # Delivery happens in the background; see email_outbox.py
+    email_queued = False
+    if email_sender.configured:
+        await email_outbox.enqueue(
+            db, request.email, 'رمز إعادة تعيين كلمة المرور - سوق سوريا',
+            password_reset_email(reset_code), kind="password_reset"
+        )
+        email_sender.notify()
+        email_queued = True
     
     # Return response with code in development mode
     # In production, remove the 'code' field for security
     dev_mode = os.environ.get('ENVIRONMENT', 'development') == 'development'
     
     return {
-        "message": "تم إرسال رمز التحقق" if email_sent else "تم إنشاء رمز التحقق",
-        "code": reset_code if dev_mode and not email_sent else None,
-        "email_sent": email_sent
+        "message": "سيتم إرسال رمز التحقق إلى بريدك الإلكتروني" if email_queued else "تم إنشاء رمز التحقق",
+        "code": reset_code if dev_mode and not email_queued else None,
+        "email_queued": email_queued
     }
 
 @api_router.post("/auth/reset-password")
@@ -407,16 +636,18 @@ async def reset_password(request: ResetPasswordRequest):
         raise HTTPException(status_code=400, detail="Invalid or expired reset code")
     
     # Hash new password
-    password_hash = bcrypt.hashpw(request.new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    password_hash = await hash_password(request.new_password)
     
     # Update user password
-    result = await db.users.update_one(
+    user = await db.users.find_one_and_update(
         {"email": request.email},
-        {"$set": {"password_hash": password_hash}}
+        {"$set": {"password_hash": password_hash}},
+        projection={"_id": 0, "id": 1}
     )
     
-    if result.modified_count == 0:
+    if not user:
         raise HTTPException(status_code=404, detail="User not found")
+    invalidate_principal(user['id'])
     
     # Mark reset code as used
     await db.password_resets.update_one(
@@ -442,27 +673,23 @@ async def create_store(store_data: StoreCreate, current_user: dict = Depends(get
     )
     
     doc = store.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.stores.insert_one(doc)
+    response_cache.invalidate("stores")
     return store
 
 @api_router.get("/stores", response_model=List[Store])
-async def get_stores(status: Optional[str] = None):
-    query = {}
-    if status:
-        query['status'] = status
-    stores = await db.stores.find(query, {"_id": 0}).to_list(1000)
-    for store in stores:
-        if isinstance(store.get('created_at'), str):
-            store['created_at'] = datetime.fromisoformat(store['created_at'])
-    return stores
+async def get_stores(request: Request, status: Optional[str] = None):
+    async def load():
+        query = {}
+        if status:
+            query['status'] = status
+        stores = await db.stores.find(query, {"_id": 0}).to_list(1000)
+        return [Store(**store) for store in stores]
+    return await cached_response(request, ("stores",), load)
 
 @api_router.get("/stores/my")
-async def get_my_stores(current_user: dict = Depends(get_current_user)):
+async def get_my_stores(current_user: dict = Depends(get_token_principal)):
     stores = await db.stores.find({"owner_id": current_user['id']}, {"_id": 0}).to_list(100)
-    for store in stores:
-        if isinstance(store.get('created_at'), str):
-            store['created_at'] = datetime.fromisoformat(store['created_at'])
     return stores
 
 @api_router.patch("/stores/{store_id}/approve")
@@ -478,6 +705,7 @@ async def approve_store(store_id: str, status: str, current_user: dict = Depends
     if result.matched_count == 0:
         raise HTTPException(status_code=404, detail="Store not found")
     
+    response_cache.invalidate("stores")
     return {"message": "Store status updated"}
 
 @api_router.delete("/stores/{store_id}")
@@ -491,7 +719,13 @@ async def delete_store(store_id: str, current_user: dict = Depends(get_current_u
         raise HTTPException(status_code=404, detail="Store not found")
     
     # Delete all products from this store
+    product_ids = await db.products.distinct("id", {"store_id": store_id})
     products_result = await db.products.delete_many({"store_id": store_id})
+    for product_id in product_ids:
+        product_search.remove(product_id)
+        product_similarity.remove(product_id)
+    invalidate_products(*product_ids)
+    response_cache.invalidate("stores")
     
     # Delete the store
     await db.stores.delete_one({"id": store_id})
@@ -503,9 +737,11 @@ async def delete_store(store_id: str, current_user: dict = Depends(get_current_u
 
 # ============= Category Routes =============
 @api_router.get("/categories", response_model=List[Category])
-async def get_categories():
-    categories = await db.categories.find({}, {"_id": 0}).to_list(100)
-    return categories
+async def get_categories(request: Request):
+    async def load():
+        categories = await db.categories.find({}, {"_id": 0}).to_list(100)
+        return [Category(**category) for category in categories]
+    return await cached_response(request, ("categories",), load)
 
 @api_router.post("/categories")
 async def create_category(category: Category, current_user: dict = Depends(get_current_user)):
@@ -514,6 +750,7 @@ async def create_category(category: Category, current_user: dict = Depends(get_c
     
     doc = category.model_dump()
     await db.categories.insert_one(doc)
+    response_cache.invalidate("categories")
     return category
 
 # ============= Product Routes =============
@@ -534,23 +771,64 @@ async def create_product(product_data: ProductCreate, current_user: dict = Depen
         description=product_data.description,
         price=product_data.price,
         images=product_data.images,
-        stock=product_data.stock
+        stock=product_data.stock,
+        sizes=product_data.sizes,
+        colors=product_data.colors,
+        shoe_sizes=product_data.shoe_sizes
     )
     
     doc = product.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
     await db.products.insert_one(doc)
+    product_search.add(doc)
+    product_similarity.upsert(doc)
+    invalidate_products()
     return product
 
-@api_router.get("/products")
-async def get_products(
+async def reindex_product(product_id: str):
+    product = await db.products.find_one({"id": product_id}, PRODUCT_INDEX_PROJECTION)
+    if product:
+        product_search.add(product)
+        product_similarity.upsert(product)
+    else:
+        product_search.remove(product_id)
+        product_similarity.remove(product_id)
+    invalidate_products(product_id)
+
+# ============= Catalog Pagination =============
+PRODUCT_PAGE_SIZE = 48
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(values: list) -> str:
+    raw = json_util.dumps(values).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json_util.loads(raw)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    if not isinstance(values, list):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+def keyset_filter(sort_spec: list, values: list) -> dict:
+    """Match documents strictly after `values` in `sort_spec` order."""
+    if len(values) != len(sort_spec):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    clauses = []
+    for i, (field, direction) in enumerate(sort_spec):
+        clause = {f: v for (f, _), v in zip(sort_spec[:i], values[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+def build_product_query(
     category_id: Optional[str] = None,
     store_id: Optional[str] = None,
     min_price: Optional[float] = None,
-    max_price: Optional[float] = None,
-    search: Optional[str] = None,
-    sort_by: Optional[str] = None  # newest, price_low, price_high, rating
-):
+    max_price: Optional[float] = None
+) -> dict:
     query = {"status": "active"}
     if category_id:
         query['category_id'] = category_id
@@ -562,67 +840,253 @@ async def get_products(
     if max_price is not None:
         query['price'] = query.get('price', {})
         query['price']['$lte'] = max_price
-    if search:
-        query['$or'] = [
-            {'name': {'$regex': search, '$options': 'i'}},
-            {'description': {'$regex': search, '$options': 'i'}}
-        ]
-    
-    products = await db.products.find(query, {"_id": 0}).to_list(1000)
-    
-    # Get reviews for rating sort
-    if sort_by == 'rating':
+    return query
+
+def apply_search(query: dict, search: Optional[str]) -> Optional[dict]:
+    """Restrict `query` to products matching `search`. Returns the BM25 score
+    of each match when the search index served it, otherwise None."""
+    if not search:
+        return None
+    if product_search.ready:
+        search_scores = dict(product_search.search(search))
+        query['id'] = {'$in': list(search_scores)}
+        return search_scores
+    # Index still building: fall back to a literal substring scan
+    pattern = re.escape(search)
+    query['$or'] = [
+        {'name': {'$regex': pattern, '$options': 'i'}},
+        {'description': {'$regex': pattern, '$options': 'i'}}
+    ]
+    return None
+
+# ============= Sparse Fieldsets =============
+# What a product grid tile needs. `images` is cut to the first image.
+CARD_FIELDS = ("id", "name", "price", "images", "stock", "avg_rating", "review_count")
+PRODUCT_FIELDS = set(Product.model_fields)
+
+def product_projection(fields: Optional[str]) -> dict:
+    """MongoDB projection for a `fields=` parameter: a comma separated list of
+    product fields and/or the presets `card` (the default) and `full`."""
+    names = set()
+    card = False
+    for name in (fields or 'card').split(','):
+        name = name.strip()
+        if name == 'full':
+            return {"_id": 0}
+        if name == 'card':
+            card = True
+            names.update(CARD_FIELDS)
+        elif name in PRODUCT_FIELDS:
+            names.add(name)
+        elif name:
+            raise HTTPException(status_code=400, detail=f"Unknown product field: {name}")
+    projection = {"_id": 0, "id": 1, **{name: 1 for name in names}}
+    if card and 'images' not in (fields or '').split(','):
+        projection['images'] = {"$slice": 1}
+    return projection
+
+def apply_card_images(products: list, projection: dict) -> list:
+    """Swap the first image of card projections for its thumbnail"""
+    if projection.get('images') == {"$slice": 1}:
         for product in products:
-            reviews = await db.reviews.find({"product_id": product['id']}).to_list(100)
-            product['avg_rating'] = sum(r['rating'] for r in reviews) / len(reviews) if reviews else 0
-    
-    # Sort products
-    if sort_by == 'newest':
-        products.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-    elif sort_by == 'price_low':
-        products.sort(key=lambda x: x.get('price', 0))
-    elif sort_by == 'price_high':
-        products.sort(key=lambda x: x.get('price', 0), reverse=True)
-    elif sort_by == 'rating':
-        products.sort(key=lambda x: x.get('avg_rating', 0), reverse=True)
-    
-    for product in products:
-        if isinstance(product.get('created_at'), str):
-            product['created_at'] = datetime.fromisoformat(product['created_at'])
-    
+            if product.get('images'):
+                product['images'] = [image_store.card_thumbnail(product['images'][0])]
     return products
 
+def get_loaders() -> RequestLoaders:
+    """Batching id loaders shared by everything that runs for one request"""
+    return RequestLoaders(db)
+
+async def find_products_by_ids(product_ids: list, projection: dict) -> dict:
+    """Products keyed by id, in one query"""
+    products = await db.products.find({"id": {"$in": list(product_ids)}}, projection).to_list(None)
+    return {p['id']: p for p in products}
+
+async def list_products(
+    category_id: Optional[str],
+    store_id: Optional[str],
+    min_price: Optional[float],
+    max_price: Optional[float],
+    search: Optional[str],
+    sort_by: Optional[str],
+    limit: int,
+    cursor: Optional[str],
+    projection: dict
+) -> tuple:
+    """One page of products and the cursor of the next page (or None)"""
+    query = build_product_query(category_id, store_id, min_price, max_price)
+    search_scores = apply_search(query, search)
+    
+    next_cursor = None
+    if search_scores is not None and sort_by in (None, 'relevance'):
+        # Rank only the ids that pass the other filters, then load one page
+        matched = await db.products.distinct("id", query)
+        ranked = sorted(matched, key=lambda pid: (-search_scores[pid], pid))
+        if cursor:
+            values = decode_cursor(cursor)
+            # A cursor from another sort order has other keys
+            if (len(values) != 2 or isinstance(values[0], bool) or not isinstance(values[0], (int, float))
+                    or not isinstance(values[1], str)):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+            last_score, last_id = values
+            ranked = [pid for pid in ranked if (-search_scores[pid], pid) > (-last_score, last_id)]
+        page_ids = ranked[:limit]
+        if len(ranked) > limit:
+            next_cursor = encode_cursor([search_scores[page_ids[-1]], page_ids[-1]])
+        by_id = await find_products_by_ids(page_ids, projection)
+        products = [by_id[pid] for pid in page_ids if pid in by_id]
+    else:
+        sort_spec = PRODUCT_SORTS.get(sort_by, PRODUCT_SORTS[None])
+        if cursor:
+            query = {"$and": [query, keyset_filter(sort_spec, decode_cursor(cursor))]}
+        # The cursor needs the sort keys, even when they were not asked for
+        sort_fields = [field for field, _ in sort_spec]
+        if projection == {"_id": 0}:
+            # Whole documents: only _id has to be let through and dropped again
+            find_projection, extra_fields = None, ['_id']
+        else:
+            extra_fields = [f for f in sort_fields if not projection.get(f)]
+            find_projection = dict(projection, **{f: 1 for f in extra_fields})
+        products = await db.products.find(query, find_projection).sort(sort_spec).limit(limit + 1).to_list(limit + 1)
+        if len(products) > limit:
+            products = products[:limit]
+            next_cursor = encode_cursor([products[-1].get(field) for field in sort_fields])
+        for product in products:
+            for field in extra_fields:
+                product.pop(field, None)
+    
+    return apply_card_images(products, projection), next_cursor
+
+@api_router.get("/products")
+async def get_products(
+    request: Request,
+    category_id: Optional[str] = None,
+    store_id: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    search: Optional[str] = None,
+    sort_by: Optional[str] = None,  # newest, price_low, price_high, rating, most_wished, relevance
+    limit: int = Query(PRODUCT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None
+):
+    """One page of products. The cursor for the next page, if any, is
+    returned in the X-Next-Cursor header."""
+    projection = product_projection(fields)
+    headers = {}
+    
+    async def load():
+        products, next_cursor = await list_products(
+            category_id, store_id, min_price, max_price, search, sort_by, limit, cursor, projection
+        )
+        if next_cursor:
+            headers['X-Next-Cursor'] = next_cursor
+        return products
+    
+    return await cached_response(request, ("products",), load, headers)
+
+def _count_by(path: str, unwind: Optional[str] = None) -> list:
+    stages = [{"$unwind": unwind}] if unwind else []
+    return stages + [
+        {"$group": {"_id": path, "count": {"$sum": 1}}},
+        {"$match": {"_id": {"$ne": None}}},
+        {"$sort": {"count": -1, "_id": 1}},
+        {"$project": {"_id": 0, "value": "$_id", "count": 1}}
+    ]
+
+@api_router.get("/products/facets")
+async def get_product_facets(
+    request: Request,
+    category_id: Optional[str] = None,
+    store_id: Optional[str] = None,
+    min_price: Optional[float] = None,
+    max_price: Optional[float] = None,
+    search: Optional[str] = None,
+    price_buckets: int = Query(5, ge=1, le=20)
+):
+    """Facet counts for the products matching the given filters"""
+    async def load():
+        query = build_product_query(category_id, store_id, min_price, max_price)
+        apply_search(query, search)
+        
+        pipeline = [
+            {"$match": query},
+            {"$facet": {
+                "total": [{"$count": "count"}],
+                "categories": _count_by("$category_id"),
+                "stores": _count_by("$store_id"),
+                "sizes": _count_by("$sizes", unwind="$sizes"),
+                "shoe_sizes": _count_by("$shoe_sizes", unwind="$shoe_sizes"),
+                "colors": _count_by("$colors.name", unwind="$colors"),
+                "price_range": [
+                    {"$group": {"_id": None, "min": {"$min": "$price"}, "max": {"$max": "$price"}}}
+                ],
+                "price_histogram": [
+                    {"$bucketAuto": {"groupBy": "$price", "buckets": price_buckets}},
+                    {"$project": {"_id": 0, "min": "$_id.min", "max": "$_id.max", "count": 1}}
+                ]
+            }}
+        ]
+        result = (await db.products.aggregate(pipeline).to_list(1))[0]
+        
+        price_range = result['price_range'][0] if result['price_range'] else {"min": None, "max": None}
+        return {
+            "total": result['total'][0]['count'] if result['total'] else 0,
+            "categories": result['categories'],
+            "stores": result['stores'],
+            "sizes": result['sizes'],
+            "shoe_sizes": result['shoe_sizes'],
+            "colors": result['colors'],
+            "price": {
+                "min": price_range['min'],
+                "max": price_range['max'],
+                "histogram": result['price_histogram']
+            }
+        }
+    
+    return await cached_response(request, ("products",), load)
+
 @api_router.get("/products/{product_id}")
-async def get_product(product_id: str):
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if isinstance(product.get('created_at'), str):
-        product['created_at'] = datetime.fromisoformat(product['created_at'])
-    return product
+async def get_product(request: Request, product_id: str):
+    async def load():
+        product = await db.products.find_one({"id": product_id}, {"_id": 0})
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return product
+    return await cached_response(request, (f"product:{product_id}",), load)
 
 @api_router.get("/products/{product_id}/similar")
-async def get_similar_products(product_id: str, limit: int = 4):
-    # Get the product
-    product = await db.products.find_one({"id": product_id}, {"_id": 0})
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    # Find similar products from same category
-    similar = await db.products.find({
-        "category_id": product['category_id'],
-        "id": {"$ne": product_id},
-        "status": "active"
-    }, {"_id": 0}).limit(limit).to_list(limit)
-    
-    for p in similar:
-        if isinstance(p.get('created_at'), str):
-            p['created_at'] = datetime.fromisoformat(p['created_at'])
+async def get_similar_products(
+    request: Request,
+    product_id: str,
+    limit: int = Query(4, ge=1, le=50),
+    fields: Optional[str] = None
+):
+    projection = product_projection(fields)
     
-    return similar
+    async def load():
+        # Get the product
+        product = await db.products.find_one({"id": product_id}, PRODUCT_INDEX_PROJECTION)
+        if not product:
+            raise HTTPException(status_code=404, detail="Product not found")
+        
+        similar_ids = product_similarity.similar(product, limit) if product_similarity.ready else []
+        if similar_ids:
+            by_id = await find_products_by_ids(similar_ids, projection)
+            similar = [by_id[pid] for pid in similar_ids if pid in by_id]
+        else:
+            # Engine cold or nothing scored: find similar products from same category
+            similar = await db.products.find({
+                "category_id": product['category_id'],
+                "id": {"$ne": product_id},
+                "status": "active"
+            }, projection).limit(limit).to_list(limit)
+        
+        return apply_card_images(similar, projection)
+    return await cached_response(request, ("products",), load)
 
 @api_router.patch("/products/{product_id}")
-async def update_product(product_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
+async def update_product(product_id: str, updates: ProductUpdate, current_user: dict = Depends(get_current_user)):
     product = await db.products.find_one({"id": product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -631,11 +1095,14 @@ async def update_product(product_id: str, updates: dict, current_user: dict = De
     if store['owner_id'] != current_user['id'] and current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    await db.products.update_one({"id": product_id}, {"$set": updates})
+    fields = updates.model_dump(exclude_unset=True)
+    if fields:
+        await db.products.update_one({"id": product_id}, {"$set": fields})
+    await reindex_product(product_id)
     return {"message": "Product updated"}
 
 @api_router.put("/products/{product_id}")
-async def update_product_full(product_id: str, updates: dict, current_user: dict = Depends(get_current_user)):
+async def update_product_full(product_id: str, updates: ProductUpdate, current_user: dict = Depends(get_current_user)):
     product = await db.products.find_one({"id": product_id}, {"_id": 0})
     if not product:
         raise HTTPException(status_code=404, detail="Product not found")
@@ -644,9 +1111,10 @@ async def update_product_full(product_id: str, updates: dict, current_user: dict
     if store['owner_id'] != current_user['id'] and current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Not authorized")
     
-    # Keep the original store_id
-    updates['store_id'] = product['store_id']
-    await db.products.update_one({"id": product_id}, {"$set": updates})
+    fields = updates.model_dump(exclude_unset=True)
+    if fields:
+        await db.products.update_one({"id": product_id}, {"$set": fields})
+    await reindex_product(product_id)
     return {"message": "Product updated"}
 
 @api_router.delete("/products/{product_id}")
@@ -660,6 +1128,9 @@ async def delete_product(product_id: str, current_user: dict = Depends(get_curre
         raise HTTPException(status_code=403, detail="Not authorized")
     
     await db.products.delete_one({"id": product_id})
+    product_search.remove(product_id)
+    product_similarity.remove(product_id)
+    invalidate_products(product_id)
     return {"message": "Product deleted"}
 
 # ============= Image Upload Route =============
@@ -668,288 +1139,501 @@ async def upload_image(file: UploadFile = File(...), current_user: dict = Depend
     if current_user['role'] not in ['store_owner', 'admin']:
         raise HTTPException(status_code=403, detail="Only store owners can upload images")
     
-    # Read file content
-    contents = await file.read()
+    try:
+        image_hash, created = await image_store.save_upload(file)
+    except image_store.ImageTooLarge:
+        raise HTTPException(status_code=413, detail="Image too large")
+    try:
+        width, height = await image_store.ensure_variants(image_hash)
+    except image_store.InvalidImage:
+        # Only drop the blob if this upload created it; an existing one may be in use
+        if created:
+            await asyncio.to_thread(image_store.discard, image_hash)
+        raise HTTPException(status_code=400, detail="Invalid image")
+    
+    # Stored relative, like migrate_inline_images.py writes them; clients
+    # resolve it against the API origin
+    url = image_store.image_url(image_hash)
+    return {
+        "url": url,
+        "image_url": url,
+        "hash": image_hash,
+        "width": width,
+        "height": height,
+        "thumbnails": {variant: f"{url}/{variant}" for variant in sorted(image_store.VARIANTS)}
+    }
+
+@api_router.get("/images/{image_hash}")
+async def get_image(request: Request, image_hash: str, variant: Optional[str] = None):
+    if not image_store.HASH_RE.match(image_hash) or (variant and variant not in image_store.VARIANTS):
+        raise HTTPException(status_code=404, detail="Image not found")
     
-    # Convert to base64
-    base64_image = base64.b64encode(contents).decode('utf-8')
+    path = image_store.blob_path(image_hash, variant)
+    if variant and not path.exists() and image_store.blob_path(image_hash).exists():
+        # Variant of an image stored before it was introduced
+        try:
+            await image_store.ensure_variants(image_hash)
+        except image_store.InvalidImage:
+            pass
+    if not path.exists():
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    # Blobs never change, so the hash is the validator
+    etag = f'"{image_hash}.{variant}"' if variant else f'"{image_hash}"'
+    headers = {
+        "ETag": etag,
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes"
+    }
+    if etag_matches(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
     
-    # Create data URL
-    file_ext = file.filename.split('.')[-1].lower()
-    mime_type = f"image/{file_ext}" if file_ext in ['jpg', 'jpeg', 'png', 'gif', 'webp'] else "image/jpeg"
-    data_url = f"data:{mime_type};base64,{base64_image}"
+    size = path.stat().st_size
+    with open(path, 'rb') as f:
+        media_type = image_store.sniff_mime(f.read(16))
     
-    return {"url": data_url, "image_url": data_url}
+    range_header = request.headers.get('range')
+    if_range = request.headers.get('if-range')
+    if if_range and if_range != etag:
+        range_header = None
+    try:
+        byte_range = image_store.parse_range(range_header, size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    if byte_range is None:
+        start, end, status_code = 0, size - 1, 200
+    else:
+        (start, end), status_code = byte_range, 206
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(
+        image_store.iter_file(path, start, end - start + 1),
+        status_code=status_code,
+        media_type=media_type,
+        headers=headers
+    )
+
+@api_router.get("/images/{image_hash}/{variant}")
+async def get_image_variant(request: Request, image_hash: str, variant: str):
+    return await get_image(request, image_hash, variant)
 
 # ============= Cart Routes =============
 @api_router.get("/cart")
-async def get_cart(current_user: dict = Depends(get_current_user)):
+async def get_cart(fields: Optional[str] = None, current_user: dict = Depends(get_token_principal),
+                   loaders: RequestLoaders = Depends(get_loaders)):
+    projection = product_projection(fields)
     cart = await db.carts.find_one({"user_id": current_user['id']}, {"_id": 0})
     if not cart:
         return {"items": []}
     
     # Fetch product details
-    enriched_items = []
-    for item in cart.get('items', []):
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if product:
-            enriched_items.append({
-                "product": product,
-                "quantity": item['quantity']
-            })
+    items = cart.get('items', [])
+    products = await loaders.get("products", projection).load_many(item['product_id'] for item in items)
+    apply_card_images([p for p in products if p], projection)
+    enriched_items = [
+        {"product": product, "quantity": item['quantity']}
+        for item, product in zip(items, products) if product
+    ]
     
     return {"items": enriched_items}
 
 @api_router.post("/cart/add")
 async def add_to_cart(item: CartItem, current_user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user['id']}, {"_id": 0})
-    
-    if not cart:
-        cart = Cart(user_id=current_user['id'], items=[])
-        doc = cart.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.carts.insert_one(doc)
-    
-    items = cart.get('items', []) if isinstance(cart, dict) else []
-    existing_item = next((i for i in items if i['product_id'] == item.product_id), None)
-    
-    if existing_item:
-        existing_item['quantity'] += item.quantity
-    else:
-        items.append({"product_id": item.product_id, "quantity": item.quantity})
-    
-    await db.carts.update_one(
-        {"user_id": current_user['id']},
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    
+    if item.quantity < 1:
+        raise HTTPException(status_code=400, detail="Quantity must be at least 1")
+    await cart_ops.add_item(db, current_user['id'], item.product_id, item.quantity)
     return {"message": "Item added to cart"}
 
+@api_router.put("/cart")
+async def set_cart(cart: CartReplace, current_user: dict = Depends(get_current_user)):
+    """Replace the whole cart, e.g. when merging a guest cart after login"""
+    items = await cart_ops.replace_items(db, current_user['id'], [item.model_dump() for item in cart.items])
+    return {"items": items}
+
+@api_router.put("/cart/{product_id}")
+async def set_cart_quantity(product_id: str, update: CartQuantity, current_user: dict = Depends(get_current_user)):
+    await cart_ops.set_quantity(db, current_user['id'], product_id, update.quantity)
+    return {"message": "Cart updated"}
+
 @api_router.delete("/cart/{product_id}")
 async def remove_from_cart(product_id: str, current_user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user['id']}, {"_id": 0})
-    if not cart:
+    if not await cart_ops.remove_item(db, current_user['id'], product_id):
         raise HTTPException(status_code=404, detail="Cart not found")
-    
-    items = [i for i in cart.get('items', []) if i['product_id'] != product_id]
-    await db.carts.update_one(
-        {"user_id": current_user['id']},
-        {"$set": {"items": items, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
-    
     return {"message": "Item removed from cart"}
 
 # ============= Order Routes =============
 @api_router.post("/orders")
 async def create_order(order_data: OrderCreate, current_user: dict = Depends(get_current_user)):
-    cart = await db.carts.find_one({"user_id": current_user['id']}, {"_id": 0})
-    if not cart or not cart.get('items'):
+    def build_order(items: list, total: float, discount: float, coupon_code: Optional[str]) -> dict:
+        order = Order(
+            customer_id=current_user['id'],
+            items=items,
+            total_amount=max(0, total - discount),
+            shipping_address=order_data.shipping_address,
+            phone=order_data.phone,
+            payment_method=order_data.payment_method
+        )
+        doc = order.model_dump()
+        doc['original_total'] = total
+        doc['discount'] = discount
+        doc['coupon_code'] = coupon_code
+        doc['status_history'] = [{"status": order.status, "at": order.created_at, "by": current_user['id']}]
+        return doc
+    
+    coupon = await load_coupon(order_data.coupon_code) if order_data.coupon_code else None
+    try:
+        doc = await checkout.place_order(
+            db, current_user['id'], coupon, build_order,
+            transactions=checkout_transactions
+        )
+    except checkout.EmptyCart:
         raise HTTPException(status_code=400, detail="Cart is empty")
+    except checkout.OutOfStock as e:
+        raise HTTPException(status_code=409, detail=f"Not enough stock for: {', '.join(e.products)}")
     
-    # Calculate total
-    total = 0
-    order_items = []
-    for item in cart['items']:
-        product = await db.products.find_one({"id": item['product_id']}, {"_id": 0})
-        if product:
-            total += product['price'] * item['quantity']
-            order_items.append({
-                "product_id": product['id'],
-                "product_name": product['name'],
-                "price": product['price'],
-                "quantity": item['quantity']
-            })
-    
-    # Apply coupon if provided
-    discount = 0
-    coupon_code = None
-    if order_data.coupon_code:
-        coupon = await db.coupons.find_one({"code": order_data.coupon_code.upper(), "active": True}, {"_id": 0})
-        if coupon:
-            # Check validity
-            if coupon.get('expires_at'):
-                expires = datetime.fromisoformat(coupon['expires_at']) if isinstance(coupon['expires_at'], str) else coupon['expires_at']
-                if expires >= datetime.now(timezone.utc):
-                    if coupon['max_uses'] == 0 or coupon['used_count'] < coupon['max_uses']:
-                        if total >= coupon['min_purchase']:
-                            # Apply discount
-                            if coupon['discount_type'] == 'percentage':
-                                discount = total * (coupon['discount_value'] / 100)
-                            else:
-                                discount = coupon['discount_value']
-                            
-                            coupon_code = coupon['code']
-                            # Increment usage
-                            await db.coupons.update_one(
-                                {"code": coupon['code']},
-                                {"$inc": {"used_count": 1}}
-                            )
-    
-    final_total = max(0, total - discount)
-    
-    order = Order(
-        customer_id=current_user['id'],
-        items=order_items,
-        total_amount=final_total,
-        shipping_address=order_data.shipping_address,
-        phone=order_data.phone,
-        payment_method=order_data.payment_method
-    )
-    
-    doc = order.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    doc['original_total'] = total
-    doc['discount'] = discount
-    doc['coupon_code'] = coupon_code
-    await db.orders.insert_one(doc)
-    
-    # Clear cart
-    await db.carts.update_one(
-        {"user_id": current_user['id']},
-        {"$set": {"items": []}}
-    )
-    
-    return order
+    invalidate_products(*(item['product_id'] for item in doc['items']))
+    return Order(**doc)
 
 @api_router.get("/orders/my")
-async def get_my_orders(current_user: dict = Depends(get_current_user)):
+async def get_my_orders(current_user: dict = Depends(get_token_principal)):
     orders = await db.orders.find({"customer_id": current_user['id']}, {"_id": 0}).to_list(100)
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
     return orders
 
+ORDER_SORT = [("created_at", -1), ("id", -1)]
+ORDER_PAGE_SIZE = 100
+
+def order_filter(
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+) -> dict:
+    query = {}
+    if status:
+        query['status'] = status
+    if date_from or date_to:
+        query['created_at'] = {}
+        if date_from:
+            query['created_at']['$gte'] = as_datetime(date_from)
+        if date_to:
+            query['created_at']['$lte'] = as_datetime(date_to)
+    return query
+
 @api_router.get("/orders/store")
-async def get_store_orders(current_user: dict = Depends(get_current_user)):
-    """Get orders for store owner's products"""
-    # Find user's store
-    store = await db.stores.find_one({"owner_id": current_user['id'], "status": "approved"}, {"_id": 0})
+async def get_store_orders(
+    response: Response,
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    limit: int = Query(ORDER_PAGE_SIZE, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
+    """Orders containing the owner's products, newest first. Each order
+    carries only this store's items and their subtotal as `total`; the
+    cursor for the next page is returned in the X-Next-Cursor header."""
+    store = await db.stores.find_one({"owner_id": current_user['id'], "status": "approved"}, {"_id": 0, "id": 1})
     if not store:
         return []
     
-    # Find products from this store
-    store_products = await db.products.find({"store_id": store['id']}, {"_id": 0}).to_list(1000)
-    product_ids = [p['id'] for p in store_products]
-    
-    # Find orders containing these products
-    all_orders = await db.orders.find({}, {"_id": 0}).to_list(1000)
-    store_orders = []
-    
-    for order in all_orders:
-        order_items = order.get('items', [])
-        for item in order_items:
-            if item.get('product_id') in product_ids:
-                # Calculate total for this store's items
-                store_total = sum(
-                    i.get('price', 0) * i.get('quantity', 1) 
-                    for i in order_items 
-                    if i.get('product_id') in product_ids
-                )
-                order['total'] = store_total
-                store_orders.append(order)
-                break
-    
-    return store_orders
+    match = {"items.store_id": store['id'], **order_filter(status, date_from, date_to)}
+    if cursor:
+        match = {"$and": [match, keyset_filter(ORDER_SORT, decode_cursor(cursor))]}
+    
+    orders = await db.orders.aggregate([
+        {"$match": match},
+        {"$sort": dict(ORDER_SORT)},
+        {"$limit": limit + 1},
+        {"$unwind": "$items"},
+        {"$match": {"items.store_id": store['id']}},
+        {"$group": {
+            "_id": "$id",
+            "order": {"$first": "$$ROOT"},
+            "items": {"$push": "$items"},
+            "total": {"$sum": {"$multiply": ["$items.price", "$items.quantity"]}}
+        }},
+        {"$set": {"order.items": "$items", "order.total": "$total"}},
+        {"$replaceRoot": {"newRoot": "$order"}},
+        {"$sort": dict(ORDER_SORT)},
+        {"$project": {"_id": 0}}
+    ]).to_list(limit + 1)
+    
+    if len(orders) > limit:
+        orders = orders[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor([orders[-1]['created_at'], orders[-1]['id']])
+    return orders
 
 @api_router.get("/orders")
-async def get_all_orders(current_user: dict = Depends(get_current_user)):
+async def get_all_orders(current_user: dict = Depends(get_token_principal)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can view all orders")
     
     orders = await db.orders.find({}, {"_id": 0}).to_list(1000)
-    for order in orders:
-        if isinstance(order.get('created_at'), str):
-            order['created_at'] = datetime.fromisoformat(order['created_at'])
     return orders
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_SORT = [("created_at", 1), ("id", 1)]
+EXPORT_CSV_COLUMNS = (
+    "id", "created_at", "status", "customer_id", "payment_method", "phone", "shipping_address",
+    "original_total", "discount", "coupon_code", "total_amount", "items"
+)
+
+def export_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def export_rows(orders: list, format: str) -> str:
+    if format == 'ndjson':
+        return ''.join(json.dumps(order, default=export_value, ensure_ascii=False) + '\n' for order in orders)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for order in orders:
+        order = dict(order, items=json.dumps(order.get('items', []), default=export_value, ensure_ascii=False))
+        if isinstance(order.get('created_at'), datetime):
+            order['created_at'] = order['created_at'].isoformat()
+        writer.writerow([order.get(column) for column in EXPORT_CSV_COLUMNS])
+    return buffer.getvalue()
+
+@api_router.get("/orders/export")
+async def export_orders(
+    format: str = Query('ndjson', pattern='^(ndjson|csv)$'),
+    status: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None,
+    store_id: Optional[str] = None,
+    after: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
+    """Every matching order, oldest first, streamed from one server-side
+    cursor a batch at a time. An interrupted export resumes with
+    `after=<id of the last order received>`."""
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Only admins can export orders")
+    
+    query = order_filter(status, date_from, date_to)
+    if store_id:
+        query['items.store_id'] = store_id
+    if after:
+        last = await db.orders.find_one({"id": after}, {"_id": 0, "created_at": 1, "id": 1})
+        if not last:
+            raise HTTPException(status_code=400, detail="Unknown resume order id")
+        query = {"$and": [query, keyset_filter(EXPORT_SORT, [last['created_at'], last['id']])]}
+    
+    cursor = db.orders.find(query, {"_id": 0}).sort(EXPORT_SORT).batch_size(EXPORT_BATCH_SIZE)
+    
+    async def stream():
+        if format == 'csv':
+            yield ','.join(EXPORT_CSV_COLUMNS) + '\r\n'
+        try:
+            batch = []
+            async for order in cursor:
+                batch.append(order)
+                if len(batch) >= EXPORT_BATCH_SIZE:
+                    yield export_rows(batch, format)
+                    batch = []
+            if batch:
+                yield export_rows(batch, format)
+        finally:
+            await cursor.close()
+    
+    media_type = 'application/x-ndjson' if format == 'ndjson' else 'text/csv; charset=utf-8'
+    return StreamingResponse(stream(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="orders.{format}"'
+    })
+
+# Fulfilment stages in order; an order may move forward any number of stages
+ORDER_STAGES = ["pending", "confirmed", "processing", "shipped", "out_for_delivery", "delivered"]
+# Stages an order can still be cancelled from
+CANCELLABLE_STAGES = {"pending", "confirmed", "processing"}
+
+def can_transition(current: str, new: str) -> bool:
+    if new == "cancelled":
+        return current in CANCELLABLE_STAGES
+    if current not in ORDER_STAGES or new not in ORDER_STAGES:
+        return False
+    return ORDER_STAGES.index(new) > ORDER_STAGES.index(current)
+
+async def transition_orders(order_ids: List[str], status: str, current_user: dict) -> List[dict]:
+    """Move each order to `status` if that is a valid transition from its
+    current status, in one bulk_write. Returns one result per order id."""
+    if status != "cancelled" and status not in ORDER_STAGES:
+        raise HTTPException(status_code=400, detail=f"Invalid status. Must be one of: {ORDER_STAGES + ['cancelled']}")
+    
+    query = {"id": {"$in": order_ids}}
+    store = None
+    if current_user['role'] != 'admin':
+        # Store owners may only move orders that contain their products
+        store = await db.stores.find_one({"owner_id": current_user['id'], "status": "approved"}, {"_id": 0, "id": 1})
+        if not store:
+            raise HTTPException(status_code=403, detail="Permission denied")
+        query['items.store_id'] = store['id']
+    orders = {o['id']: o async for o in db.orders.find(
+        query, {"_id": 0, "id": 1, "status": 1, "items": 1, "stock_reserved": 1}
+    )}
+    
+    now = datetime.now(timezone.utc)
+    batch_id = str(uuid.uuid4())
+    results = {}
+    updates = []
+    for order_id in dict.fromkeys(order_ids):
+        order = orders.get(order_id)
+        if not order:
+            results[order_id] = {"order_id": order_id, "ok": False, "error": "not_found"}
+        elif not can_transition(order['status'], status):
+            results[order_id] = {"order_id": order_id, "ok": False, "error": "invalid_transition", "status": order['status']}
+        elif status == "cancelled" and store and any(
+            item.get('store_id') != store['id'] for item in order.get('items', [])
+        ):
+            # Other stores may still be fulfilling their part; only an admin cancels it
+            results[order_id] = {"order_id": order_id, "ok": False, "error": "multi_store_order"}
+        else:
+            results[order_id] = {"order_id": order_id, "ok": True, "status": status, "previous_status": order['status']}
+            # Conditional on the status read above, so a concurrent change is not overwritten
+            updates.append(UpdateOne({"id": order_id, "status": order['status']}, {
+                "$set": {"status": status, "updated_at": now},
+                "$push": {"status_history": {
+                    "status": status, "previous_status": order['status'],
+                    "at": now, "by": current_user['id'], "batch_id": batch_id
+                }}
+            }))
+    
+    if updates:
+        result = await db.orders.bulk_write(updates, ordered=False)
+        if result.modified_count < len(updates):
+            attempted = [r['order_id'] for r in results.values() if r['ok']]
+            applied = {o['id'] async for o in db.orders.find(
+                {"id": {"$in": attempted}, "status_history.batch_id": batch_id}, {"_id": 0, "id": 1}
+            )}
+            for order_id in attempted:
+                if order_id not in applied:
+                    results[order_id] = {"order_id": order_id, "ok": False, "error": "conflict"}
+    
+    # Cancelled orders hand their stock back, if checkout took it; orders
+    # placed before stock was reserved at checkout never decremented it
+    restock = {}
+    for r in results.values():
+        if r['ok'] and status == "cancelled" and orders[r['order_id']].get('stock_reserved'):
+            for item in orders[r['order_id']].get('items', []):
+                restock[item['product_id']] = restock.get(item['product_id'], 0) + item['quantity']
+    if restock:
+        await db.products.bulk_write([
+            UpdateOne({"id": pid}, {"$inc": {"stock": quantity}}) for pid, quantity in restock.items()
+        ], ordered=False)
+        invalidate_products(*restock)
+    
+    return list(results.values())
+
+class BulkOrderStatus(BaseModel):
+    order_ids: List[str] = Field(min_length=1, max_length=1000)
+    status: str
+
+@api_router.post("/orders/status")
+async def bulk_update_order_status(update: BulkOrderStatus, current_user: dict = Depends(get_current_user)):
+    """Apply one status transition to many orders; results are per order"""
+    if current_user['role'] not in ['admin', 'store_owner']:
+        raise HTTPException(status_code=403, detail="Permission denied")
+    
+    results = await transition_orders(update.order_ids, update.status, current_user)
+    return {"updated": sum(r['ok'] for r in results), "results": results}
+
 @api_router.patch("/orders/{order_id}/status")
 async def update_order_status(order_id: str, status: str, current_user: dict = Depends(get_current_user)):
     # Allow admins and store owners to update order status
     if current_user['role'] not in ['admin', 'store_owner']:
         raise HTTPException(status_code=403, detail="Permission denied")
     
-    result = await db.orders.update_one(
-        {"id": order_id},
-        {"$set": {"status": status}}
-    )
-    
-    if result.matched_count == 0:
+    result = (await transition_orders([order_id], status, current_user))[0]
+    if result.get('error') == 'not_found':
         raise HTTPException(status_code=404, detail="Order not found")
+    if result.get('error') == 'multi_store_order':
+        raise HTTPException(status_code=403, detail="Orders with items from other stores can only be cancelled by an admin")
+    if result.get('error') == 'invalid_transition':
+        raise HTTPException(status_code=409, detail=f"Cannot change order status from {result['status']} to {status}")
+    if result.get('error') == 'conflict':
+        raise HTTPException(status_code=409, detail="Order status changed concurrently, please retry")
     
     return {"message": "Order status updated"}
 
 # ============= Wishlist Routes =============
 @api_router.get("/wishlist")
-async def get_wishlist(current_user: dict = Depends(get_current_user)):
+async def get_wishlist(fields: Optional[str] = None, current_user: dict = Depends(get_token_principal),
+                       loaders: RequestLoaders = Depends(get_loaders)):
+    projection = product_projection(fields)
     wishlist = await db.wishlists.find_one({"user_id": current_user['id']}, {"_id": 0})
     if not wishlist:
         return {"products": []}
     
     # Fetch product details
-    products = []
-    for product_id in wishlist.get('product_ids', []):
-        product = await db.products.find_one({"id": product_id}, {"_id": 0})
-        if product:
-            products.append(product)
+    products = await loaders.get("products", projection).load_many(dict.fromkeys(wishlist.get('product_ids', [])))
+    products = [p for p in products if p]
+    apply_card_images(products, projection)
     
     return {"products": products}
 
 @api_router.post("/wishlist/add/{product_id}")
 async def add_to_wishlist(product_id: str, current_user: dict = Depends(get_current_user)):
-    wishlist = await db.wishlists.find_one({"user_id": current_user['id']}, {"_id": 0})
-    
-    if not wishlist:
-        wishlist = Wishlist(user_id=current_user['id'], product_ids=[product_id])
-        doc = wishlist.model_dump()
-        doc['updated_at'] = doc['updated_at'].isoformat()
-        await db.wishlists.insert_one(doc)
-    else:
-        product_ids = wishlist.get('product_ids', [])
-        if product_id not in product_ids:
-            product_ids.append(product_id)
-            await db.wishlists.update_one(
-                {"user_id": current_user['id']},
-                {"$set": {"product_ids": product_ids, "updated_at": datetime.now(timezone.utc).isoformat()}}
-            )
+    try:
+        added = await wishlist_ops.add_product(db, current_user['id'], product_id)
+    except wishlist_ops.UnknownProduct:
+        raise HTTPException(status_code=404, detail="Product not found")
+    except wishlist_ops.WishlistFull:
+        raise HTTPException(status_code=400, detail=f"Wishlist is limited to {wishlist_ops.MAX_ITEMS} products")
+    if added:
+        # wishlist_count moved; cached lists sorted by it are stale
+        invalidate_products(product_id)
     
     return {"message": "Product added to wishlist"}
 
 @api_router.delete("/wishlist/remove/{product_id}")
 async def remove_from_wishlist(product_id: str, current_user: dict = Depends(get_current_user)):
-    wishlist = await db.wishlists.find_one({"user_id": current_user['id']}, {"_id": 0})
-    if not wishlist:
-        raise HTTPException(status_code=404, detail="Wishlist not found")
-    
-    product_ids = [pid for pid in wishlist.get('product_ids', []) if pid != product_id]
-    await db.wishlists.update_one(
-        {"user_id": current_user['id']},
-        {"$set": {"product_ids": product_ids, "updated_at": datetime.now(timezone.utc).isoformat()}}
-    )
+    if not await wishlist_ops.remove_product(db, current_user['id'], product_id):
+        if not await db.wishlists.count_documents({"user_id": current_user['id']}, limit=1):
+            raise HTTPException(status_code=404, detail="Wishlist not found")
+    else:
+        invalidate_products(product_id)
     
     return {"message": "Product removed from wishlist"}
 
 # ============= Reviews Routes =============
+# Review orders; both end in the unique id so they can be keyset paged
+REVIEW_SORTS = {
+    'newest': [("created_at", -1), ("id", -1)],
+    'helpful': [("helpful_count", -1), ("created_at", -1), ("id", -1)],
+}
+REVIEW_PAGE_SIZE = 20
+
 @api_router.get("/products/{product_id}/reviews")
-async def get_product_reviews(product_id: str):
-    reviews = await db.reviews.find({"product_id": product_id}, {"_id": 0}).to_list(100)
-    
-    # Enrich with user names
-    enriched_reviews = []
-    for review in reviews:
-        user = await db.users.find_one({"id": review['user_id']}, {"_id": 0, "name": 1})
-        review_data = review.copy()
-        review_data['user_name'] = user.get('name', 'مستخدم') if user else 'مستخدم'
-        if isinstance(review_data.get('created_at'), str):
-            review_data['created_at'] = datetime.fromisoformat(review_data['created_at'])
-        enriched_reviews.append(review_data)
-    
-    # Calculate average rating
-    avg_rating = sum(r['rating'] for r in reviews) / len(reviews) if reviews else 0
+async def get_product_reviews(
+    product_id: str,
+    response: Response,
+    sort_by: str = Query('newest', pattern="^(newest|helpful)$"),
+    limit: int = Query(REVIEW_PAGE_SIZE, ge=1, le=100),
+    cursor: Optional[str] = None
+):
+    """One page of a product's reviews with the product's rating summary.
+    The cursor for the next page is returned in the X-Next-Cursor header."""
+    sort_spec = REVIEW_SORTS[sort_by]
+    query = {"product_id": product_id}
+    if cursor:
+        query = {"$and": [query, keyset_filter(sort_spec, decode_cursor(cursor))]}
+    
+    product, reviews = await asyncio.gather(
+        db.products.find_one({"id": product_id}, {"_id": 0, "avg_rating": 1, "review_count": 1, "rating_histogram": 1}),
+        db.reviews.find(query, {"_id": 0}).sort(sort_spec).limit(limit + 1).to_list(limit + 1)
+    )
+    if len(reviews) > limit:
+        reviews = reviews[:limit]
+        response.headers['X-Next-Cursor'] = encode_cursor([reviews[-1].get(field) for field, _ in sort_spec])
     
+    product = product or {}
+    histogram = {str(star): 0 for star in range(1, 6)}
+    histogram.update(product.get('rating_histogram') or {})
     return {
-        "reviews": enriched_reviews,
-        "average_rating": round(avg_rating, 1),
-        "total_reviews": len(reviews)
+        "reviews": reviews,
+        "average_rating": round(product.get('avg_rating', 0), 1),
+        "total_reviews": product.get('review_count', 0),
+        "rating_histogram": histogram
     }
 
 @api_router.post("/reviews")
@@ -963,73 +1647,127 @@ async def create_review(review_data: ReviewCreate, current_user: dict = Depends(
     if existing:
         raise HTTPException(status_code=400, detail="You already reviewed this product")
     
+    if not 1 <= review_data.rating <= 5:
+        raise HTTPException(status_code=400, detail="Rating must be between 1 and 5")
+    
     review = Review(
         product_id=review_data.product_id,
         user_id=current_user['id'],
+        user_name=current_user['name'],
         rating=review_data.rating,
         comment=review_data.comment
     )
     
     doc = review.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    await db.reviews.insert_one(doc)
+    try:
+        await db.reviews.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="You already reviewed this product")
+    
+    # Fold the new rating into the product's aggregates in one atomic update
+    star = f"rating_histogram.{review.rating}"
+    await db.products.update_one({"id": review.product_id}, [
+        {"$set": {
+            "rating_sum": {"$add": [{"$ifNull": ["$rating_sum", 0]}, review.rating]},
+            "review_count": {"$add": [{"$ifNull": ["$review_count", 0]}, 1]},
+            star: {"$add": [{"$ifNull": [f"${star}", 0]}, 1]}
+        }},
+        {"$set": {"avg_rating": {"$divide": ["$rating_sum", "$review_count"]}}}
+    ])
+    invalidate_products(review.product_id)
     
     return review
 
+@api_router.post("/reviews/{review_id}/helpful")
+async def mark_review_helpful(review_id: str, current_user: dict = Depends(get_current_user)):
+    review = await db.reviews.find_one({"id": review_id}, {"_id": 0, "user_id": 1})
+    if not review:
+        raise HTTPException(status_code=404, detail="Review not found")
+    if review['user_id'] == current_user['id']:
+        raise HTTPException(status_code=400, detail="You cannot vote on your own review")
+    
+    # The unique (review_id, user_id) index makes this one vote per user
+    try:
+        await db.review_votes.insert_one({
+            "review_id": review_id,
+            "user_id": current_user['id'],
+            "created_at": datetime.now(timezone.utc)
+        })
+    except DuplicateKeyError:
+        return {"message": "Already marked as helpful"}
+    await db.reviews.update_one({"id": review_id}, {"$inc": {"helpful_count": 1}})
+    
+    return {"message": "Marked as helpful"}
+
 # ============= Coupons Routes =============
+# Coupon documents by code, tagged "coupon:<code>". Unknown codes are cached
+# too (as {}), so create_coupon must invalidate. `remaining` is the use count
+# left when the entry was loaded; checkout enforces max_uses exactly on the
+# counters, validate_coupon only reads this snapshot.
+COUPON_CACHE_TTL = float(os.environ.get('COUPON_CACHE_TTL', 30))
+coupon_cache = ResponseCache(maxsize=int(os.environ.get('COUPON_CACHE_SIZE', 1000)), ttl=COUPON_CACHE_TTL)
+
+async def load_coupon(code: str) -> Optional[dict]:
+    """Active coupon with this code, cached, or None"""
+    code = code.upper()
+    coupon = coupon_cache.get(code)
+    if coupon is None:
+        tags = (f"coupon:{code}",)
+        generation = coupon_cache.generation(tags)
+        coupon = await db.coupons.find_one({"code": code, "active": True}, {"_id": 0}) or {}
+        if coupon:
+            coupon = await coupons.ensure_counters(db, coupon)
+            coupon['remaining'] = (await coupons.usage(db, [coupon]))[code]['remaining']
+        coupon_cache.set(code, coupon, tags, generation)
+    return dict(coupon) if coupon else None
+
 @api_router.post("/coupons")
 async def create_coupon(coupon_data: CouponCreate, current_user: dict = Depends(get_current_user)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can create coupons")
     
-    # Check if code exists
-    existing = await db.coupons.find_one({"code": coupon_data.code.upper()})
-    if existing:
-        raise HTTPException(status_code=400, detail="Coupon code already exists")
-    
     coupon = Coupon(
         code=coupon_data.code.upper(),
         discount_type=coupon_data.discount_type,
         discount_value=coupon_data.discount_value,
         min_purchase=coupon_data.min_purchase,
         max_uses=coupon_data.max_uses,
-        expires_at=datetime.fromisoformat(coupon_data.expires_at) if coupon_data.expires_at else None
+        expires_at=as_datetime(coupon_data.expires_at) if coupon_data.expires_at else None
     )
     
     doc = coupon.model_dump()
-    doc['created_at'] = doc['created_at'].isoformat()
-    if doc.get('expires_at'):
-        doc['expires_at'] = doc['expires_at'].isoformat()
     
-    await db.coupons.insert_one(doc)
+    # The unique index on code rejects duplicates
+    try:
+        await db.coupons.insert_one(doc)
+    except DuplicateKeyError:
+        raise HTTPException(status_code=400, detail="Coupon code already exists")
+    await coupons.ensure_counters(db, doc)
+    coupon_cache.invalidate(f"coupon:{coupon.code}")
     return coupon
 
 @api_router.get("/coupons/validate/{code}")
 async def validate_coupon(code: str, total: float):
-    coupon = await db.coupons.find_one({"code": code.upper(), "active": True}, {"_id": 0})
+    coupon = await load_coupon(code)
     
     if not coupon:
         raise HTTPException(status_code=404, detail="Coupon not found")
     
     # Check expiry
     if coupon.get('expires_at'):
-        expires = datetime.fromisoformat(coupon['expires_at']) if isinstance(coupon['expires_at'], str) else coupon['expires_at']
+        expires = as_datetime(coupon['expires_at'])
         if expires < datetime.now(timezone.utc):
             raise HTTPException(status_code=400, detail="Coupon expired")
     
     # Check max uses
-    if coupon['max_uses'] > 0 and coupon['used_count'] >= coupon['max_uses']:
+    if coupon['remaining'] == 0:
         raise HTTPException(status_code=400, detail="Coupon limit reached")
     
     # Check minimum purchase
     if total < coupon['min_purchase']:
         raise HTTPException(status_code=400, detail=f"Minimum purchase of {coupon['min_purchase']} required")
     
-    # Calculate discount
-    if coupon['discount_type'] == 'percentage':
-        discount = total * (coupon['discount_value'] / 100)
-    else:
-        discount = coupon['discount_value']
+    discount = coupons.discount(coupon, total)
     
     return {
         "valid": True,
@@ -1038,12 +1776,16 @@ async def validate_coupon(code: str, total: float):
     }
 
 @api_router.get("/coupons")
-async def get_coupons(current_user: dict = Depends(get_current_user)):
+async def get_coupons(current_user: dict = Depends(get_token_principal)):
     if current_user['role'] != 'admin':
         raise HTTPException(status_code=403, detail="Only admins can view all coupons")
     
-    coupons = await db.coupons.find({}, {"_id": 0}).to_list(100)
-    return coupons
+    coupon_list = await db.coupons.find({}, {"_id": 0}).to_list(100)
+    # Redemptions are counted on the coupon's counters, not the document
+    counts = await coupons.usage(db, coupon_list)
+    for coupon in coupon_list:
+        coupon['used_count'] = counts[coupon['code']]['used_count']
+    return coupon_list
 
 # Health check
 @api_router.get("/")
@@ -1211,18 +1953,274 @@ async def stripe_webhook(request: Request):
         raise HTTPException(status_code=400, detail=str(e))
 
 # ============= Chat Endpoints =============
+# Messages are ordered by (created_at, id); since= and before= cursors encode that pair
+CHAT_SORT = [("created_at", 1), ("id", 1)]
+CHAT_HISTORY_SORT = [(field, -direction) for field, direction in CHAT_SORT]
+CHAT_PAGE_SIZE = 100
+# Seconds an idle stream waits before checking MongoDB and sending a keepalive
+CHAT_STREAM_IDLE = float(os.environ.get('CHAT_STREAM_IDLE', 15))
+
+def chat_now() -> datetime:
+    """Current time at the millisecond precision MongoDB stores, so pushed
+    messages and ones read back later carry the same cursor"""
+    now = datetime.now(timezone.utc)
+    return now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+def chat_cursor(message: dict) -> str:
+    return encode_cursor([message['created_at'], message['id']])
+
+def chat_position(cursor: str) -> tuple:
+    """(created_at, id) a chat cursor points at; 400 unless it has that shape"""
+    values = decode_cursor(cursor)
+    if len(values) != 2 or not isinstance(values[0], (datetime, str)) or not isinstance(values[1], str):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        return as_datetime(values[0]), values[1]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def conversation_topic(store_id: str, customer_id: str) -> str:
+    return f"chat:{store_id}:{customer_id}"
+
+def store_chat_topic(store_id: str) -> str:
+    return f"store-chat:{store_id}"
+
+async def update_conversation(message: dict, store: dict, customer_id: str, from_customer: bool,
+                              customer_name: Optional[str]):
+    """Fold a new message into the (store, customer) conversation document"""
+    names = {"customer_name": customer_name} if customer_name else {}
+    update = {
+        "$set": {"store_name": store['store_name'], **(names if from_customer else {})},
+        # Embedded documents compare field by field, created_at first, so
+        # concurrent writes still leave the newest message in place
+        "$max": {
+            "last_message_at": message['created_at'],
+            "last_message": {
+                "created_at": message['created_at'],
+                "id": message['id'],
+                "sender_type": message['sender_type'],
+                "message": message['message'],
+            },
+        },
+        "$inc": {"unread_store" if from_customer else "unread_customer": 1},
+        "$setOnInsert": {
+            "id": str(uuid.uuid4()),
+            "created_at": message['created_at'],
+            "unread_customer" if from_customer else "unread_store": 0,
+            **({} if from_customer else names),
+        },
+    }
+    key = {"store_id": store['id'], "customer_id": customer_id}
+    try:
+        await db.conversations.update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first message created the conversation; now it matches
+        await db.conversations.update_one(key, update, upsert=True)
+
+async def deliver_chat_message(message: dict, store: dict, from_customer: bool,
+                               customer_name: Optional[str] = None):
+    """Store a message, update its conversation and push it to open streams.
+    The conversation is the one of `message['customer_id']`."""
+    customer_id = message['customer_id']
+    await db.chat_messages.insert_one(message)
+    await update_conversation(message, store, customer_id, from_customer, customer_name)
+    chat_broker.publish(
+        [conversation_topic(store['id'], customer_id), store_chat_topic(store['id'])],
+        {k: v for k, v in message.items() if k != '_id'}
+    )
 
-@api_router.get("/chat/{store_id}")
-async def get_chat_messages(store_id: str, current_user: dict = Depends(get_current_user)):
-    """Get chat messages between current user and a store"""
-    messages = await db.chat_messages.find({
+async def chat_messages_since(query: dict, since: Optional[str], limit: int = CHAT_PAGE_SIZE) -> list:
+    """Messages matching `query`, oldest first. Without a cursor, the latest
+    `limit`; with one, the first `limit` after it."""
+    if since:
+        query = {"$and": [query, keyset_filter(CHAT_SORT, list(chat_position(since)))]}
+        return await db.chat_messages.find(query, {"_id": 0}).sort(CHAT_SORT).limit(limit).to_list(limit)
+    messages = await db.chat_messages.find(query, {"_id": 0}).sort(CHAT_HISTORY_SORT).limit(limit).to_list(limit)
+    return messages[::-1]
+
+async def chat_history(store_id: str, customer_id: str, before: Optional[str], limit: int) -> list:
+    """A conversation's messages, oldest first: the latest `limit`, or the
+    `limit` before the `before` cursor. Once chat_messages runs out, older
+    pages come from the archive."""
+    query = customer_chat_query(store_id, customer_id)
+    position = None
+    if before:
+        position = chat_position(before)
+        query = {"$and": [query, keyset_filter(CHAT_HISTORY_SORT, list(position))]}
+    messages = await db.chat_messages.find(query, {"_id": 0}).sort(CHAT_HISTORY_SORT).limit(limit).to_list(limit)
+    if len(messages) < limit:
+        messages += await chat_archive.read_before(
+            db, store_id, customer_id, position, limit - len(messages), [m['id'] for m in messages]
+        )
+    return messages[::-1]
+
+async def chat_page(store_id: str, customer_id: str, response: Response, since: Optional[str],
+                    before: Optional[str], limit: int) -> list:
+    """Messages after `since`, or a page of history (before `before`).
+    X-Next-Cursor is the cursor to poll or stream with next; X-Prev-Cursor,
+    set when a full page of history came back, fetches the page before it."""
+    if since:
+        messages = await chat_messages_since(customer_chat_query(store_id, customer_id), since, limit)
+    else:
+        messages = await chat_history(store_id, customer_id, before, limit)
+        if len(messages) == limit:
+            response.headers['X-Prev-Cursor'] = chat_cursor(messages[0])
+    if not before:
+        cursor = chat_cursor(messages[-1]) if messages else since
+        if cursor:
+            response.headers['X-Next-Cursor'] = cursor
+    return messages
+
+def chat_event_stream(query: dict, topics: list, since: Optional[str]) -> StreamingResponse:
+    """Server-Sent Events: everything after `since` from MongoDB, then each
+    message as it is published. Event ids are cursors, so a reconnecting
+    EventSource resumes through Last-Event-ID."""
+    # Validated here: once streaming starts the 200 has been sent
+    start = chat_position(since) if since else None
+    
+    def event(message: dict) -> str:
+        data = json.dumps(jsonable_encoder(message), ensure_ascii=False)
+        return f"id: {chat_cursor(message)}\nevent: message\ndata: {data}\n\n"
+    
+    async def events():
+        cursor = since
+        # (created_at, id) of the last message sent; pushed ones at or before it are repeats
+        last = start
+        
+        def sent(message: dict) -> str:
+            nonlocal cursor, last
+            cursor, last = chat_cursor(message), (message['created_at'], message['id'])
+            return event(message)
+        
+        # Subscribe before reading the backlog so nothing falls in between
+        with chat_broker.subscribe(*topics) as subscription:
+            yield "retry: 3000\n\n"
+            if cursor is None:
+                # Nothing to catch up on; idle polls start after the latest message
+                latest = await chat_messages_since(query, None, 1)
+                cursor = chat_cursor(latest[0]) if latest else None
+            else:
+                while True:
+                    backlog = await chat_messages_since(query, cursor)
+                    for message in backlog:
+                        yield sent(message)
+                    if len(backlog) < CHAT_PAGE_SIZE:
+                        break
+            
+            while not subscription.closed:
+                message = await subscription.get(CHAT_STREAM_IDLE)
+                if message is None:
+                    if subscription.closed:
+                        # Overflowed or shutting down; the client reconnects and catches up
+                        break
+                    # Pick up messages sent through other workers, if any. Without a
+                    # cursor the conversation was empty when the stream opened.
+                    backlog = await chat_messages_since(query, cursor)
+                    for message in backlog:
+                        yield sent(message)
+                    if not backlog:
+                        yield ": keepalive\n\n"
+                elif last is None or (message['created_at'], message['id']) > last:
+                    yield sent(message)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def customer_chat_query(store_id: str, user_id: str) -> dict:
+    return {
         "store_id": store_id,
         "$or": [
-            {"sender_id": current_user['id']},
-            {"receiver_id": current_user['id']}
+            {"sender_id": user_id},
+            {"receiver_id": user_id}
         ]
-    }, {"_id": 0}).sort("created_at", 1).to_list(100)
-    return messages
+    }
+
+# Inbox order: most recently active first, id as the tie-breaker
+CONVERSATION_SORT = [("last_message_at", -1), ("id", -1)]
+CONVERSATION_PAGE_SIZE = 50
+
+async def conversations_page(query: dict, response: Response, limit: int, cursor: Optional[str]) -> list:
+    """One page of conversations; the next page's cursor goes in X-Next-Cursor"""
+    if cursor:
+        query = {"$and": [query, keyset_filter(CONVERSATION_SORT, decode_cursor(cursor))]}
+    conversations = await db.conversations.find(query, {"_id": 0}).sort(CONVERSATION_SORT).limit(limit + 1).to_list(limit + 1)
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        response.headers['X-Next-Cursor'] = encode_cursor([last['last_message_at'], last['id']])
+    return conversations
+
+async def owned_store(current_user: dict) -> dict:
+    store = await db.stores.find_one({"owner_id": current_user['id']}, {"_id": 0})
+    if not store:
+        raise HTTPException(status_code=404, detail="Store not found")
+    return store
+
+@api_router.post("/chat/stream-token")
+async def issue_stream_token(current_user: dict = Depends(get_token_principal)):
+    """Token for one of the /stream routes; open the stream within
+    `expires_in` seconds"""
+    return {"token": create_stream_token(current_user), "expires_in": STREAM_TOKEN_EXPIRE_SECONDS}
+
+@api_router.get("/chat/store/stream")
+async def stream_store_chat_messages(
+    request: Request,
+    since: Optional[str] = None,
+    current_user: dict = Depends(get_stream_principal)
+):
+    """Server-Sent Events with every new message of the owner's store"""
+    store = await owned_store(current_user)
+    return chat_event_stream(
+        {"store_id": store['id']}, [store_chat_topic(store['id'])],
+        # An EventSource reconnect sends the last event it saw; the since= baked
+        # into its URL only applies to the first connection
+        request.headers.get('last-event-id') or since
+    )
+
+@api_router.get("/chat/{store_id}/stream")
+async def stream_chat_messages(
+    store_id: str,
+    request: Request,
+    since: Optional[str] = None,
+    current_user: dict = Depends(get_stream_principal)
+):
+    """Server-Sent Events with new messages between the current user and a store"""
+    return chat_event_stream(
+        customer_chat_query(store_id, current_user['id']), [conversation_topic(store_id, current_user['id'])],
+        # An EventSource reconnect sends the last event it saw; the since= baked
+        # into its URL only applies to the first connection
+        request.headers.get('last-event-id') or since
+    )
+
+@api_router.get("/chat/conversations")
+async def get_my_conversations(
+    response: Response,
+    limit: int = Query(CONVERSATION_PAGE_SIZE, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
+    """The current user's conversations with stores, most recently active first"""
+    return await conversations_page({"customer_id": current_user['id']}, response, limit, cursor)
+
+@api_router.post("/chat/{store_id}/read")
+async def mark_conversation_read(store_id: str, current_user: dict = Depends(get_current_user)):
+    await db.conversations.update_one(
+        {"store_id": store_id, "customer_id": current_user['id']}, {"$set": {"unread_customer": 0}}
+    )
+    return {"message": "Conversation marked as read"}
+
+@api_router.get("/chat/{store_id}")
+async def get_chat_messages(
+    store_id: str,
+    response: Response,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=200),
+    current_user: dict = Depends(get_token_principal)
+):
+    """Get chat messages between current user and a store, oldest first: the
+    latest page, the page before `before`, or those after `since`"""
+    return await chat_page(store_id, current_user['id'], response, since, before, limit)
 
 @api_router.post("/chat/send")
 async def send_chat_message(data: dict, current_user: dict = Depends(get_current_user)):
@@ -1246,43 +2244,52 @@ async def send_chat_message(data: dict, current_user: dict = Depends(get_current
         "sender_name": current_user['name'],
         "sender_type": "customer" if current_user['role'] == 'customer' else "store_owner",
         "receiver_id": store['owner_id'],
+        # Whoever writes to a store is the customer side of the conversation
+        "customer_id": current_user['id'],
         "message": message_text,
         "product_id": product_id,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": chat_now()
     }
     
-    await db.chat_messages.insert_one(message)
+    await deliver_chat_message(message, store, True, current_user['name'])
     return {"message": "Message sent", "id": message['id']}
 
 @api_router.get("/chat/store/messages")
-async def get_store_chat_messages(current_user: dict = Depends(get_current_user)):
-    """Get all chat messages for store owner"""
-    # Find user's store
-    store = await db.stores.find_one({"owner_id": current_user['id']}, {"_id": 0})
-    if not store:
-        raise HTTPException(status_code=404, detail="Store not found")
-    
-    messages = await db.chat_messages.find(
-        {"store_id": store['id']},
-        {"_id": 0}
-    ).sort("created_at", -1).to_list(500)
-    
-    # Group by customer
-    conversations = {}
-    for msg in messages:
-        customer_id = msg['sender_id'] if msg['sender_type'] == 'customer' else msg.get('receiver_id')
-        if customer_id not in conversations:
-            conversations[customer_id] = {
-                "customer_id": customer_id,
-                "customer_name": msg.get('sender_name') if msg['sender_type'] == 'customer' else 'Unknown',
-                "messages": [],
-                "last_message": None
-            }
-        conversations[customer_id]['messages'].append(msg)
-        if not conversations[customer_id]['last_message']:
-            conversations[customer_id]['last_message'] = msg
-    
-    return list(conversations.values())
+async def get_store_chat_messages(
+    response: Response,
+    limit: int = Query(CONVERSATION_PAGE_SIZE, ge=1, le=200),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_token_principal)
+):
+    """Store owner's inbox: one entry per customer with the last message and
+    unread counts, most recently active first"""
+    store = await owned_store(current_user)
+    conversations = await conversations_page({"store_id": store['id']}, response, limit, cursor)
+    for conversation in conversations:
+        conversation['customer_name'] = conversation.get('customer_name') or 'Unknown'
+    return conversations
+
+@api_router.get("/chat/store/conversations/{customer_id}")
+async def get_store_conversation(
+    customer_id: str,
+    response: Response,
+    since: Optional[str] = None,
+    before: Optional[str] = None,
+    limit: int = Query(CHAT_PAGE_SIZE, ge=1, le=200),
+    current_user: dict = Depends(get_token_principal)
+):
+    """Messages between the owner's store and one customer, oldest first: the
+    latest page, the page before `before`, or those after `since`"""
+    store = await owned_store(current_user)
+    return await chat_page(store['id'], customer_id, response, since, before, limit)
+
+@api_router.post("/chat/store/conversations/{customer_id}/read")
+async def mark_store_conversation_read(customer_id: str, current_user: dict = Depends(get_current_user)):
+    store = await owned_store(current_user)
+    await db.conversations.update_one(
+        {"store_id": store['id'], "customer_id": customer_id}, {"$set": {"unread_store": 0}}
+    )
+    return {"message": "Conversation marked as read"}
 
 @api_router.post("/chat/store/reply")
 async def reply_to_chat(data: dict, current_user: dict = Depends(get_current_user)):
@@ -1293,10 +2300,7 @@ async def reply_to_chat(data: dict, current_user: dict = Depends(get_current_use
     if not customer_id or not message_text:
         raise HTTPException(status_code=400, detail="customer_id and message are required")
     
-    # Find user's store
-    store = await db.stores.find_one({"owner_id": current_user['id']}, {"_id": 0})
-    if not store:
-        raise HTTPException(status_code=404, detail="Store not found")
+    store = await owned_store(current_user)
     
     message = {
         "id": str(uuid.uuid4()),
@@ -1305,11 +2309,13 @@ async def reply_to_chat(data: dict, current_user: dict = Depends(get_current_use
         "sender_name": store['store_name'],
         "sender_type": "store_owner",
         "receiver_id": customer_id,
+        "customer_id": customer_id,
         "message": message_text,
-        "created_at": datetime.now(timezone.utc).isoformat()
+        "created_at": chat_now()
     }
     
-    await db.chat_messages.insert_one(message)
+    customer = await load_principal(customer_id)
+    await deliver_chat_message(message, store, False, customer['name'] if customer else None)
     return {"message": "Reply sent", "id": message['id']}
 
 # ============= Complaints Endpoints =============
@@ -1338,7 +2344,7 @@ async def create_complaint(data: dict, current_user: dict = Depends(get_current_
         "images": images,
         "status": "pending",
         "admin_response": None,
-        "created_at": datetime.now(timezone.utc).isoformat(),
+        "created_at": datetime.now(timezone.utc),
         "updated_at": None
     }
     
@@ -1346,7 +2352,7 @@ async def create_complaint(data: dict, current_user: dict = Depends(get_current_
     return {"message": "تم إرسال الشكوى بنجاح", "id": complaint['id']}
 
 @api_router.get("/complaints")
-async def get_complaints(current_user: dict = Depends(get_current_user)):
+async def get_complaints(current_user: dict = Depends(get_token_principal)):
     """Get complaints - admin/viewer sees all, customer sees own"""
     if current_user['role'] in ['admin', 'viewer']:
         complaints = await db.complaints.find({}, {"_id": 0}).sort("created_at", -1).to_list(500)
@@ -1358,7 +2364,7 @@ async def get_complaints(current_user: dict = Depends(get_current_user)):
     return complaints
 
 @api_router.get("/complaints/{complaint_id}")
-async def get_complaint(complaint_id: str, current_user: dict = Depends(get_current_user)):
+async def get_complaint(complaint_id: str, current_user: dict = Depends(get_token_principal)):
     """Get single complaint"""
     complaint = await db.complaints.find_one({"id": complaint_id}, {"_id": 0})
     if not complaint:
@@ -1380,7 +2386,7 @@ async def update_complaint(complaint_id: str, data: dict, current_user: dict = D
     if not complaint:
         raise HTTPException(status_code=404, detail="Complaint not found")
     
-    update_data = {"updated_at": datetime.now(timezone.utc).isoformat()}
+    update_data = {"updated_at": datetime.now(timezone.utc)}
     
     if 'status' in data:
         update_data['status'] = data['status']
@@ -1393,7 +2399,7 @@ async def update_complaint(complaint_id: str, data: dict, current_user: dict = D
 # ============= Users Management =============
 
 @api_router.get("/users")
-async def get_users(current_user: dict = Depends(get_current_user)):
+async def get_users(current_user: dict = Depends(get_token_principal)):
     """Get all users - admin/viewer only"""
     if current_user['role'] not in ['admin', 'viewer']:
         raise HTTPException(status_code=403, detail="Permission denied")
@@ -1430,6 +2436,7 @@ async def update_user_role(user_id: str, role_data: UpdateUserRole, current_user
     
     # Update role
     await db.users.update_one({"id": user_id}, {"$set": {"role": role_data.role}})
+    invalidate_principal(user_id)
     
     return {"message": "Role updated successfully", "new_role": role_data.role}
 
@@ -1451,9 +2458,44 @@ async def delete_user(user_id: str, current_user: dict = Depends(get_current_use
     
     # Delete user
     await db.users.delete_one({"id": user_id})
+    invalidate_principal(user_id)
     
     return {"message": "User deleted successfully"}
 
+# ============= Metrics =============
+metrics.register("principal_cache", lambda: {
+    "entries": len(principal_cache),
+    "hits": principal_cache.hits,
+    "misses": principal_cache.misses,
+    "hit_rate": hit_rate(principal_cache.hits, principal_cache.misses),
+    "trusted_claims_served": trusted_claims_served,
+    "lookup": principal_latency.snapshot(),
+    "db_lookup": principal_db_latency.snapshot(),
+})
+metrics.register("password_hashing", password_hasher.stats)
+metrics.register("email_outbox", email_sender.stats)
+metrics.register("chat_broker", chat_broker.stats)
+metrics.register("chat_archive", chat_archiver.stats)
+metrics.register("loaders", lambda: dict(loader_stats))
+metrics.register("coupon_cache", lambda: {
+    "entries": len(coupon_cache),
+    "hits": coupon_cache.hits,
+    "misses": coupon_cache.misses,
+    "hit_rate": hit_rate(coupon_cache.hits, coupon_cache.misses),
+})
+metrics.register("response_cache", lambda: {
+    "entries": len(response_cache),
+    "hits": response_cache.hits,
+    "misses": response_cache.misses,
+    "hit_rate": hit_rate(response_cache.hits, response_cache.misses),
+})
+
+@api_router.get("/metrics")
+async def get_metrics(current_user: dict = Depends(get_token_principal)):
+    if current_user['role'] != 'admin':
+        raise HTTPException(status_code=403, detail="Permission denied")
+    return metrics.snapshot()
+
 app.include_router(api_router, prefix="/api")
 
 app.add_middleware(
@@ -1462,6 +2504,7 @@ app.add_middleware(
     allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "ETag"],
 )
 
 logging.basicConfig(
@@ -1470,10 +2513,68 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@app.on_event("startup")
+async def create_indexes():
+    failures = await ensure_indexes(db)
+    if failures:
+        logger.warning(f"{len(failures)} indexes could not be created, see errors above")
+
+@app.on_event("startup")
+async def build_product_indexes():
+    product_search.clear()
+    products = []
+    async for product in db.products.find({}, PRODUCT_INDEX_PROJECTION):
+        product_search.add(product)
+        products.append(product)
+    product_search.ready = True
+    product_similarity.build(products)
+    logger.info(
+        f"Product indexes built: {len(product_search)} searchable, "
+        f"{len(product_similarity)} in similarity engine"
+    )
+
+@app.on_event("startup")
+async def detect_transactions():
+    global checkout_transactions
+    try:
+        checkout_transactions = await checkout.supports_transactions(db)
+    except Exception as e:
+        logger.error(f"Could not detect transaction support: {e}")
+    if not checkout_transactions:
+        logger.warning("MongoDB is not a replica set; checkout runs without transactions")
+
+@app.on_event("startup")
+async def start_email_sender():
+    email_sender.start()
+
+@app.on_event("startup")
+async def start_chat_archiver():
+    chat_archiver.start()
+
+@app.on_event("shutdown")
+async def stop_email_sender():
+    await email_sender.stop()
+
+@app.on_event("shutdown")
+async def stop_chat_archiver():
+    await chat_archiver.stop()
+
+@app.on_event("shutdown")
+async def close_chat_streams():
+    chat_broker.close()
+
 @app.on_event("shutdown")
 async def shutdown_db_client():
     client.close()
 
+@app.on_event("shutdown")
+async def shutdown_image_workers():
+    image_store.shutdown_pool()
+
+@app.on_event("shutdown")
+async def shutdown_password_hasher():
+    password_hasher.shutdown()
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8001)
\ No newline at end of file
@@ -0,0 +1,201 @@
+"""Content-based product similarity with TF-IDF vectors and NumPy.
+
+Each active product is turned into a bag of features: stemmed name and
+description terms (see search_index.analyze), its category, a logarithmic
+price band, and its sizes, shoe sizes and colors. Features are hashed into a
+fixed number of dimensions, weighted by TF-IDF and L2-normalized, so the
+cosine similarity of one product against the whole catalog is a single
+matrix-vector product. Raw term frequencies are kept sparse per row; only
+the weighted vectors are stored densely.
+
+IDF weights are frozen between refreshes; once enough of the catalog has been
+written since the last refresh, every row is re-weighted with fresh IDFs.
+"""
+import math
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from search_index import analyze
+
+DIMENSIONS = 1024
+NAME_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+CATEGORY_WEIGHT = 3.0
+PRICE_WEIGHT = 1.5
+ATTRIBUTE_WEIGHT = 1.0
+# Re-weight everything once this share of the catalog has been written
+IDF_REFRESH_RATIO = 0.2
+
+
+def price_band(price) -> Optional[int]:
+    """Bands of 1.5x width, so neighbouring prices share a band"""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return None
+    if price <= 0:
+        return None
+    return int(math.log(price, 1.5))
+
+
+def product_features(doc: dict) -> Dict[str, float]:
+    features: Dict[str, float] = {}
+
+    def add(feature: str, weight: float):
+        features[feature] = features.get(feature, 0.0) + weight
+
+    for term in analyze(doc.get('name')):
+        add(f"t:{term}", NAME_WEIGHT)
+    for term in analyze(doc.get('description')):
+        add(f"t:{term}", DESCRIPTION_WEIGHT)
+    if doc.get('category_id'):
+        add(f"cat:{doc['category_id']}", CATEGORY_WEIGHT)
+    band = price_band(doc.get('price'))
+    if band is not None:
+        add(f"price:{band}", PRICE_WEIGHT)
+        add(f"price:{band - 1}", PRICE_WEIGHT / 2)
+        add(f"price:{band + 1}", PRICE_WEIGHT / 2)
+    for size in doc.get('sizes') or []:
+        add(f"size:{str(size).lower()}", ATTRIBUTE_WEIGHT)
+    for size in doc.get('shoe_sizes') or []:
+        add(f"shoe:{size}", ATTRIBUTE_WEIGHT)
+    for color in doc.get('colors') or []:
+        name = color.get('name') if isinstance(color, dict) else color
+        if name:
+            add(f"color:{str(name).lower()}", ATTRIBUTE_WEIGHT)
+    return features
+
+
+class SimilarityEngine:
+    """Top-k cosine similarity over the active catalog"""
+
+    def __init__(self, dimensions: int = DIMENSIONS):
+        self.dimensions = dimensions
+        self.ready = False
+        self._ids: List[Optional[str]] = []
+        self._rows: Dict[str, int] = {}
+        self._free: List[int] = []
+        self._tf: List[Optional[Tuple[np.ndarray, np.ndarray]]] = []
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._active = np.zeros(0, dtype=bool)
+        self._df = np.zeros(dimensions, dtype=np.float64)
+        self._idf = np.ones(dimensions, dtype=np.float32)
+        self._writes_since_refresh = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def clear(self):
+        self.__init__(self.dimensions)
+
+    def _hash(self, features: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        """Sparse (dimension indices, sublinear tf values) of a feature bag"""
+        tf: Dict[int, float] = {}
+        for feature, weight in features.items():
+            dim = zlib.crc32(feature.encode('utf-8')) % self.dimensions
+            tf[dim] = tf.get(dim, 0.0) + ((1 + math.log(weight)) if weight >= 1 else weight)
+        return (np.fromiter(tf.keys(), dtype=np.int64, count=len(tf)),
+                np.fromiter(tf.values(), dtype=np.float32, count=len(tf)))
+
+    def _weigh(self, tf: Tuple[np.ndarray, np.ndarray]) -> np.ndarray:
+        dims, values = tf
+        vector = np.zeros(self.dimensions, dtype=np.float32)
+        vector[dims] = values * self._idf[dims]
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _grow(self):
+        capacity = max(64, 2 * len(self._ids))
+        extra = capacity - self._vectors.shape[0]
+        self._vectors = np.vstack([self._vectors, np.zeros((extra, self.dimensions), dtype=np.float32)])
+        self._active = np.concatenate([self._active, np.zeros(extra, dtype=bool)])
+
+    def _new_row(self, product_id: str) -> int:
+        if self._free:
+            row = self._free.pop()
+        else:
+            row = len(self._ids)
+            self._ids.append(None)
+            self._tf.append(None)
+            if row >= self._vectors.shape[0]:
+                self._grow()
+        self._ids[row] = product_id
+        self._rows[product_id] = row
+        return row
+
+    def refresh_idf(self):
+        n = len(self._rows)
+        self._idf = (np.log((1 + n) / (1 + self._df)) + 1).astype(np.float32)
+        for row, tf in enumerate(self._tf):
+            if tf is not None:
+                self._vectors[row] = self._weigh(tf)
+        self._writes_since_refresh = 0
+
+    def _maybe_refresh(self):
+        self._writes_since_refresh += 1
+        if self._writes_since_refresh > max(16, IDF_REFRESH_RATIO * len(self._rows)):
+            self.refresh_idf()
+
+    def upsert(self, doc: dict):
+        """Add or replace a product. Inactive products are removed."""
+        if doc.get('status', 'active') != 'active':
+            self.remove(doc['id'])
+            return
+
+        tf = self._hash(product_features(doc))
+        row = self._rows.get(doc['id'])
+        if row is None:
+            row = self._new_row(doc['id'])
+        else:
+            self._df[self._tf[row][0]] -= 1
+
+        self._df[tf[0]] += 1
+        self._tf[row] = tf
+        self._vectors[row] = self._weigh(tf)
+        self._active[row] = True
+        self._maybe_refresh()
+
+    def remove(self, product_id: str):
+        row = self._rows.pop(product_id, None)
+        if row is None:
+            return
+        self._df[self._tf[row][0]] -= 1
+        self._tf[row] = None
+        self._vectors[row] = 0
+        self._active[row] = False
+        self._ids[row] = None
+        self._free.append(row)
+        self._maybe_refresh()
+
+    def build(self, docs):
+        """Bulk-load products, then weigh them all at once"""
+        self.clear()
+        for doc in docs:
+            if doc.get('status', 'active') != 'active':
+                continue
+            row = self._new_row(doc['id'])
+            tf = self._hash(product_features(doc))
+            self._tf[row] = tf
+            self._df[tf[0]] += 1
+            self._active[row] = True
+        self.refresh_idf()
+        self.ready = True
+
+    def similar(self, doc: dict, k: int) -> List[str]:
+        """Ids of the `k` active products most similar to `doc`, best first"""
+        rows = len(self._ids)
+        if rows == 0 or k <= 0:
+            return []
+        query = self._weigh(self._hash(product_features(doc)))
+        scores = self._vectors[:rows] @ query
+        scores[~self._active[:rows]] = -np.inf
+        own_row = self._rows.get(doc.get('id'))
+        if own_row is not None:
+            scores[own_row] = -np.inf
+
+        k = min(k, rows)
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [self._ids[i] for i in top if scores[i] > 0]
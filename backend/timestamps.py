@@ -0,0 +1,12 @@
+"""Timestamp helpers shared by server.py and the modules it uses."""
+from datetime import datetime, timezone
+
+
+def as_datetime(value) -> datetime:
+    """Aware UTC datetime of a stored timestamp. ISO strings only remain in
+    documents that migrate_datetimes.py has not reached yet."""
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
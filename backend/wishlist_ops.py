@@ -0,0 +1,76 @@
+"""Wishlist mutations as single atomic updates, plus popularity counters.
+
+A wishlist keeps product ids in the order they were added and holds at most
+MAX_ITEMS. Adding is one conditional $push upsert that only matches while the
+product is absent and the list has room; removing is one $pull. Whenever the
+list actually changes, the product's `wishlist_count` is moved by one with
+$inc, so "most wished" rankings read an indexed field instead of scanning
+every wishlist. recount_wishlists.py rebuilds the counters from scratch.
+"""
+import uuid
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+MAX_ITEMS = 200
+
+
+class WishlistFull(Exception):
+    pass
+
+
+class UnknownProduct(Exception):
+    pass
+
+
+async def _count(db, product_id: str, delta: int) -> bool:
+    result = await db.products.update_one({"id": product_id}, {"$inc": {"wishlist_count": delta}})
+    return result.matched_count > 0
+
+
+async def add_product(db, user_id: str, product_id: str) -> bool:
+    """Append a product to the user's wishlist, creating it if needed.
+    Returns False if it was already there; raises WishlistFull or
+    UnknownProduct."""
+    update = {
+        "$push": {"product_ids": product_id},
+        "$set": {"updated_at": datetime.now(timezone.utc)},
+        "$setOnInsert": {"id": str(uuid.uuid4())},
+    }
+    for _ in range(2):
+        try:
+            await db.wishlists.update_one(
+                {"user_id": user_id, "product_ids": {"$ne": product_id},
+                 f"product_ids.{MAX_ITEMS - 1}": {"$exists": False}},
+                update,
+                upsert=True
+            )
+            break
+        except DuplicateKeyError:
+            # The wishlist exists but did not match: the product is already
+            # in it, it is full, or a concurrent first add just created it
+            wishlist = await db.wishlists.find_one({"user_id": user_id}, {"_id": 0, "product_ids": 1})
+            if product_id in wishlist.get('product_ids', []):
+                return False
+            if len(wishlist.get('product_ids', [])) >= MAX_ITEMS:
+                raise WishlistFull()
+    else:
+        return False
+
+    if not await _count(db, product_id, 1):
+        await db.wishlists.update_one({"user_id": user_id}, {"$pull": {"product_ids": product_id}})
+        raise UnknownProduct()
+    return True
+
+
+async def remove_product(db, user_id: str, product_id: str) -> bool:
+    """Pull a product from the wishlist. False if it was not in it."""
+    result = await db.wishlists.update_one(
+        {"user_id": user_id, "product_ids": product_id},
+        {"$pull": {"product_ids": product_id},
+         "$set": {"updated_at": datetime.now(timezone.utc)}}
+    )
+    if not result.modified_count:
+        return False
+    await _count(db, product_id, -1)
+    return True
@@ -23,6 +23,49 @@ export const api = axios.create({
   baseURL: API,
 });
 
+// Stored image URLs are relative to the backend (/api/images/<hash>)
+export const assetUrl = (url) => (url && url.startsWith('/') ? `${BACKEND_URL}${url}` : url);
+
+// Server-Sent Events from `path`, authenticated with a short-lived stream token
+// so the access token never goes into a URL. Once the token has expired the
+// browser's own reconnects are refused, so a new one is fetched and the stream
+// resumes after the last event received. Returns a function that closes it.
+export const openEventStream = (path, since, onMessage) => {
+  let source = null;
+  let retry = null;
+  let closed = false;
+  let cursor = since;
+
+  const connect = async () => {
+    let token;
+    try {
+      ({ data: { token } } = await api.post('/chat/stream-token'));
+    } catch (error) {
+      if (!closed) retry = setTimeout(connect, 3000);
+      return;
+    }
+    if (closed) return;
+    const params = new URLSearchParams({ token });
+    if (cursor) params.set('since', cursor);
+    source = new EventSource(`${API}${path}?${params}`);
+    source.addEventListener('message', (e) => {
+      if (e.lastEventId) cursor = e.lastEventId;
+      onMessage(JSON.parse(e.data));
+    });
+    source.addEventListener('error', () => {
+      if (source.readyState !== EventSource.CLOSED || closed) return;
+      retry = setTimeout(connect, 3000);
+    });
+  };
+
+  connect();
+  return () => {
+    closed = true;
+    clearTimeout(retry);
+    if (source) source.close();
+  };
+};
+
 // Add auth token to requests
 api.interceptors.request.use((config) => {
   const token = localStorage.getItem('token');
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -49,7 +49,7 @@ const AdminDashboard = ({ user, logout }) => {
         api.get('/stores'),
         api.get('/orders'),
         api.get('/categories'),
-        api.get('/products'),
+        api.get('/products', { params: { fields: 'full', limit: 1000 } }),
         api.get('/complaints').catch(() => ({ data: [] }))
       ]);
       setStores(storesRes.data);
@@ -307,7 +307,7 @@ const AdminDashboard = ({ user, logout }) => {
                         <tr key={product.id} className="hover:bg-gray-50">
                           <td className="px-4 py-3">
                             <div className="flex items-center gap-3">
-                              <img src={product.images?.[0] || 'https://via.placeholder.com/50'} alt={product.name} className="w-12 h-12 object-cover rounded-lg" />
+                              <img src={assetUrl(product.images?.[0]) || 'https://via.placeholder.com/50'} alt={product.name} className="w-12 h-12 object-cover rounded-lg" />
                               <p className="font-medium text-gray-900 line-clamp-1">{product.name}</p>
                             </div>
                           </td>
@@ -397,7 +397,7 @@ const AdminDashboard = ({ user, logout }) => {
                       {complaint.images?.length > 0 && (
                         <div className="flex gap-2 mt-2">
                           {complaint.images.map((img, idx) => (
-                            <img key={idx} src={img} alt="" className="w-16 h-16 object-cover rounded-lg border" />
+                            <img key={idx} src={assetUrl(img)} alt="" className="w-16 h-16 object-cover rounded-lg border" />
                           ))}
                         </div>
                       )}
@@ -659,7 +659,7 @@ const AdminDashboard = ({ user, logout }) => {
                     <p className="text-sm font-medium mb-2">الصور المرفقة:</p>
                     <div className="flex gap-2 flex-wrap">
                       {selectedComplaint.images.map((img, idx) => (
-                        <img key={idx} src={img} alt="" className="w-32 h-32 object-cover rounded-lg border cursor-pointer" onClick={() => window.open(img, '_blank')} />
+                        <img key={idx} src={assetUrl(img)} alt="" className="w-32 h-32 object-cover rounded-lg border cursor-pointer" onClick={() => window.open(assetUrl(img), '_blank')} />
                       ))}
                     </div>
                   </div>
@@ -56,9 +56,9 @@ const AuthPage = ({ setUser }) => {
       // Call backend API to send reset code
       const response = await api.post('/auth/forgot-password', { email: forgotEmail });
       
-      // Check if email was sent or code is provided (dev mode)
-      if (response.data.email_sent) {
-        toast.success('✅ تم إرسال رمز التحقق إلى بريدك الإلكتروني');
+      // Check if email was queued or code is provided (dev mode)
+      if (response.data.email_queued) {
+        toast.success('✅ سيتم إرسال رمز التحقق إلى بريدك الإلكتروني');
       } else if (response.data.code) {
         // Development mode - show code directly
         toast.success(`🔑 رمز التحقق: ${response.data.code}`, { duration: 10000 });
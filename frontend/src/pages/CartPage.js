@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Trash2, ArrowRight, ShoppingBag, Plus, Minus } from 'lucide-react';
 import { toast } from 'sonner';
@@ -37,10 +37,7 @@ const CartPage = ({ user, logout }) => {
 
   const updateQuantity = async (productId, newQuantity) => {
     try {
-      await api.delete(`/cart/${productId}`);
-      if (newQuantity > 0) {
-        await api.post('/cart/add', { product_id: productId, quantity: newQuantity });
-      }
+      await api.put(`/cart/${productId}`, { quantity: newQuantity });
       fetchCart();
     } catch (error) {
       toast.error('حدث خطأ في التحديث');
@@ -106,7 +103,7 @@ const CartPage = ({ user, logout }) => {
                 >
                   <Link to={`/product/${item.product.id}`}>
                     <img
-                      src={item.product.images[0] || 'https://via.placeholder.com/150'}
+                      src={assetUrl(item.product.images[0]) || 'https://via.placeholder.com/150'}
                       alt={item.product.name}
                       className="w-24 h-24 object-cover rounded-lg"
                     />
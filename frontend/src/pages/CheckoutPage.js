@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -134,7 +134,7 @@ const CheckoutPage = ({ user, logout }) => {
                 <div key={item.product.id} className="flex justify-between items-center">
                   <div className="flex items-center gap-3">
                     <img
-                      src={item.product.images[0] || 'https://via.placeholder.com/50'}
+                      src={assetUrl(item.product.images[0]) || 'https://via.placeholder.com/50'}
                       alt={item.product.name}
                       className="w-12 h-12 object-cover rounded"
                     />
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -285,7 +285,7 @@ const ComplaintsPage = ({ user }) => {
                     {complaint.images?.length > 0 && (
                       <div className="flex gap-2 mt-3">
                         {complaint.images.slice(0, 3).map((img, idx) => (
-                          <img key={idx} src={img} alt="" className="w-16 h-16 object-cover rounded-lg" />
+                          <img key={idx} src={assetUrl(img)} alt="" className="w-16 h-16 object-cover rounded-lg" />
                         ))}
                         {complaint.images.length > 3 && (
                           <div className="w-16 h-16 bg-gray-100 rounded-lg flex items-center justify-center text-gray-500 text-sm">
@@ -310,10 +310,10 @@ const ComplaintsPage = ({ user }) => {
                               {complaint.images.map((img, idx) => (
                                 <img
                                   key={idx}
-                                  src={img}
+                                  src={assetUrl(img)}
                                   alt=""
                                   className="w-32 h-32 object-cover rounded-lg border cursor-pointer hover:opacity-80"
-                                  onClick={(e) => { e.stopPropagation(); window.open(img, '_blank'); }}
+                                  onClick={(e) => { e.stopPropagation(); window.open(assetUrl(img), '_blank'); }}
                                 />
                               ))}
                             </div>
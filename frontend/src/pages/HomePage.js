@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { Link, useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { ShoppingCart, User, Store, Search, Heart, LogOut, Menu, X, ChevronRight, Mail, Instagram, Package, AlertTriangle } from 'lucide-react';
@@ -8,6 +8,7 @@ import { toast } from 'sonner';
 
 const HomePage = ({ user, logout }) => {
   const [products, setProducts] = useState([]);
+  const [productsCursor, setProductsCursor] = useState(null);
   const [categories, setCategories] = useState([]);
   const [selectedCategory, setSelectedCategory] = useState(null);
   const [searchQuery, setSearchQuery] = useState('');
@@ -147,12 +148,26 @@ const HomePage = ({ user, logout }) => {
           }
           
           setProducts(allProducts);
+          setProductsCursor(null);
           return;
         }
       }
       
       const res = await api.get('/products', { params });
       setProducts(res.data);
+      setProductsCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      console.error('Error fetching products:', error);
+    }
+  };
+
+  const fetchMoreProducts = async () => {
+    try {
+      const params = { cursor: productsCursor };
+      if (selectedCategory) params.category_id = selectedCategory;
+      const res = await api.get('/products', { params });
+      setProducts((prev) => [...prev, ...res.data]);
+      setProductsCursor(res.headers['x-next-cursor'] || null);
     } catch (error) {
       console.error('Error fetching products:', error);
     }
@@ -594,7 +609,7 @@ const HomePage = ({ user, logout }) => {
               {/* Product Image with Gradient Overlay */}
               <div className="aspect-square bg-gradient-to-br from-gray-50 to-gray-100 overflow-hidden relative">
                 <img
-                  src={product.images[0] || 'https://via.placeholder.com/300'}
+                  src={assetUrl(product.images[0]) || 'https://via.placeholder.com/300'}
                   alt={product.name}
                   className="w-full h-full object-cover group-hover:scale-110 transition-transform duration-700"
                 />
@@ -650,6 +665,12 @@ const HomePage = ({ user, logout }) => {
           ))}
         </div>
 
+        {productsCursor && (
+          <div className="text-center mt-8">
+            <Button variant="outline" onClick={fetchMoreProducts}>عرض المزيد من المنتجات</Button>
+          </div>
+        )}
+
         {filteredProducts.length === 0 && (
           <div className="text-center py-20">
             <div className="text-gray-400 mb-4">
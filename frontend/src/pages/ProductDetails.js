@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate, Link } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl, openEventStream } from '../App';
 import { Button } from '../components/ui/button';
 import { Textarea } from '../components/ui/textarea';
 import { Input } from '../components/ui/input';
@@ -18,6 +18,7 @@ const ProductDetails = ({ user, logout }) => {
   const [reviews, setReviews] = useState([]);
   const [averageRating, setAverageRating] = useState(0);
   const [totalReviews, setTotalReviews] = useState(0);
+  const [reviewsCursor, setReviewsCursor] = useState(null);
   const [newReview, setNewReview] = useState({ rating: 5, comment: '' });
   const [showReviewForm, setShowReviewForm] = useState(false);
   const [selectedSize, setSelectedSize] = useState('');
@@ -31,6 +32,8 @@ const ProductDetails = ({ user, logout }) => {
   const [messages, setMessages] = useState([]);
   const [newMessage, setNewMessage] = useState('');
   const [chatLoading, setChatLoading] = useState(false);
+  const [chatCursor, setChatCursor] = useState(undefined);
+  const [olderChatCursor, setOlderChatCursor] = useState(null);
 
   const fetchProduct = async () => {
     try {
@@ -49,10 +52,12 @@ const ProductDetails = ({ user, logout }) => {
     }
   };
 
-  const fetchReviews = async () => {
+  const fetchReviews = async (cursor = null) => {
     try {
-      const res = await api.get(`/products/${id}/reviews`);
-      setReviews(res.data.reviews || []);
+      const res = await api.get(`/products/${id}/reviews`, { params: cursor ? { cursor } : {} });
+      const page = res.data.reviews || [];
+      setReviews(cursor ? (prev) => [...prev, ...page] : page);
+      setReviewsCursor(res.headers['x-next-cursor'] || null);
       setAverageRating(res.data.average_rating || 0);
       setTotalReviews(res.data.total_reviews || 0);
     } catch (error) {
@@ -74,9 +79,24 @@ const ProductDetails = ({ user, logout }) => {
     try {
       const res = await api.get(`/chat/${storeInfo.id}`);
       setMessages(res.data || []);
+      setChatCursor(res.headers['x-next-cursor'] || null);
+      setOlderChatCursor(res.headers['x-prev-cursor'] || null);
+      api.post(`/chat/${storeInfo.id}/read`).catch(() => {});
     } catch (error) {
       // Chat might not exist yet
       setMessages([]);
+      setChatCursor(null);
+      setOlderChatCursor(null);
+    }
+  };
+
+  const fetchOlderChatMessages = async () => {
+    try {
+      const res = await api.get(`/chat/${storeInfo.id}`, { params: { before: olderChatCursor } });
+      setMessages((prev) => [...(res.data || []), ...prev]);
+      setOlderChatCursor(res.headers['x-prev-cursor'] || null);
+    } catch (error) {
+      toast.error('حدث خطأ في تحميل الرسائل');
     }
   };
 
@@ -101,9 +121,20 @@ const ProductDetails = ({ user, logout }) => {
   useEffect(() => {
     if (showChat && user && storeInfo) {
       fetchChatMessages();
+    } else {
+      setChatCursor(undefined);
     }
   }, [showChat, user, storeInfo]);
 
+  // Push new messages while the chat is open, starting after the loaded ones
+  const chatLoaded = chatCursor !== undefined;
+  useEffect(() => {
+    if (!showChat || !storeInfo || !chatLoaded) return;
+    return openEventStream(`/chat/${storeInfo.id}/stream`, chatCursor, (message) => {
+      setMessages((prev) => (prev.some((m) => m.id === message.id) ? prev : [...prev, message]));
+    });
+  }, [showChat, storeInfo, chatLoaded]);
+
   const submitReview = async (e) => {
     e.preventDefault();
     if (!user) {
@@ -192,7 +223,6 @@ const ProductDetails = ({ user, logout }) => {
         product_id: id
       });
       setNewMessage('');
-      fetchChatMessages();
       toast.success('تم إرسال الرسالة');
     } catch (error) {
       toast.error('حدث خطأ في إرسال الرسالة');
@@ -253,7 +283,7 @@ const ProductDetails = ({ user, logout }) => {
         <div className="max-w-4xl mx-auto">
           <div className="aspect-square sm:aspect-[4/3] lg:aspect-[16/9] relative overflow-hidden">
             <img
-              src={mainImage || product.images?.[0] || 'https://via.placeholder.com/800'}
+              src={assetUrl(mainImage || product.images?.[0]) || 'https://via.placeholder.com/800'}
               alt={product.name}
               className="w-full h-full object-contain bg-gray-50"
               data-testid="product-image"
@@ -271,7 +301,7 @@ const ProductDetails = ({ user, logout }) => {
                     mainImage === img ? 'border-emerald-600 ring-2 ring-emerald-200' : 'border-gray-200 hover:border-emerald-400'
                   }`}
                 >
-                  <img src={img} alt={`${product.name} ${index + 1}`} className="w-full h-full object-cover" />
+                  <img src={assetUrl(img)} alt={`${product.name} ${index + 1}`} className="w-full h-full object-cover" />
                 </button>
               ))}
             </div>
@@ -342,7 +372,7 @@ const ProductDetails = ({ user, logout }) => {
                         title={color.name}
                       >
                         {color.image ? (
-                          <img src={color.image} alt={color.name} className="w-full h-full object-cover rounded-lg" />
+                          <img src={assetUrl(color.image)} alt={color.name} className="w-full h-full object-cover rounded-lg" />
                         ) : (
                           <div className="w-full h-full rounded-lg" style={{ backgroundColor: color.hex || '#ccc' }} />
                         )}
@@ -548,6 +578,11 @@ const ProductDetails = ({ user, logout }) => {
                   </div>
                 </div>
               ))}
+              {reviewsCursor && (
+                <Button variant="outline" className="w-full" onClick={() => fetchReviews(reviewsCursor)}>
+                  عرض المزيد من التقييمات
+                </Button>
+              )}
             </div>
           )}
         </div>
@@ -565,7 +600,7 @@ const ProductDetails = ({ user, logout }) => {
                 >
                   <div className="aspect-square overflow-hidden">
                     <img
-                      src={sp.images?.[0] || 'https://via.placeholder.com/200'}
+                      src={assetUrl(sp.images?.[0]) || 'https://via.placeholder.com/200'}
                       alt={sp.name}
                       className="w-full h-full object-cover hover:scale-105 transition"
                     />
@@ -600,9 +635,15 @@ const ProductDetails = ({ user, logout }) => {
                 <p className="text-sm mt-1">اسأل عن المنتج: {product?.name}</p>
               </div>
             ) : (
-              messages.map((msg, idx) => (
+              <>
+              {olderChatCursor && (
+                <Button variant="outline" size="sm" className="w-full" onClick={fetchOlderChatMessages}>
+                  عرض الرسائل الأقدم
+                </Button>
+              )}
+              {messages.map((msg) => (
                 <div
-                  key={idx}
+                  key={msg.id}
                   className={`flex ${msg.sender_id === user?.id ? 'justify-start' : 'justify-end'}`}
                 >
                   <div
@@ -618,7 +659,8 @@ const ProductDetails = ({ user, logout }) => {
                     </p>
                   </div>
                 </div>
-              ))
+              ))}
+              </>
             )}
           </div>
 
@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl, openEventStream } from '../App';
 import { Button } from '../components/ui/button';
 import { Input } from '../components/ui/input';
 import { Label } from '../components/ui/label';
@@ -18,6 +18,7 @@ const StoreDashboard = ({ user, logout }) => {
   const [orders, setOrders] = useState([]);
   const [categories, setCategories] = useState([]);
   const [conversations, setConversations] = useState([]);
+  const [conversationsCursor, setConversationsCursor] = useState(null);
   const [loading, setLoading] = useState(true);
   const [showStoreDialog, setShowStoreDialog] = useState(false);
   const [showProductDialog, setShowProductDialog] = useState(false);
@@ -25,7 +26,10 @@ const StoreDashboard = ({ user, logout }) => {
   const [showPromoteDialog, setShowPromoteDialog] = useState(false);
   const [editingProduct, setEditingProduct] = useState(null);
   const [selectedConversation, setSelectedConversation] = useState(null);
+  const [conversationMessages, setConversationMessages] = useState([]);
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState(null);
   const [replyMessage, setReplyMessage] = useState('');
+  const [chatLoaded, setChatLoaded] = useState(false);
   const [storeData, setStoreData] = useState({ store_name: '', description: '', phone: '' });
   const [productData, setProductData] = useState({
     name: '', description: '', price: '', stock: '', category_id: '',
@@ -57,13 +61,15 @@ const StoreDashboard = ({ user, logout }) => {
         
         if (store.status === 'approved') {
           const [productsRes, ordersRes, chatsRes] = await Promise.all([
-            api.get('/products', { params: { store_id: store.id } }),
+            api.get('/products', { params: { store_id: store.id, fields: 'full', limit: 1000 } }),
             api.get('/orders/store'),
             api.get('/chat/store/messages').catch(() => ({ data: [] }))
           ]);
           setProducts(productsRes.data);
           setOrders(ordersRes.data || []);
           setConversations(chatsRes.data || []);
+          setConversationsCursor(chatsRes.headers?.['x-next-cursor'] || null);
+          setChatLoaded(true);
           
           // Calculate stats
           const completedOrders = ordersRes.data.filter(o => o.status === 'delivered');
@@ -205,6 +211,85 @@ const StoreDashboard = ({ user, logout }) => {
     }
   };
 
+  const fetchMoreConversations = async () => {
+    try {
+      const res = await api.get('/chat/store/messages', { params: { cursor: conversationsCursor } });
+      // Conversations that moved to the top since the first page are already listed
+      setConversations((prev) => [
+        ...prev,
+        ...(res.data || []).filter((conv) => !prev.some((c) => c.customer_id === conv.customer_id))
+      ]);
+      setConversationsCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('حدث خطأ في تحميل المحادثات');
+    }
+  };
+
+  const selectedCustomer = useRef(null);
+
+  const openConversation = async (conv) => {
+    selectedCustomer.current = conv.customer_id;
+    setSelectedConversation(conv);
+    setConversationMessages([]);
+    setOlderMessagesCursor(null);
+    try {
+      const res = await api.get(`/chat/store/conversations/${conv.customer_id}`);
+      if (selectedCustomer.current === conv.customer_id) {
+        setConversationMessages(res.data || []);
+        setOlderMessagesCursor(res.headers['x-prev-cursor'] || null);
+      }
+      if (conv.unread_store) {
+        await api.post(`/chat/store/conversations/${conv.customer_id}/read`);
+        setConversations((prev) => prev.map((c) => (c.customer_id === conv.customer_id ? { ...c, unread_store: 0 } : c)));
+      }
+    } catch (error) {
+      toast.error('حدث خطأ في تحميل المحادثة');
+    }
+  };
+
+  const loadOlderMessages = async () => {
+    const customerId = selectedCustomer.current;
+    try {
+      const res = await api.get(`/chat/store/conversations/${customerId}`, { params: { before: olderMessagesCursor } });
+      if (selectedCustomer.current !== customerId) return;
+      setConversationMessages((prev) => [...(res.data || []), ...prev]);
+      setOlderMessagesCursor(res.headers['x-prev-cursor'] || null);
+    } catch (error) {
+      toast.error('حدث خطأ في تحميل المحادثة');
+    }
+  };
+
+  // Push new customer messages and replies into the inbox and the open conversation
+  const addChatMessage = (msg) => {
+    const customerId = msg.sender_type === 'customer' ? msg.sender_id : msg.receiver_id;
+    const isOpen = selectedCustomer.current === customerId;
+    const unread = msg.sender_type === 'customer' && !isOpen ? 1 : 0;
+    setConversations((prev) => {
+      const existing = prev.find((c) => c.customer_id === customerId);
+      if (existing?.last_message?.id === msg.id) return prev;
+      const updated = {
+        ...(existing || {
+          customer_id: customerId,
+          customer_name: msg.sender_type === 'customer' ? msg.sender_name : 'Unknown',
+          unread_store: 0
+        }),
+        last_message: msg,
+        last_message_at: msg.created_at,
+        unread_store: (existing?.unread_store || 0) + unread
+      };
+      return [updated, ...prev.filter((c) => c.customer_id !== customerId)];
+    });
+    if (isOpen) {
+      setConversationMessages((prev) => (prev.some((m) => m.id === msg.id) ? prev : [...prev, msg]));
+      if (msg.sender_type === 'customer') api.post(`/chat/store/conversations/${customerId}/read`).catch(() => {});
+    }
+  };
+
+  useEffect(() => {
+    if (!chatLoaded) return;
+    return openEventStream('/chat/store/stream', null, addChatMessage);
+  }, [chatLoaded]);
+
   const sendReply = async () => {
     if (!replyMessage.trim() || !selectedConversation) return;
     try {
@@ -214,7 +299,6 @@ const StoreDashboard = ({ user, logout }) => {
       });
       toast.success('تم إرسال الرد');
       setReplyMessage('');
-      fetchData();
     } catch (error) {
       toast.error('حدث خطأ في إرسال الرد');
     }
@@ -379,7 +463,7 @@ const StoreDashboard = ({ user, logout }) => {
                       {products.map((product) => (
                         <div key={product.id} className="border border-gray-200 rounded-xl overflow-hidden hover:shadow-lg transition">
                           <div className="relative h-48">
-                            <img src={product.images?.[0] || 'https://via.placeholder.com/300'} alt={product.name} className="w-full h-full object-cover" />
+                            <img src={assetUrl(product.images?.[0]) || 'https://via.placeholder.com/300'} alt={product.name} className="w-full h-full object-cover" />
                             {product.images?.length > 1 && <span className="absolute bottom-2 right-2 bg-black/60 text-white text-xs px-2 py-1 rounded">+{product.images.length - 1} صور</span>}
                             {product.promoted && <span className="absolute top-2 left-2 bg-amber-500 text-white text-xs px-2 py-1 rounded flex items-center gap-1"><Star className="w-3 h-3" />مميز</span>}
                           </div>
@@ -451,20 +535,33 @@ const StoreDashboard = ({ user, logout }) => {
                     <div className="grid grid-cols-1 lg:grid-cols-2 gap-6">
                       <div className="space-y-3">
                         {conversations.map((conv) => (
-                          <div key={conv.customer_id} onClick={() => setSelectedConversation(conv)}
+                          <div key={conv.customer_id} onClick={() => openConversation(conv)}
                             className={`p-4 rounded-lg cursor-pointer transition ${selectedConversation?.customer_id === conv.customer_id ? 'bg-emerald-100 border-2 border-emerald-500' : 'bg-gray-50 hover:bg-gray-100'}`}>
-                            <p className="font-semibold">{conv.customer_name}</p>
+                            <div className="flex items-center justify-between">
+                              <p className="font-semibold">{conv.customer_name}</p>
+                              {conv.unread_store > 0 && <Badge className="bg-emerald-600">{conv.unread_store}</Badge>}
+                            </div>
                             <p className="text-sm text-gray-600 line-clamp-1">{conv.last_message?.message}</p>
                             <p className="text-xs text-gray-400">{new Date(conv.last_message?.created_at).toLocaleDateString('ar')}</p>
                           </div>
                         ))}
+                        {conversationsCursor && (
+                          <Button variant="outline" className="w-full" onClick={fetchMoreConversations}>
+                            عرض المزيد من المحادثات
+                          </Button>
+                        )}
                       </div>
                       {selectedConversation && (
                         <div className="bg-gray-50 rounded-lg p-4">
                           <h4 className="font-semibold mb-4">محادثة مع {selectedConversation.customer_name}</h4>
                           <div className="h-64 overflow-y-auto space-y-2 mb-4">
-                            {selectedConversation.messages?.map((msg, idx) => (
-                              <div key={idx} className={`flex ${msg.sender_type === 'store_owner' ? 'justify-end' : 'justify-start'}`}>
+                            {olderMessagesCursor && (
+                              <Button variant="outline" size="sm" className="w-full" onClick={loadOlderMessages}>
+                                عرض الرسائل الأقدم
+                              </Button>
+                            )}
+                            {conversationMessages.map((msg) => (
+                              <div key={msg.id} className={`flex ${msg.sender_type === 'store_owner' ? 'justify-end' : 'justify-start'}`}>
                                 <div className={`max-w-[80%] px-4 py-2 rounded-xl ${msg.sender_type === 'store_owner' ? 'bg-emerald-600 text-white' : 'bg-white shadow'}`}>
                                   <p className="text-sm">{msg.message}</p>
                                 </div>
@@ -530,7 +627,7 @@ const StoreDashboard = ({ user, logout }) => {
                         <div className="flex flex-wrap gap-2 mt-2">
                           {editingProduct.images.map((img, index) => (
                             <div key={index} className="relative w-20 h-20">
-                              <img src={img} alt="" className="w-full h-full object-cover rounded-lg" />
+                              <img src={assetUrl(img)} alt="" className="w-full h-full object-cover rounded-lg" />
                               <button type="button" onClick={() => handleDeleteImage(index)} className="absolute -top-2 -right-2 bg-red-500 text-white rounded-full p-1 hover:bg-red-600"><X className="w-3 h-3" /></button>
                             </div>
                           ))}
@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { ArrowRight, Store as StoreIcon } from 'lucide-react';
 import { toast } from 'sonner';
@@ -10,22 +10,34 @@ const StoreView = ({ user, logout }) => {
   const navigate = useNavigate();
   const [store, setStore] = useState(null);
   const [products, setProducts] = useState([]);
+  const [productsCursor, setProductsCursor] = useState(null);
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
     fetchStoreData();
   }, [id]);
 
+  const fetchMoreProducts = async () => {
+    try {
+      const res = await api.get('/products', { params: { store_id: id, fields: 'card,description', cursor: productsCursor } });
+      setProducts((prev) => [...prev, ...res.data]);
+      setProductsCursor(res.headers['x-next-cursor'] || null);
+    } catch (error) {
+      toast.error('حدث خطأ في تحميل البيانات');
+    }
+  };
+
   const fetchStoreData = async () => {
     try {
       const [storesRes, productsRes] = await Promise.all([
         api.get('/stores'),
-        api.get('/products', { params: { store_id: id } })
+        api.get('/products', { params: { store_id: id, fields: 'card,description' } })
       ]);
       
       const storeData = storesRes.data.find(s => s.id === id);
       setStore(storeData);
       setProducts(productsRes.data);
+      setProductsCursor(productsRes.headers['x-next-cursor'] || null);
       setLoading(false);
     } catch (error) {
       toast.error('حدث خطأ في تحميل البيانات');
@@ -118,7 +130,7 @@ const StoreView = ({ user, logout }) => {
                   onClick={() => navigate(`/product/${product.id}`)}
                 >
                   <img
-                    src={product.images[0] || 'https://via.placeholder.com/300'}
+                    src={assetUrl(product.images[0]) || 'https://via.placeholder.com/300'}
                     alt={product.name}
                     className="w-full h-full object-cover transition-transform duration-300 hover:scale-110"
                   />
@@ -152,6 +164,11 @@ const StoreView = ({ user, logout }) => {
             ))}
           </div>
         )}
+        {productsCursor && (
+          <div className="text-center mt-8">
+            <Button variant="outline" onClick={fetchMoreProducts}>عرض المزيد من المنتجات</Button>
+          </div>
+        )}
       </div>
     </div>
   );
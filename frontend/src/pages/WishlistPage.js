@@ -1,6 +1,6 @@
 import { useState, useEffect } from 'react';
 import { useNavigate, Link } from 'react-router-dom';
-import { api } from '../App';
+import { api, assetUrl } from '../App';
 import { Button } from '../components/ui/button';
 import { Heart, ArrowRight, Trash2, ShoppingCart } from 'lucide-react';
 import { toast } from 'sonner';
@@ -101,7 +101,7 @@ const WishlistPage = ({ user, logout }) => {
                 <div className="relative">
                   <Link to={`/product/${product.id}`}>
                     <img
-                      src={product.images[0] || 'https://via.placeholder.com/300'}
+                      src={assetUrl(product.images[0]) || 'https://via.placeholder.com/300'}
                       alt={product.name}
                       className="w-full h-64 object-cover"
                     />
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+from fastapi.security import HTTPAuthorizationCredentials
+
+import server
+
+
+def credentials(role: str) -> HTTPAuthorizationCredentials:
+    token = server.create_access_token({"id": f"{role}-1", "role": role, "name": "N", "email": f"{role}@example.com"})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+@pytest.fixture
+def trusted(monkeypatch):
+    looked_up = []
+
+    async def get_current_user(creds):
+        payload = server.decode_token(creds)
+        looked_up.append(payload["user_id"])
+        return {"id": payload["user_id"], "role": "customer", "source": "db"}
+
+    monkeypatch.setattr(server, "TRUST_TOKEN_CLAIMS", True)
+    monkeypatch.setattr(server, "get_current_user", get_current_user)
+    return looked_up
+
+
+def test_claims_trusted_for_customers(trusted):
+    principal = asyncio.run(server.get_token_principal(credentials("customer")))
+    assert principal["role"] == "customer" and "source" not in principal
+    assert trusted == []
+
+
+@pytest.mark.parametrize("role", server.PRIVILEGED_ROLES)
+def test_privileged_roles_always_looked_up(trusted, role):
+    # A demoted admin's old token must not keep its role claim
+    principal = asyncio.run(server.get_token_principal(credentials(role)))
+    assert principal == {"id": f"{role}-1", "role": "customer", "source": "db"}
+    assert trusted == [f"{role}-1"]
+
+
+@pytest.fixture
+def principals(monkeypatch):
+    async def load_principal(user_id):
+        return {"id": user_id, "role": "customer"}
+
+    monkeypatch.setattr(server, "load_principal", load_principal)
+
+
+def test_stream_routes_take_stream_tokens_only(principals):
+    stream_token = server.create_stream_token({"id": "customer-1"})
+    assert asyncio.run(server.get_stream_principal(stream_token))["id"] == "customer-1"
+
+    access_token = credentials("customer").credentials
+    with pytest.raises(server.HTTPException) as error:
+        asyncio.run(server.get_stream_principal(access_token))
+    assert error.value.status_code == 401
+
+
+def test_stream_tokens_are_not_access_tokens():
+    creds = HTTPAuthorizationCredentials(scheme="Bearer", credentials=server.create_stream_token({"id": "customer-1"}))
+    with pytest.raises(server.HTTPException) as error:
+        server.decode_token(creds)
+    assert error.value.status_code == 401
@@ -0,0 +1,41 @@
+from cache import ResponseCache
+
+
+def cached(cache, key, tags):
+    cache.set(key, key, tags, cache.generation(tags))
+
+
+def test_invalidate_misses_dependent_entries_only():
+    cache = ResponseCache()
+    cached(cache, "a", ("products", "product:a"))
+    cached(cache, "b", ("products", "product:b"))
+    cached(cache, "stores", ("stores",))
+    cache.invalidate("product:a")
+    assert cache.get("a") is None
+    assert cache.get("b") == "b"
+    cache.invalidate("products")
+    assert cache.get("b") is None
+    assert cache.get("stores") == "stores"
+
+
+def test_generations_are_bounded_without_reviving_stale_entries():
+    cache = ResponseCache(max_tags=2)
+    cached(cache, "a", ("product:a",))
+    cache.invalidate("product:a")
+    cached(cache, "a", ("product:a",))
+    cache.invalidate("product:a")
+    for i in range(10):
+        cache.invalidate(f"product:{i}")
+    assert len(cache._generations) == 2
+    # product:a was dropped; the entry built before its last invalidation stays stale
+    assert cache.get("a") is None
+    cached(cache, "a", ("product:a",))
+    assert cache.get("a") == "a"
+
+
+def test_set_skips_loads_that_raced_an_invalidation():
+    cache = ResponseCache()
+    generation = cache.generation(("products",))
+    cache.invalidate("products")
+    cache.set("list", "old", ("products",), generation)
+    assert cache.get("list") is None
@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta, timezone
+
+import coupons
+
+
+def coupon(**fields):
+    return {"code": "SAVE10", "discount_type": "percentage", "discount_value": 10, "min_purchase": 0, **fields}
+
+
+def test_applies_without_expiry():
+    assert coupons.applies(coupon(expires_at=None), 50)
+
+
+def test_applies_with_datetime_expiry():
+    now = datetime.now(timezone.utc)
+    assert coupons.applies(coupon(expires_at=now + timedelta(days=1)), 50)
+    assert not coupons.applies(coupon(expires_at=now - timedelta(days=1)), 50)
+
+
+def test_applies_with_unmigrated_string_expiry():
+    now = datetime.now(timezone.utc)
+    assert coupons.applies(coupon(expires_at=(now + timedelta(days=1)).isoformat()), 50)
+    assert not coupons.applies(coupon(expires_at=(now - timedelta(days=1)).isoformat()), 50)
+    # Naive ISO strings are UTC
+    assert not coupons.applies(coupon(expires_at="2000-01-01T00:00:00"), 50)
+
+
+def test_applies_checks_minimum_and_active():
+    assert not coupons.applies(coupon(min_purchase=100), 50)
+    assert not coupons.applies(coupon(active=False), 50)
@@ -0,0 +1,136 @@
+import asyncio
+import socket
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import pytest
+from aiosmtpd.controller import Controller
+from mongomock_motor import AsyncMongoMockClient
+
+import email_outbox
+from email_outbox import OutboxSender, enqueue
+
+
+class Sink:
+    """aiosmtpd handler that keeps delivered messages, or refuses them with `reply`"""
+
+    def __init__(self, reply=None):
+        self.reply = reply
+        self.messages = []
+
+    async def handle_DATA(self, server, session, envelope):
+        if self.reply:
+            return self.reply
+        self.messages.append(envelope)
+        return "250 OK"
+
+
+@pytest.fixture(autouse=True)
+def after_update_without_id(monkeypatch):
+    """mongomock returns None from find_one_and_update(return_document=AFTER)
+    when the projection drops _id; MongoDB does not"""
+    original = mongomock.collection.Collection.find_one_and_update
+
+    def find_one_and_update(self, filter, update, projection=None, **kwargs):
+        if projection == {"_id": 0}:
+            document = original(self, filter, update, **kwargs)
+            return document and {k: v for k, v in document.items() if k != "_id"}
+        return original(self, filter, update, projection, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.Collection, "find_one_and_update", find_one_and_update)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture
+def smtp(monkeypatch):
+    monkeypatch.setenv("SMTP_STARTTLS", "false")
+    monkeypatch.delenv("SMTP_USER", raising=False)
+    sink = Sink()
+    controller = Controller(sink, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield sink, controller
+    controller.stop()
+
+
+def new_db():
+    return AsyncMongoMockClient(tz_aware=True)["test"]
+
+
+def test_send_batch_delivers_and_marks_sent(smtp):
+    sink, controller = smtp
+
+    async def run():
+        db = new_db()
+        sender = OutboxSender(db, host=controller.hostname, port=controller.port)
+        message_id = await enqueue(db, "a@example.com", "Hello", "<p>hi</p>")
+        assert await sender.send_batch() == 1
+        await sender.stop()
+        return await db.email_outbox.find_one({"id": message_id}), sender
+
+    message, sender = asyncio.run(run())
+    assert message["status"] == "sent"
+    assert message["attempts"] == 1
+    assert message["sent_at"] is not None
+    assert sender.sent == 1
+    assert [e.rcpt_tos for e in sink.messages] == [["a@example.com"]]
+
+
+def test_send_batch_retries_transient_and_fails_permanent(smtp):
+    sink, controller = smtp
+
+    async def run(reply):
+        sink.reply = reply
+        db = new_db()
+        sender = OutboxSender(db, host=controller.hostname, port=controller.port)
+        message_id = await enqueue(db, "a@example.com", "Hello", "<p>hi</p>")
+        await sender.send_batch()
+        # Not due again until the backoff runs out
+        assert await sender.send_batch() == 0
+        await sender.stop()
+        return await db.email_outbox.find_one({"id": message_id})
+
+    retried = asyncio.run(run("451 Try again later"))
+    assert retried["status"] == "pending"
+    assert retried["attempts"] == 1
+    assert retried["next_attempt_at"] > datetime.now(timezone.utc)
+    assert "451" in retried["last_error"]
+
+    failed = asyncio.run(run("554 Rejected"))
+    assert failed["status"] == "failed"
+    assert failed["attempts"] == 1
+    assert sink.messages == []
+
+
+def test_claim_takes_due_and_expired_leases_only():
+    async def run():
+        db = new_db()
+        # BSON datetimes only keep milliseconds
+        now = datetime.now(timezone.utc)
+        now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+        base = {"to": "a@example.com", "subject": "s", "html": "h", "attempts": 0}
+        await db.email_outbox.insert_many([
+            {**base, "id": "due", "status": "pending", "next_attempt_at": now - timedelta(seconds=1)},
+            {**base, "id": "later", "status": "pending", "next_attempt_at": now + timedelta(hours=1)},
+            {**base, "id": "abandoned", "status": "sending", "next_attempt_at": now - timedelta(hours=1),
+             "locked_until": now - timedelta(seconds=1)},
+            {**base, "id": "leased", "status": "sending", "next_attempt_at": now - timedelta(hours=1),
+             "locked_until": now + timedelta(seconds=60)},
+            {**base, "id": "done", "status": "sent", "next_attempt_at": now - timedelta(hours=1)},
+        ])
+        sender = OutboxSender(db, host="127.0.0.1", port=free_port())
+        claimed = []
+        while (message := await sender._claim()) is not None:
+            claimed.append(message)
+        return claimed, now
+
+    claimed, now = asyncio.run(run())
+    # Oldest due first
+    assert [m["id"] for m in claimed] == ["abandoned", "due"]
+    for message in claimed:
+        assert message["status"] == "sending"
+        assert message["locked_until"] >= now + timedelta(seconds=email_outbox.LEASE_SECONDS)
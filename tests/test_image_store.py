@@ -0,0 +1,52 @@
+import io
+
+import pytest
+from PIL import Image
+
+import image_store
+
+
+@pytest.fixture(autouse=True)
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_store, "IMAGE_STORE_DIR", tmp_path)
+    return tmp_path
+
+
+def png_bytes(size=(40, 30)) -> bytes:
+    out = io.BytesIO()
+    Image.new("RGB", size, "red").save(out, "PNG")
+    return out.getvalue()
+
+
+def test_render_variants_writes_every_variant():
+    image_hash = image_store.save_bytes(png_bytes())
+    assert image_store.render_variants(image_hash) == (40, 30)
+    for variant in image_store.VARIANTS:
+        assert image_store.blob_path(image_hash, variant).exists()
+
+
+def test_undecodable_blob_is_reported_but_kept():
+    image_hash = image_store.save_bytes(b"not an image at all")
+    with pytest.raises(image_store.InvalidImage):
+        image_store.render_variants(image_hash)
+    assert image_store.blob_path(image_hash).exists()
+
+
+def test_write_errors_propagate_and_keep_the_source(monkeypatch):
+    image_hash = image_store.save_bytes(png_bytes())
+
+    def disk_full(*args, **kwargs):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(Image.Image, "save", disk_full)
+    with pytest.raises(OSError):
+        image_store.render_variants(image_hash)
+    assert image_store.blob_path(image_hash).exists()
+    assert not any(p.name.startswith(".variant-") for p in image_store.blob_path(image_hash).parent.iterdir())
+
+
+def test_discard_removes_blob_and_variants():
+    image_hash = image_store.save_bytes(png_bytes())
+    image_store.render_variants(image_hash)
+    image_store.discard(image_hash)
+    assert not any(image_store.blob_path(image_hash).parent.iterdir())